@@ -7,6 +7,11 @@ from .routes.description import router as description_router
 from .routes.familydata import router as familydata_router
 from .routes.feedback import router as feedback_router
 from .routes.recomendation import router as recomendation_router
+from .routes.metrics import router as metrics_router
+from .routes.search import router as search_router
+from .routes.export import router as export_router
+from .routes.usage import router as usage_router
+from .routes.events import router as events_router
 
 api_router = APIRouter(prefix="/api/v1")
 api_router.include_router(material_router)
@@ -17,5 +22,10 @@ api_router.include_router(description_router)
 api_router.include_router(familydata_router)
 api_router.include_router(feedback_router)
 api_router.include_router(recomendation_router)
+api_router.include_router(metrics_router)
+api_router.include_router(search_router)
+api_router.include_router(export_router)
+api_router.include_router(usage_router)
+api_router.include_router(events_router)
 
 
@@ -1,16 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from typing import Any, Dict, Optional
+from urllib.parse import quote
 from uuid import UUID
+from datetime import date
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 
+import base64
+import binascii
 import json
 
-from app.db.db import get_db, get_db_optional
-from app.schemas.aulas import Aula, AulaCreate, AulaUpdate
+from app.core.config import settings
+from app.core.etag import conditional_response, etag_matches, weak_etag
+from app.core.projection import select_clause, select_fields
+from app.core.responses import FastJSONResponse
+from app.db.db import get_db, get_db_optional, get_read_db_optional
+from app.api.v1.routes.feedback import parse_feedback_payload
+from app.schemas.aulas import (
+    Aula,
+    AulaCalendario,
+    AulaCalendarioDia,
+    AulaCreate,
+    AulaDashboard,
+    AulaResumo,
+    AulaResumoPage,
+    AulaUpdate,
+)
+from app.services.file_storage import FileTooLargeError, get_storage, parse_range
+from app.workers.change_events import notify_change
+from app.workers.prefetch import prefetch_scheduler
 
 router = APIRouter(prefix="/aulas", tags=["aulas"])
 
+# Chaves em que clientes antigos enviavam o conteúdo do arquivo embutido no JSON.
+_INLINE_FILE_KEYS = ("data", "b64", "base64", "conteudo", "content")
+
+# upload_arquivo sem eventuais bytes embutidos (linhas anteriores ao armazenamento em disco).
+_UPLOAD_ARQUIVO_EXPR = (
+    "(upload_arquivo::jsonb"
+    + "".join(f" #- '{{arquivo,{key}}}'" for key in _INLINE_FILE_KEYS)
+    + ")"
+)
+_UPLOAD_ARQUIVO_COLUMN = _UPLOAD_ARQUIVO_EXPR + " AS upload_arquivo"
+
+# Campos disponíveis para projeção em list_aulas (view/fields) e a expressão SQL de cada um.
+_AULA_LIST_FIELDS = {
+    "id": "id",
+    "assunto": "assunto",
+    "descricao": "descricao",
+    "data": "data",
+    "turma_id": "upload_arquivo::jsonb ->> 'turma_id' AS turma_id",
+    "turma_nome": "upload_arquivo::jsonb ->> 'turma_nome' AS turma_nome",
+    "arquivo_nome": "upload_arquivo::jsonb #>> '{arquivo,name}' AS arquivo_nome",
+    "upload_arquivo": _UPLOAD_ARQUIVO_COLUMN,
+}
+_AULA_SUMMARY_FIELDS = ("id", "assunto", "data", "turma_id", "turma_nome", "arquivo_nome")
+
+# Maior intervalo aceito pela visão de calendário.
+_CALENDAR_MAX_DAYS = 400
+
+# Seções de GET /aulas/{id}/dashboard (parâmetro include).
+_DASHBOARD_SECTIONS = ("materiais", "desempenho", "recomendacoes_ia", "feedback_material", "alunos")
+
+# Monta o dashboard da aula em um único round trip; cada seção só é calculada se pedida.
+_DASHBOARD_SQL = """
+SELECT json_build_object(
+    'aula', json_build_object(
+        'id', a.id,
+        'assunto', a.assunto,
+        'descricao', a.descricao,
+        'data', a.data,
+        'upload_arquivo', {upload_arquivo}
+    ),
+    'materiais', CASE WHEN :inc_materiais THEN COALESCE((
+        SELECT json_agg(
+            json_build_object(
+                'id', m.id,
+                'aula_id', m.aula_id,
+                'roteiro', '{{"topicos": [], "falas": [], "exemplos": []}}'::jsonb || m.roteiro,
+                'resumo', '{{"texto": "", "exemplo": ""}}'::jsonb || m.resumo,
+                'source', m.source,
+                'accepted', m.accepted,
+                'recomendacoes_ia', m.recomendacoes_ia,
+                'created_at', m.created_at,
+                'material_util', m.material_util,
+                'observacoes', m.observacoes
+            )
+            ORDER BY m.created_at DESC
+        )
+        FROM public.arrmd_material m
+        WHERE m.aula_id = a.id
+          AND m.input_hash IS NULL
+    ), '[]'::json) END,
+    'desempenho', CASE WHEN :inc_desempenho THEN (
+        SELECT json_build_object(
+            'material_id', lm.id,
+            'material_util', lm.material_util,
+            'observacoes', lm.observacoes,
+            'alunos', COALESCE((
+                SELECT json_agg(json_build_object('aluno_id', f.aluno_id, 'feedback', f.feedback) ORDER BY f.aluno_id)
+                FROM public.feedback_aluno_aula f
+                WHERE f.id_arrmd = a.id
+            ), '[]'::json)
+        )
+        FROM (
+            SELECT id, material_util, observacoes
+            FROM public.arrmd_material
+            WHERE aula_id = a.id
+              AND input_hash IS NULL
+            ORDER BY created_at DESC
+            LIMIT 1
+        ) lm
+    ) END,
+    'recomendacoes_ia', a.recomendacoes_ia,
+    'feedback_material', a.feedback_material,
+    'alunos', CASE WHEN :inc_alunos THEN COALESCE((
+        SELECT json_agg(json_build_object('id', s.id, 'nome', s.nome) ORDER BY s.nome)
+        FROM public.alunos s
+        WHERE s.turma_id = a.turma_id
+    ), '[]'::json) END
+) AS dashboard
+FROM public.arrmd a
+WHERE a.id = :id
+""".format(upload_arquivo=_UPLOAD_ARQUIVO_EXPR)
+
 
 def _normalize_upload(row: Dict[str, Any]) -> Dict[str, Any]:
     """Garantir que upload_arquivo seja um dicionário decodificado."""
@@ -22,9 +137,41 @@ def _normalize_upload(row: Dict[str, Any]) -> Dict[str, Any]:
             row["upload_arquivo"] = {}
     elif raw_value is None:
         row["upload_arquivo"] = {}
+    arquivo = row["upload_arquivo"].get("arquivo") if isinstance(row["upload_arquivo"], dict) else None
+    if isinstance(arquivo, dict):
+        for key in _INLINE_FILE_KEYS:
+            arquivo.pop(key, None)
+        if arquivo.get("sha256") and row.get("id"):
+            arquivo["url"] = f"/api/v1/aulas/{row['id']}/arquivo"
     return row
 
 
+def _offload_arquivo(arquivo: Any) -> Any:
+    """
+    Move o conteúdo embutido (base64) de `arquivo` para o armazenamento de arquivos,
+    mantendo no JSON apenas a referência (nome, tamanho, tipo e sha256).
+    """
+    if not isinstance(arquivo, dict):
+        return arquivo
+    inline_key = next((k for k in _INLINE_FILE_KEYS if isinstance(arquivo.get(k), str)), None)
+    if inline_key is None:
+        return arquivo
+    encoded = arquivo[inline_key]
+    if encoded.startswith("data:") and "," in encoded:
+        encoded = encoded.split(",", 1)[1]
+    try:
+        content = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError) as exc:
+        raise HTTPException(status_code=422, detail="Conteúdo do arquivo não está em base64 válido.") from exc
+    try:
+        digest, size = get_storage().save_bytes(content)
+    except FileTooLargeError as exc:
+        raise HTTPException(status_code=413, detail="Arquivo excede o tamanho máximo permitido.") from exc
+    ref = {k: v for k, v in arquivo.items() if k not in _INLINE_FILE_KEYS}
+    ref.update({"sha256": digest, "size": size})
+    return ref
+
+
 @router.post("", status_code=status.HTTP_201_CREATED)
 def create_aula(payload: Dict[str, Any], db: Optional[Session] = Depends(get_db_optional)) -> Dict[str, Any]:
     """
@@ -47,7 +194,7 @@ def create_aula(payload: Dict[str, Any], db: Optional[Session] = Depends(get_db_
 
     turma_id = payload.get("turma_id") or payload.get("turmaId")
     turma_nome = payload.get("turma_nome") or payload.get("turma")
-    arquivo_payload = payload.get("arquivo")
+    arquivo_payload = _offload_arquivo(payload.get("arquivo"))
     if arquivo_payload is not None:
         try:
             json.dumps(arquivo_payload)
@@ -68,8 +215,8 @@ def create_aula(payload: Dict[str, Any], db: Optional[Session] = Depends(get_db_
         """
         INSERT INTO public.arrmd (assunto, descricao, data, upload_arquivo)
         VALUES (:assunto, :descricao, CAST(:data AS DATE), :upload_arquivo)
-        RETURNING id, assunto, descricao, data, upload_arquivo
-        """
+        RETURNING id, assunto, descricao, data, {upload_arquivo}
+        """.format(upload_arquivo=_UPLOAD_ARQUIVO_COLUMN)
     )
     try:
         row = db.execute(
@@ -81,6 +228,8 @@ def create_aula(payload: Dict[str, Any], db: Optional[Session] = Depends(get_db_
                 "upload_arquivo": json.dumps(metadata),
             },
         ).mappings().first()
+        if row is not None:
+            notify_change(db, "aula", "create", id=row["id"], aula_id=row["id"])
         db.commit()
     except Exception as exc:
         db.rollback()
@@ -91,20 +240,36 @@ def create_aula(payload: Dict[str, Any], db: Optional[Session] = Depends(get_db_
 
     if row is None:
         raise HTTPException(status_code=500, detail="Falha ao retornar a aula criada")
+    if settings.prefetch_enabled:
+        prefetch_scheduler.enqueue(row["id"])
     return {"aula": _normalize_upload(dict(row))}
 
 
 @router.get("/{aula_id}", response_model=Aula)
-def get_aula(aula_id: UUID, db: Optional[Session] = Depends(get_db_optional)) -> Aula:
+def get_aula(
+    aula_id: UUID,
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_db_optional),
+) -> Aula:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    version = db.execute(
+        text("SELECT xmin::text FROM public.arrmd WHERE id = :id"),
+        {"id": str(aula_id)},
+    ).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Aula não encontrada.")
+    etag = weak_etag("aula", aula_id, version)
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
     row = db.execute(
         text(
             """
-            SELECT id, assunto, descricao, data, upload_arquivo
+            SELECT id, assunto, descricao, data, {upload_arquivo}
             FROM public.arrmd
             WHERE id = :id
-            """
+            """.format(upload_arquivo=_UPLOAD_ARQUIVO_COLUMN)
         ),
         {"id": str(aula_id)},
     ).mappings().first()
@@ -113,28 +278,153 @@ def get_aula(aula_id: UUID, db: Optional[Session] = Depends(get_db_optional)) ->
     return Aula(**_normalize_upload(dict(row)))
 
 
+@router.get("/{aula_id}/dashboard", response_model=AulaDashboard)
+def get_aula_dashboard(
+    aula_id: UUID,
+    include: Optional[str] = Query(
+        None, description="Seções separadas por vírgula: " + ", ".join(_DASHBOARD_SECTIONS) + " (padrão: todas)"
+    ),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> AulaDashboard:
+    """
+    Aula, materiais, desempenho dos alunos, recomendações, feedback do material e
+    alunos da turma em uma única consulta (substitui as chamadas separadas da página).
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    sections = set(_DASHBOARD_SECTIONS)
+    if include:
+        sections = {part.strip() for part in include.split(",") if part.strip()}
+        if unknown := sections - set(_DASHBOARD_SECTIONS):
+            raise HTTPException(status_code=400, detail=f"Seções desconhecidas: {', '.join(sorted(unknown))}")
+    data = db.execute(
+        text(_DASHBOARD_SQL),
+        {
+            "id": str(aula_id),
+            "inc_materiais": "materiais" in sections,
+            "inc_desempenho": "desempenho" in sections,
+            "inc_alunos": "alunos" in sections,
+        },
+    ).scalar()
+    if data is None:
+        raise HTTPException(status_code=404, detail="Aula não encontrada.")
+
+    dashboard: Dict[str, Any] = {"aula": _normalize_upload(data["aula"])}
+    for section in sections:
+        dashboard[section] = data.get(section)
+    if dashboard.get("desempenho"):
+        desempenho = dashboard["desempenho"]
+        desempenho["arrmd_id"] = aula_id
+        desempenho["alunos"] = [
+            {"aluno_id": f["aluno_id"], "desempenho": parse_feedback_payload(f.get("feedback"))}
+            for f in desempenho["alunos"]
+        ]
+    return FastJSONResponse(AulaDashboard(**dashboard), exclude_unset=True)
+
+
+def _calendar(db: Session, inicio: date, fim: date, turma_id: Optional[UUID]) -> AulaCalendario:
+    """Aulas do intervalo agrupadas por dia, com marcação de material/feedback, em uma consulta."""
+    rows = db.execute(
+        text(
+            """
+            SELECT a.data,
+                   json_agg(
+                       json_build_object(
+                           'id', a.id,
+                           'assunto', a.assunto,
+                           'turma_id', a.turma_id,
+                           'turma_nome', COALESCE(t.nome, a.upload_arquivo::jsonb ->> 'turma_nome'),
+                           'has_material', EXISTS (
+                               SELECT 1 FROM public.arrmd_material m
+                               WHERE m.aula_id = a.id AND m.accepted = true AND m.input_hash IS NULL
+                           ),
+                           'has_feedback', EXISTS (
+                               SELECT 1 FROM public.feedback_aluno_aula f WHERE f.id_arrmd = a.id
+                           )
+                       )
+                       ORDER BY a.assunto
+                   ) AS aulas
+            FROM public.arrmd a
+            LEFT JOIN public.turmas t ON t.id = a.turma_id
+            WHERE a.data BETWEEN :inicio AND :fim
+              AND (CAST(:turma_id AS UUID) IS NULL OR a.turma_id = CAST(:turma_id AS UUID))
+            GROUP BY a.data
+            ORDER BY a.data
+            """
+        ),
+        {"inicio": inicio, "fim": fim, "turma_id": str(turma_id) if turma_id else None},
+    ).mappings().all()
+    return AulaCalendario(
+        inicio=inicio,
+        fim=fim,
+        turma_id=turma_id,
+        dias=[AulaCalendarioDia(data=r["data"], aulas=r["aulas"]) for r in rows],
+    )
+
+
 @router.get("")
 def list_aulas(
     limit: int = 50,
     offset: int = 0,
-    db: Optional[Session] = Depends(get_db_optional),
+    view: str = "full",
+    fields: Optional[str] = None,
+    from_: Optional[date] = Query(None, alias="from", description="Início do intervalo (visão de calendário)"),
+    to: Optional[date] = Query(None, description="Fim do intervalo, inclusivo (visão de calendário)"),
+    turma_id: Optional[UUID] = None,
+    db: Optional[Session] = Depends(get_read_db_optional),
 ) -> Dict[str, Any]:
+    """
+    Lista aulas. `view=summary` ou `fields=a,b` selecionam só as colunas necessárias
+    (sem upload_arquivo, salvo se pedido), com itens enxutos.
+    Com `from`/`to` (e opcionalmente `turma_id`), retorna a visão de calendário:
+    aulas agrupadas por dia, indicando se já têm material e feedback.
+    """
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
-    
+
+    if from_ or to:
+        if not (from_ and to):
+            raise HTTPException(status_code=400, detail="Informe 'from' e 'to' para a visão de calendário.")
+        if to < from_ or (to - from_).days > _CALENDAR_MAX_DAYS:
+            raise HTTPException(
+                status_code=400, detail=f"Intervalo inválido (máximo de {_CALENDAR_MAX_DAYS} dias)."
+            )
+        return FastJSONResponse(_calendar(db, from_, to, turma_id))
+    if turma_id is not None:
+        raise HTTPException(status_code=400, detail="'turma_id' requer 'from' e 'to'.")
+
     if limit <= 0 or limit > 200:
         limit = 50
     if offset < 0:
         offset = 0
 
+    if view != "full" or fields:
+        selected = select_fields(view, fields, _AULA_LIST_FIELDS, _AULA_SUMMARY_FIELDS)
+        rows = db.execute(
+            text(
+                """
+                SELECT {columns}
+                FROM public.arrmd
+                ORDER BY assunto
+                LIMIT :limit OFFSET :offset
+                """.format(columns=select_clause(selected, _AULA_LIST_FIELDS))
+            ),
+            {"limit": limit, "offset": offset},
+        ).mappings().all()
+        items = [
+            AulaResumo(**(_normalize_upload(dict(r)) if "upload_arquivo" in selected else r))
+            for r in rows
+        ]
+        return FastJSONResponse(AulaResumoPage(items=items, limit=limit, offset=offset), exclude_unset=True)
+
     rows = db.execute(
         text(
             """
-            SELECT id, assunto, descricao, data, upload_arquivo
+            SELECT id, assunto, descricao, data, {upload_arquivo}
             FROM public.arrmd
             ORDER BY assunto
             LIMIT :limit OFFSET :offset
-            """
+            """.format(upload_arquivo=_UPLOAD_ARQUIVO_COLUMN)
         ),
         {"limit": limit, "offset": offset},
     ).mappings().all()
@@ -153,8 +443,8 @@ def update_aula(aula_id: UUID, payload: AulaUpdate, db: Session = Depends(get_db
             data = COALESCE(CAST(:data AS DATE), data),
             upload_arquivo = COALESCE(:upload_arquivo, upload_arquivo)
         WHERE id = :id
-        RETURNING id, assunto, descricao, data, upload_arquivo
-        """
+        RETURNING id, assunto, descricao, data, {upload_arquivo}
+        """.format(upload_arquivo=_UPLOAD_ARQUIVO_COLUMN)
     )
     try:
         row = db.execute(
@@ -167,6 +457,8 @@ def update_aula(aula_id: UUID, payload: AulaUpdate, db: Session = Depends(get_db
                 "upload_arquivo": payload.upload_arquivo,
             },
         ).mappings().first()
+        if row is not None:
+            notify_change(db, "aula", "update", id=row["id"], aula_id=row["id"])
         db.commit()
     except Exception as exc:
         db.rollback()
@@ -177,19 +469,141 @@ def update_aula(aula_id: UUID, payload: AulaUpdate, db: Session = Depends(get_db
     return Aula(**_normalize_upload(dict(row)))
 
 
+def _aula_exists(db: Session, aula_id: UUID) -> bool:
+    found = db.execute(text("SELECT 1 FROM public.arrmd WHERE id = :id"), {"id": str(aula_id)}).scalar()
+    # Libera a conexão: o upload pode demorar e não deve segurar uma transação aberta.
+    db.rollback()
+    return found is not None
+
+
+def _attach_arquivo(db: Session, aula_id: UUID, ref: Dict[str, Any]) -> Optional[Any]:
+    row = db.execute(
+        text(
+            """
+            UPDATE public.arrmd
+            SET upload_arquivo = jsonb_set(
+                COALESCE(upload_arquivo::jsonb, '{}'::jsonb), '{arquivo}', CAST(:ref AS jsonb), true
+            )
+            WHERE id = :id
+            RETURNING id
+            """
+        ),
+        {"id": str(aula_id), "ref": json.dumps(ref)},
+    ).mappings().first()
+    if row is not None:
+        notify_change(db, "aula", "update", id=row["id"], aula_id=row["id"])
+    db.commit()
+    return row
+
+
+@router.post("/{aula_id}/arquivo", status_code=status.HTTP_201_CREATED)
+async def upload_aula_arquivo(
+    aula_id: UUID,
+    arquivo: UploadFile = File(...),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> Dict[str, Any]:
+    """
+    Recebe o arquivo da aula (multipart) em blocos, grava no armazenamento
+    deduplicado por hash e guarda apenas a referência em upload_arquivo.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    # Confere a aula antes de gravar: um 404 não deve deixar arquivo órfão no armazenamento.
+    if not await run_in_threadpool(_aula_exists, db, aula_id):
+        await arquivo.close()
+        raise HTTPException(status_code=404, detail="Aula não encontrada.")
+    storage = get_storage()
+
+    async def _chunks():
+        while chunk := await arquivo.read(storage.chunk_size):
+            yield chunk
+
+    try:
+        digest, size = await storage.save_stream(_chunks())
+    except FileTooLargeError as exc:
+        raise HTTPException(status_code=413, detail="Arquivo excede o tamanho máximo permitido.") from exc
+    finally:
+        await arquivo.close()
+
+    ref = {
+        "name": arquivo.filename,
+        "size": size,
+        "type": arquivo.content_type,
+        "sha256": digest,
+    }
+    row = await run_in_threadpool(_attach_arquivo, db, aula_id, ref)
+    if not row:
+        raise HTTPException(status_code=404, detail="Aula não encontrada.")
+    return {"arquivo": {**ref, "url": f"/api/v1/aulas/{aula_id}/arquivo"}}
+
+
+@router.get("/{aula_id}/arquivo")
+def download_aula_arquivo(
+    aula_id: UUID,
+    request: Request,
+    db: Optional[Session] = Depends(get_db_optional),
+):
+    """
+    Download do arquivo da aula com suporte a `Range` (respostas 206).
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    ref = db.execute(
+        text("SELECT upload_arquivo::jsonb -> 'arquivo' FROM public.arrmd WHERE id = :id"),
+        {"id": str(aula_id)},
+    ).scalar()
+    if isinstance(ref, str):
+        ref = json.loads(ref)
+    storage = get_storage()
+    digest = (ref or {}).get("sha256") if isinstance(ref, dict) else None
+    if not digest or not storage.exists(digest):
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado para esta aula.")
+
+    size = storage.size(digest)
+    etag = f'"{digest}"'
+    filename = ref.get("name") or digest
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(filename)}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    media_type = ref.get("type") or "application/octet-stream"
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(storage.iter_range(digest), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        storage.iter_range(digest, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
 @router.delete("/{aula_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_aula(aula_id: UUID, db: Session = Depends(get_db)) -> None:
-    result = db.execute(
+    deleted = db.execute(
         text(
             """
             DELETE FROM public.arrmd
             WHERE id = :id
+            RETURNING id, turma_id
             """
         ),
         {"id": str(aula_id)},
-    )
+    ).first()
+    if deleted is not None:
+        notify_change(db, "aula", "delete", id=deleted[0], turma_id=deleted[1], aula_id=deleted[0])
     db.commit()
-    if result.rowcount == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Aula não encontrada")
     return None
 
@@ -4,6 +4,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.db.db import get_db
 from app.schemas.description import DescriptionCreate, DescriptionSaved
+from app.workers.change_events import notify_change
 
 router = APIRouter(prefix="/description", tags=["description"])
 
@@ -24,6 +25,8 @@ def save_description(payload: DescriptionCreate, db: Session = Depends(get_db))
         ),
         {"aluno_id": str(payload.aluno_id), "descricao": payload.descricao},
     ).mappings().first()
+    if row:
+        notify_change(db, "aluno", "update", id=row["id"], aluno_id=row["id"])
     db.commit()
     if not row:
         raise HTTPException(status_code=404, detail="Aluno não encontrado.")
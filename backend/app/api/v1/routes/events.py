@@ -0,0 +1,55 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.db.db import get_engine
+from app.workers.change_events import change_hub
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+def _format_event(event: Dict[str, Any]) -> str:
+    return f"event: {event.get('tipo', 'change')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def _event_stream(request: Request, queue: "asyncio.Queue[Dict[str, Any]]") -> AsyncIterator[str]:
+    yield "retry: 3000\n\n"
+    while not await request.is_disconnected():
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=settings.events_heartbeat_seconds)
+        except asyncio.TimeoutError:
+            yield ": ping\n\n"
+            continue
+        yield _format_event(event)
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    turma_id: Optional[List[UUID]] = Query(None, description="Recebe apenas eventos destas turmas"),
+) -> StreamingResponse:
+    """
+    Server-Sent Events com as mudanças gravadas (alunos, turmas, aulas, feedback,
+    materiais e recomendações), filtradas por turma. Cada evento traz tipo, acao, id,
+    turma_id, aluno_id e aula_id; 'reset' indica que eventos podem ter sido perdidos
+    e o cliente deve recarregar os dados.
+    """
+    if get_engine() is None or not settings.events_enabled:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    turmas = {str(t) for t in turma_id} if turma_id else None
+
+    async def _subscribed() -> AsyncIterator[str]:
+        with change_hub.subscribe(turmas) as queue:
+            async for chunk in _event_stream(request, queue):
+                yield chunk
+
+    return StreamingResponse(
+        _subscribed(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,141 @@
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api.v1.routes.feedback import parse_feedback_payload
+from app.db.db import get_db_optional
+from app.services.export import EXPORT_FORMATS, stream_export
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+_FEEDBACK_COLUMNS = (
+    "aula_id",
+    "data",
+    "assunto",
+    "aluno_id",
+    "aluno_nome",
+    "desempenho",
+    "feedback",
+    "material_util",
+    "observacoes",
+)
+
+_FEEDBACK_SQL = """
+SELECT a.id AS aula_id,
+       a.data,
+       a.assunto,
+       s.id AS aluno_id,
+       s.nome AS aluno_nome,
+       f.feedback,
+       lm.material_util,
+       lm.observacoes
+FROM public.alunos s
+JOIN public.feedback_aluno_aula f ON f.aluno_id = s.id
+JOIN public.arrmd a ON a.id = f.id_arrmd
+LEFT JOIN LATERAL (
+    SELECT m.material_util, m.observacoes
+    FROM public.arrmd_material m
+    WHERE m.aula_id = a.id
+      AND m.input_hash IS NULL
+    ORDER BY m.created_at DESC
+    LIMIT 1
+) lm ON true
+WHERE s.turma_id = :turma_id
+ORDER BY a.data NULLS LAST, a.id, s.nome
+"""
+
+_MATERIAL_COLUMNS = (
+    "aula_id",
+    "data",
+    "assunto",
+    "material_id",
+    "source",
+    "accepted",
+    "created_at",
+    "material_util",
+    "observacoes",
+    "recomendacoes_ia",
+    "roteiro",
+    "resumo",
+)
+
+_MATERIAL_SQL = """
+SELECT a.id AS aula_id,
+       a.data,
+       a.assunto,
+       m.id AS material_id,
+       m.source,
+       m.accepted,
+       m.created_at,
+       m.material_util,
+       m.observacoes,
+       m.recomendacoes_ia,
+       m.roteiro,
+       m.resumo
+FROM public.arrmd a
+JOIN public.arrmd_material m ON m.aula_id = a.id
+WHERE a.turma_id = :turma_id
+  AND m.input_hash IS NULL
+ORDER BY a.data NULLS LAST, a.id, m.created_at
+"""
+
+
+def _with_desempenho(row: Dict[str, Any]) -> Dict[str, Any]:
+    row["desempenho"] = "; ".join(parse_feedback_payload(row.get("feedback")))
+    return row
+
+
+def _export_response(
+    db: Optional[Session], turma_id: UUID, name: str, sql: str, columns, fmt: str, gzip: bool, transform=None
+) -> StreamingResponse:
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato deve ser 'csv' ou 'ndjson'.")
+    exists = db.execute(text("SELECT 1 FROM public.turmas WHERE id = :id"), {"id": str(turma_id)}).scalar()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Turma não encontrada.")
+
+    media_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"turma-{turma_id}-{name}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+    params: Dict[str, Any] = {"turma_id": str(turma_id)}
+    return StreamingResponse(
+        stream_export(sql, params, columns, fmt, gzip=gzip, transform=transform),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/turmas/{turma_id}/feedback")
+def export_turma_feedback(
+    turma_id: UUID,
+    format: str = Query("csv", description="csv ou ndjson"),
+    gzip: bool = Query(False, description="Entrega o arquivo compactado (.gz)"),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> StreamingResponse:
+    """
+    Exporta todos os feedbacks dos alunos da turma (com o desempenho já interpretado
+    e a avaliação do material), em fluxo contínuo.
+    """
+    return _export_response(
+        db, turma_id, "feedback", _FEEDBACK_SQL, _FEEDBACK_COLUMNS, format, gzip, transform=_with_desempenho
+    )
+
+
+@router.get("/turmas/{turma_id}/materials")
+def export_turma_materials(
+    turma_id: UUID,
+    format: str = Query("csv", description="csv ou ndjson"),
+    gzip: bool = Query(False, description="Entrega o arquivo compactado (.gz)"),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> StreamingResponse:
+    """
+    Exporta os materiais das aulas da turma (roteiro e resumo como JSON), em fluxo contínuo.
+    """
+    return _export_response(db, turma_id, "materials", _MATERIAL_SQL, _MATERIAL_COLUMNS, format, gzip)
@@ -1,18 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from app.db.db import get_db_optional
+from app.core.etag import conditional_response, weak_etag
+from app.db.db import get_read_db_optional
 from app.schemas.familydata import FamilyData
 
 router = APIRouter(prefix="/familydata", tags=["familydata"])
 
 
 @router.get("/{aluno_id}", response_model=FamilyData)
-def get_family_data(aluno_id: str, db: Optional[Session] = Depends(get_db_optional)) -> FamilyData:
+def get_family_data(
+    aluno_id: str,
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_read_db_optional),
+) -> FamilyData:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    version = db.execute(
+        text("SELECT xmin::text FROM public.alunos WHERE id = :aluno_id"),
+        {"aluno_id": aluno_id},
+    ).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Aluno não encontrado.")
+    etag = weak_etag("familydata", aluno_id, version)
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
     row = db.execute(
         text(
             """
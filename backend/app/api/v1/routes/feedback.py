@@ -4,11 +4,13 @@ from json import JSONDecodeError
 from typing import Any, Dict, List, Optional, Set
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.db.db import get_db, get_db_optional
+from app.core.etag import conditional_response, weak_etag
+from app.core.responses import FastJSONResponse
+from app.db.db import get_db, get_db_optional, get_read_db_optional
 from app.schemas.feedback import (
     MaterialFeedbackUpdate,
     MaterialFeedback,
@@ -18,7 +20,9 @@ from app.schemas.feedback import (
     MaterialPerformanceCreate,
     MaterialPerformance,
     StudentFeedbackParsed,
+    StudentFeedbackPage,
 )
+from app.workers.change_events import notify_change
 
 router = APIRouter(prefix="/feedback", tags=["feedback"])
 
@@ -38,6 +42,8 @@ def set_material_feedback(payload: MaterialFeedbackUpdate, db: Session = Depends
         update_stmt,
         {"id": str(payload.arrmd_id), "feedback_material": payload.feedback_material},
     ).mappings().first()
+    if row:
+        notify_change(db, "feedback_material", "update", id=row["id"], aula_id=row["id"])
     db.commit()
     if not row:
         raise HTTPException(status_code=404, detail="Aula (ARRMD) não encontrada.")
@@ -81,20 +87,24 @@ def create_student_feedback(payload: StudentFeedbackCreate, db: Session = Depend
             "feedback": payload.feedback,
         },
     ).mappings().first()
+    if row:
+        notify_change(
+            db, "feedback_aluno", "create", id=row["id"], aluno_id=payload.aluno_id, aula_id=payload.id_arrmd
+        )
     db.commit()
     if not row:
         raise HTTPException(status_code=400, detail="Falha ao criar feedback do aluno.")
     return StudentFeedback(**row)
 
 
-@router.get("/student")
+@router.get("/student", response_model=StudentFeedbackPage)
 def list_student_feedback(
     id_arrmd: Optional[UUID] = None,
     aluno_id: Optional[UUID] = None,
     limit: int = 100,
     offset: int = 0,
-    db: Optional[Session] = Depends(get_db_optional),
-) -> Dict[str, Any]:
+    db: Optional[Session] = Depends(get_read_db_optional),
+) -> FastJSONResponse:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
     if limit <= 0 or limit > 500:
@@ -120,18 +130,22 @@ def list_student_feedback(
 
     rows = db.execute(text(base_query), params).mappings().all()
     material_map = _fetch_latest_materials(db, {r["id_arrmd"] for r in rows})
-    items = [_deserialize_feedback_row(dict(r), material_map).model_dump() for r in rows]
-    return {"items": items, "limit": limit, "offset": offset}
+    page = StudentFeedbackPage(
+        items=[_deserialize_feedback_row(dict(r), material_map) for r in rows],
+        limit=limit,
+        offset=offset,
+    )
+    return FastJSONResponse(page)
 
 
-@router.get("/student/{aluno_id}")
+@router.get("/student/{aluno_id}", response_model=StudentFeedbackPage)
 def list_student_feedback_by_aluno(
     aluno_id: UUID,
     id_arrmd: Optional[UUID] = None,
     limit: int = 100,
     offset: int = 0,
-    db: Optional[Session] = Depends(get_db_optional),
-) -> Dict[str, Any]:
+    db: Optional[Session] = Depends(get_read_db_optional),
+) -> FastJSONResponse:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
     if limit <= 0 or limit > 500:
@@ -152,8 +166,12 @@ def list_student_feedback_by_aluno(
 
     rows = db.execute(text(base_query), params).mappings().all()
     material_map = _fetch_latest_materials(db, {r["id_arrmd"] for r in rows})
-    items = [_deserialize_feedback_row(dict(r), material_map).model_dump() for r in rows]
-    return {"items": items, "limit": limit, "offset": offset}
+    page = StudentFeedbackPage(
+        items=[_deserialize_feedback_row(dict(r), material_map) for r in rows],
+        limit=limit,
+        offset=offset,
+    )
+    return FastJSONResponse(page)
 
 
 def _get_latest_material_row(db: Session, arrmd_id: UUID) -> Optional[Dict[str, Any]]:
@@ -163,6 +181,7 @@ def _get_latest_material_row(db: Session, arrmd_id: UUID) -> Optional[Dict[str,
             SELECT id, material_util, observacoes
             FROM public.arrmd_material
             WHERE aula_id = :arrmd_id
+              AND input_hash IS NULL
             ORDER BY created_at DESC
             LIMIT 1
             """
@@ -172,7 +191,8 @@ def _get_latest_material_row(db: Session, arrmd_id: UUID) -> Optional[Dict[str,
     return dict(row) if row else None
 
 
-def _parse_feedback_payload(feedback_value: Optional[str]) -> List[str]:
+def parse_feedback_payload(feedback_value: Optional[str]) -> List[str]:
+    """Lista de desempenho a partir do texto gravado em feedback_aluno_aula.feedback."""
     if feedback_value is None:
         return []
     try:
@@ -216,7 +236,7 @@ def _load_material_performance(db: Session, arrmd_id: UUID) -> Optional[Material
         alunos_entries.append(
             StudentPerformanceEntry(
                 aluno_id=row["aluno_id"],
-                desempenho=_parse_feedback_payload(row.get("feedback")),
+                desempenho=parse_feedback_payload(row.get("feedback")),
             )
         )
 
@@ -232,7 +252,7 @@ def _load_material_performance(db: Session, arrmd_id: UUID) -> Optional[Material
 def _deserialize_feedback_row(
     row: Dict[str, Any], material_map: Dict[UUID, Dict[str, Any]]
 ) -> StudentFeedbackParsed:
-    desempenho = _parse_feedback_payload(row.get("feedback"))
+    desempenho = parse_feedback_payload(row.get("feedback"))
     material_info = material_map.get(row["id_arrmd"])
     return StudentFeedbackParsed(
         id=row["id"],
@@ -255,6 +275,7 @@ def _fetch_latest_materials(db: Session, arrmd_ids: Set[UUID]) -> Dict[UUID, Dic
             SELECT DISTINCT ON (aula_id) aula_id, id, material_util, observacoes
             FROM public.arrmd_material
             WHERE aula_id = ANY(:ids)
+              AND input_hash IS NULL
             ORDER BY aula_id, created_at DESC
             """
         ),
@@ -264,9 +285,40 @@ def _fetch_latest_materials(db: Session, arrmd_ids: Set[UUID]) -> Dict[UUID, Dic
 
 
 @router.get("/performance/{arrmd_id}", response_model=MaterialPerformance)
-def get_material_performance(arrmd_id: UUID, db: Optional[Session] = Depends(get_db_optional)) -> MaterialPerformance:
+def get_material_performance(
+    arrmd_id: UUID,
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_db_optional),
+) -> MaterialPerformance:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    version = db.execute(
+        text(
+            """
+            SELECT m.id,
+                   m.xmin::text AS material_version,
+                   (
+                       SELECT count(*)::text || ':' || COALESCE(max(f.xmin::text::bigint), 0)::text
+                       FROM public.feedback_aluno_aula f
+                       WHERE f.id_arrmd = :arrmd_id
+                   ) AS feedback_version
+            FROM public.arrmd_material m
+            WHERE m.aula_id = :arrmd_id
+              AND m.input_hash IS NULL
+            ORDER BY m.created_at DESC
+            LIMIT 1
+            """
+        ),
+        {"arrmd_id": str(arrmd_id)},
+    ).mappings().first()
+    if not version:
+        raise HTTPException(status_code=404, detail="Desempenho não encontrado para esta aula.")
+    etag = weak_etag(
+        "performance", arrmd_id, version["id"], version["material_version"], version["feedback_version"]
+    )
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
     performance = _load_material_performance(db, arrmd_id)
     if performance is None:
         raise HTTPException(status_code=404, detail="Desempenho não encontrado para esta aula.")
@@ -322,6 +374,7 @@ def upsert_material_performance(payload: MaterialPerformanceCreate, db: Session
                     "feedback": feedback_payload,
                 },
             )
+        notify_change(db, "desempenho", "update", id=payload.arrmd_id, aula_id=payload.arrmd_id)
         db.commit()
     except Exception as exc:
         db.rollback()
@@ -359,6 +412,7 @@ def delete_material_performance(arrmd_id: UUID, db: Session = Depends(get_db)) -
         ),
         {"arrmd_id": str(arrmd_id)},
     )
+    notify_change(db, "desempenho", "delete", id=arrmd_id, aula_id=arrmd_id)
     if result.rowcount == 0:
         # Nenhum registro de desempenho, mas ainda assim consideramos operação válida caso existisse apenas dados agregados
         db.commit()
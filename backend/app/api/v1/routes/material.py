@@ -1,63 +1,196 @@
 import json
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Union
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.schemas.lesson import (
     GenerateMaterialRequest,
     GenerateMaterialResponse,
+    GenerateVariantsRequest,
+    GenerateVariantsResponse,
+    MaterialUpgrade,
     Roteiro,
     Resumo,
 )
-from app.schemas.material import MaterialCreate, Material
+from app.schemas.material import MaterialCreate, Material, MaterialResumo, MaterialResumoList, SimilarMaterial
 from app.services.lesson_generation import (
     local_generate,
-    openai_generate,
-    fetch_student_profile,
-    fetch_turma_context,
-    fetch_turma_context_by_name_or_year,
+    coalesced_openai_generate,
+    fetch_student_profiles,
+    openai_generate_variants,
+    find_prefetched_draft,
+    find_reusable_material,
+    generation_fingerprint,
+    resolve_generation_context,
+    tiered_generate,
 )
+from app.services.generation_upgrades import generation_upgrades
+from app.services.similarity import similarity_index
+from app.services.text_extraction import resolve_arquivo_digest
 from app.llm.prompts import build_llm_payload
-from app.db.db import get_db_optional, get_db
+from app.core.config import settings
+from app.core.etag import conditional_response, etag_headers, weak_etag
+from app.core.projection import select_clause, select_fields
+from app.core.responses import FastJSONResponse
+from app.db.db import get_db_optional, get_db, get_read_db_optional
+from app.workers.usage_ledger import usage_context, usage_ledger
+from app.workers.change_events import notify_change
 
 router = APIRouter(prefix="/material", tags=["material"])
 
+# Campos disponíveis para projeção em list_material_by_aula; subcampos JSON são extraídos no SQL.
+_MATERIAL_LIST_FIELDS = {
+    "id": "id",
+    "aula_id": "aula_id",
+    "source": "source",
+    "accepted": "accepted",
+    "created_at": "created_at",
+    "titulo": "roteiro #>> '{topicos,0}' AS titulo",
+    "resumo_texto": "resumo ->> 'texto' AS resumo_texto",
+    "material_util": "material_util",
+    "observacoes": "observacoes",
+    "recomendacoes_ia": "recomendacoes_ia",
+    "roteiro": "roteiro",
+    "resumo": "resumo",
+}
+_MATERIAL_SUMMARY_FIELDS = ("id", "aula_id", "source", "accepted", "created_at", "titulo", "material_util")
+
+
+def _ensure_budget(db: Optional[Session], turma_id: Optional[str]) -> None:
+    # Checado antes de chamar a LLM; sem chave da OpenAI só há geração local, que não consome tokens.
+    if settings.openai_api_key and usage_ledger.budget_exceeded(db, turma_id):
+        raise HTTPException(status_code=429, detail="Orçamento diário de tokens da turma esgotado.")
+
 
 @router.post("/generate", response_model=GenerateMaterialResponse)
 async def generate_material(
     req: GenerateMaterialRequest,
+    tiered: bool = Query(False, description="Responde com o rascunho local se a LLM não terminar dentro da janela"),
+    race_window: Optional[float] = Query(None, ge=0, le=30, description="Janela em segundos (padrão: configuração)"),
+    reuse_threshold: Optional[float] = Query(
+        None, ge=0, le=1, description="Reutiliza um material aceito e bem avaliado com similaridade >= limiar"
+    ),
     db: Optional[Session] = Depends(get_db_optional),
 ):
-    turma_ctx = fetch_turma_context(db, req.turma_id) or fetch_turma_context_by_name_or_year(db, req.turma)
-    student = fetch_student_profile(db, req.aluno_id)
-    if student is None and turma_ctx and (alunos := turma_ctx.get("alunos")):
-        for a in alunos:
-            if (a.get("interesse") or a.get("preferencia")):
-                student = {
-                    "id": a.get("id"),
-                    "nome": a.get("nome"),
-                    "interesse": a.get("interesse"),
-                    "preferencia": a.get("preferencia"),
-                    "nivel_de_suporte": a.get("nivel_de_suporte"),
-                    "descricao_do_aluno": a.get("descricao_do_aluno"),
-                    "turma_id": req.turma_id,
-                    "turma_nome": turma_ctx.get("turma_nome"),
-                }
-                break
-    result = await openai_generate(req, student, turma_ctx)
+    turma_ctx, student = resolve_generation_context(db, req)
+    arquivo_digest = await resolve_arquivo_digest(db, req)
+    turma_id = (turma_ctx or {}).get("turma_id") or req.turma_id
+    with usage_context(turma_id, (student or {}).get("id")):
+        if req.aula_id:
+            input_hash = generation_fingerprint(req, student, turma_ctx, arquivo_digest, stable=True)
+            if (draft := find_prefetched_draft(db, req.aula_id, input_hash)) is not None:
+                usage_ledger.record("lesson", cache_hit=True)
+                return {**draft, "source": "prefetch"}
+        if reuse_threshold is not None:
+            if (reused := find_reusable_material(db, req, student, reuse_threshold)) is not None:
+                usage_ledger.record("lesson", cache_hit=True)
+                return {**reused, "source": "reuse"}
+        _ensure_budget(db, turma_id)
+        pending_upgrade = None
+        if tiered:
+            result, pending_upgrade = await tiered_generate(req, student, turma_ctx, arquivo_digest, race_window)
+        else:
+            result = await coalesced_openai_generate(req, student, turma_ctx, arquivo_digest)
     if result is not None:
-        return {**result, "source": "openai"}
+        return {"source": "openai", **result}
 
     fallback = local_generate(req, student)
     if fallback:
-        return {**fallback, "source": "local"}
+        return {**fallback, "source": "local", "pending_upgrade": pending_upgrade}
 
     raise HTTPException(status_code=503, detail="Serviço de geração indisponível")
 
 
+@router.post("/generate/variants", response_model=GenerateVariantsResponse)
+async def generate_material_variants(
+    req: GenerateVariantsRequest,
+    db: Optional[Session] = Depends(get_db_optional),
+):
+    """
+    Um material por aluno de `aluno_ids` com uma só chamada à LLM: roteiro e resumo
+    compartilhados, exemplos (roteiro.exemplos e resumo.exemplo) personalizados.
+    Sem LLM, cada aluno recebe a geração local.
+    """
+    if not req.aluno_ids:
+        raise HTTPException(status_code=422, detail="Informe ao menos um aluno em 'aluno_ids'.")
+    if len(req.aluno_ids) > settings.variants_max_students:
+        raise HTTPException(
+            status_code=422, detail=f"Máximo de {settings.variants_max_students} alunos por chamada."
+        )
+    turma_ctx, _ = resolve_generation_context(db, req)
+    students = fetch_student_profiles(db, req.aluno_ids)
+    if not students:
+        raise HTTPException(status_code=404, detail="Nenhum aluno encontrado.")
+    arquivo_digest = await resolve_arquivo_digest(db, req)
+    turma_id = (turma_ctx or {}).get("turma_id") or req.turma_id or students[0].get("turma_id")
+    _ensure_budget(db, turma_id)
+    with usage_context(turma_id):
+        generated = await openai_generate_variants(req, students, turma_ctx, arquivo_digest)
+
+    variants = []
+    for student in students:
+        aluno_id = str(student["id"])
+        if generated is not None and aluno_id in generated:
+            variants.append({"source": "openai", **generated[aluno_id], "aluno_id": aluno_id})
+        else:
+            variants.append({**local_generate(req, student), "source": "local", "aluno_id": aluno_id})
+    return {"variants": variants}
+
+
+@router.get("/generate/upgrades/{token}", response_model=MaterialUpgrade)
+async def get_material_upgrade(
+    token: str,
+    response: Response,
+    wait: float = Query(0, ge=0, description="Segundos para aguardar a conclusão (long-poll)"),
+) -> MaterialUpgrade:
+    """
+    Consulta a versão da LLM de uma geração escalonada (token `pending_upgrade`).
+    Responde 202 enquanto a geração está em andamento.
+    """
+    state = await generation_upgrades.get(token, min(wait, settings.tiered_max_wait_seconds))
+    if state is None:
+        raise HTTPException(status_code=404, detail="Token de geração não encontrado ou expirado.")
+    upgrade_status, material = state
+    if upgrade_status == "pending":
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Retry-After"] = "2"
+    return MaterialUpgrade(status=upgrade_status, material=material)
+
+
+@router.get("/similar", response_model=List[SimilarMaterial])
+def list_similar_materials(
+    assunto: str,
+    descricao: Optional[str] = None,
+    hyperfocus: Optional[str] = None,
+    limit: int = Query(5, ge=1, le=50),
+    min_score: float = Query(0.1, ge=0, le=1),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> List[SimilarMaterial]:
+    """
+    Materiais aceitos mais parecidos com o assunto/descrição/hiperfoco informados,
+    ordenados por similaridade ponderada pela avaliação (material_util).
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    matches = similarity_index.find_similar(db, assunto, descricao, hyperfocus, limit=limit, min_score=min_score)
+    return [
+        SimilarMaterial(
+            material_id=m["id"],
+            aula_id=m["aula_id"],
+            assunto=m.get("assunto"),
+            hyperfocus=m.get("hyperfocus"),
+            material_util=m.get("material_util"),
+            score=m["score"],
+            roteiro=Roteiro(**(m.get("roteiro") or {"topicos": [], "falas": [], "exemplos": []})),
+            resumo=Resumo(**(m.get("resumo") or {"texto": "", "exemplo": ""})),
+        )
+        for m in matches
+    ]
+
+
 @router.post("/inputs/preview")
 async def preview_llm_inputs(
     req: GenerateMaterialRequest,
@@ -66,23 +199,9 @@ async def preview_llm_inputs(
     """
     Retorna o JSON que será enviado à LLM, já enriquecido com dados do aluno (quando fornecido).
     """
-    turma_ctx = fetch_turma_context(db, req.turma_id) or fetch_turma_context_by_name_or_year(db, req.turma)
-    student = fetch_student_profile(db, req.aluno_id)
-    if student is None and turma_ctx and (alunos := turma_ctx.get("alunos")):
-        for a in alunos:
-            if (a.get("interesse") or a.get("preferencia")):
-                student = {
-                    "id": a.get("id"),
-                    "nome": a.get("nome"),
-                    "interesse": a.get("interesse"),
-                    "preferencia": a.get("preferencia"),
-                    "nivel_de_suporte": a.get("nivel_de_suporte"),
-                    "descricao_do_aluno": a.get("descricao_do_aluno"),
-                    "turma_id": req.turma_id,
-                    "turma_nome": turma_ctx.get("turma_nome"),
-                }
-                break
-    payload = build_llm_payload(req, student, turma_ctx)
+    turma_ctx, student = resolve_generation_context(db, req)
+    arquivo_digest = await resolve_arquivo_digest(db, req)
+    payload = build_llm_payload(req, student, turma_ctx, arquivo_digest)
     return {"payload": payload}
 
 
@@ -112,17 +231,17 @@ def _material_from_row(row: Dict[str, Any]) -> Material:
 
 @router.post("/accept", response_model=Material, status_code=status.HTTP_201_CREATED)
 def accept_material(payload: MaterialCreate, db: Session = Depends(get_db)) -> Material:
-    exists = db.execute(
+    aula = db.execute(
         text(
             """
-            SELECT 1
+            SELECT assunto, descricao
             FROM public.arrmd
             WHERE id = :id
             """
         ),
         {"id": str(payload.aula_id)},
-    ).scalar()
-    if not exists:
+    ).mappings().first()
+    if not aula:
         raise HTTPException(status_code=404, detail="Aula não encontrada.")
 
     insert_stmt = text(
@@ -147,6 +266,12 @@ def accept_material(payload: MaterialCreate, db: Session = Depends(get_db)) -> M
             "observacoes": payload.observacoes,
         },
     ).mappings().first()
+    if row and payload.accepted:
+        similarity_index.add(
+            db, str(row["id"]), str(payload.aula_id), aula["assunto"], aula["descricao"], payload.hyperfocus
+        )
+    if row:
+        notify_change(db, "material", "create", id=row["id"], aula_id=payload.aula_id)
     db.commit()
     if not row:
         raise HTTPException(status_code=400, detail="Falha ao salvar material.")
@@ -158,16 +283,82 @@ def accept_material(payload: MaterialCreate, db: Session = Depends(get_db)) -> M
         row_dict["material_util"] = payload.material_util
     if "observacoes" not in row_dict:
         row_dict["observacoes"] = payload.observacoes
-    return _material_from_row(row_dict)
+    material = _material_from_row(row_dict)
+    material.hyperfocus = payload.hyperfocus
+    return material
+
+
+def _material_resumo_from_row(row: Dict[str, Any]) -> MaterialResumo:
+    data = dict(row)
+    if "roteiro" in data:
+        roteiro_data = data["roteiro"] or {}
+        data["roteiro"] = Roteiro(
+            topicos=roteiro_data.get("topicos", []),
+            falas=roteiro_data.get("falas", []),
+            exemplos=roteiro_data.get("exemplos", []),
+        )
+    if "resumo" in data:
+        resumo_data = data["resumo"] or {}
+        data["resumo"] = Resumo(texto=resumo_data.get("texto", ""), exemplo=resumo_data.get("exemplo", ""))
+    return MaterialResumo(**data)
 
 
-@router.get("/aula/{aula_id}", response_model=List[Material])
+@router.get("/aula/{aula_id}", response_model=Union[List[Material], List[MaterialResumo]])
 def list_material_by_aula(
     aula_id: UUID,
-    db: Optional[Session] = Depends(get_db_optional),
+    request: Request,
+    response: Response,
+    view: str = "full",
+    fields: Optional[str] = None,
+    db: Optional[Session] = Depends(get_read_db_optional),
 ) -> List[Material]:
+    """
+    Lista as versões de material da aula. `view=summary` ou `fields=a,b` trazem
+    apenas colunas/subcampos necessários, sem o roteiro/resumo completos.
+    """
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    projected = view != "full" or bool(fields)
+    selected = (
+        select_fields(view, fields, _MATERIAL_LIST_FIELDS, _MATERIAL_SUMMARY_FIELDS)
+        if projected
+        else list(_MATERIAL_LIST_FIELDS)
+    )
+
+    version = db.execute(
+        text(
+            """
+            SELECT count(*) AS total,
+                   COALESCE(max(xmin::text::bigint), 0) AS version
+            FROM public.arrmd_material
+            WHERE aula_id = :aula_id
+              AND input_hash IS NULL
+            """
+        ),
+        {"aula_id": str(aula_id)},
+    ).mappings().first()
+    etag = weak_etag("materials", aula_id, ",".join(selected), version["total"], version["version"])
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
+
+    if projected:
+        rows = db.execute(
+            text(
+                """
+                SELECT {columns}
+                FROM public.arrmd_material
+                WHERE aula_id = :aula_id
+                  AND input_hash IS NULL
+                ORDER BY created_at DESC
+                """.format(columns=select_clause(selected, _MATERIAL_LIST_FIELDS))
+            ),
+            {"aula_id": str(aula_id)},
+        ).mappings().all()
+        return FastJSONResponse(
+            MaterialResumoList([_material_resumo_from_row(r) for r in rows]),
+            headers=etag_headers(etag),
+            exclude_unset=True,
+        )
 
     rows = db.execute(
         text(
@@ -175,6 +366,7 @@ def list_material_by_aula(
             SELECT id, aula_id, roteiro, resumo, source, accepted, recomendacoes_ia, created_at, material_util, observacoes
             FROM public.arrmd_material
             WHERE aula_id = :aula_id
+              AND input_hash IS NULL
             ORDER BY created_at DESC
             """
         ),
@@ -205,11 +397,13 @@ def delete_material(material_id: UUID, db: Session = Depends(get_db)) -> None:
             """
             DELETE FROM public.arrmd_material
             WHERE id = :id
+            RETURNING aula_id
             """
         ),
         {"id": str(material_id)},
-    )
-    db.commit()
-    if result.rowcount == 0:
+    ).first()
+    if result is None:
         raise HTTPException(status_code=404, detail="Material não encontrado.")
+    notify_change(db, "material", "delete", id=material_id, aula_id=result[0])
+    db.commit()
     return None
\ No newline at end of file
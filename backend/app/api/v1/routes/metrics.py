@@ -0,0 +1,15 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter
+
+from app.core.metrics import metrics
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+def get_metrics() -> Dict[str, Any]:
+    """
+    Métricas em memória deste processo (contadores e gauges).
+    """
+    return metrics.snapshot()
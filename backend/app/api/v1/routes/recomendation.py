@@ -1,14 +1,28 @@
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.db.db import get_db, get_db_optional
+from app.db.db import get_db, get_read_db_optional
 from app.core.config import settings
-from app.schemas.recomendation import RecomendationCreate, RecomendationResult
+from app.schemas.recomendation import (
+    RecomendationBatchCreate,
+    RecomendationBatchResult,
+    RecomendationBatchStatus,
+    RecomendationCreate,
+    RecomendationResult,
+)
 from app.prompts.recomendation import build_recommendation_prompt
+from app.core.metrics import metrics
+from app.core.tracing import SPAN_KIND_CLIENT, span
+from app.llm.routing import llm_router, usage_attributes
+from app.services.recommendation_cache import cache_key, get_many, put_many
+from app.workers.usage_ledger import usage_context, usage_ledger
+from app.workers.change_events import notify_change
+import asyncio
 import httpx
 import json
+import time
 
 router = APIRouter(prefix="/recomendation", tags=["recomendation"])
 
@@ -27,58 +41,102 @@ async def _generate_ai_recommendations(observacoes: str) -> Optional[str]:
             "4) Oferecer alternativa de comunicação (gestos/cartões) se necessário.\n"
             "5) Se notar sinais de sobrecarga, reduzir estímulos e orientar respiração curta."
         )
-    try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.openai_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": settings.openai_model,
-                    "temperature": settings.openai_temperature,
-                    "response_format": {"type": "text"},
-                    "messages": [
-                        {"role": "system", "content": "Você é um especialista em inclusão escolar."},
-                        {"role": "user", "content": prompt},
-                    ],
-                },
+    system = "Você é um especialista em inclusão escolar."
+    decision = llm_router.decide("recommendation", system, prompt)
+    body: Dict[str, Any] = {
+        "model": decision.model,
+        "temperature": settings.openai_temperature,
+        "response_format": {"type": "text"},
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ],
+    }
+    if decision.max_tokens:
+        body["max_tokens"] = decision.max_tokens
+    started = time.perf_counter()
+    with span("llm.chat_completions", SPAN_KIND_CLIENT, **decision.trace_attributes()) as llm_span:
+        try:
+            async with httpx.AsyncClient(timeout=decision.timeout) as client:
+                r = await client.post(
+                    "https://api.openai.com/v1/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {settings.openai_api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    json=body,
+                )
+            r.raise_for_status()
+            data = r.json()
+            content = (
+                data.get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "")
             )
-        r.raise_for_status()
-        data = r.json()
-        content = (
-            data.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "")
-        )
-        return content.strip() or None
-    except Exception:
-        return None
+        except Exception as exc:
+            if llm_span is not None:
+                llm_span.error = type(exc).__name__
+            llm_router.record(decision, time.perf_counter() - started, ok=False)
+            usage_ledger.record(decision.endpoint, decision.model, latency=time.perf_counter() - started, ok=False)
+            return None
+        if llm_span is not None:
+            llm_span.set(**usage_attributes(data.get("usage")))
+    latency = time.perf_counter() - started
+    llm_router.record(decision, latency, ok=True)
+    usage_ledger.record(decision.endpoint, decision.model, data.get("usage"), latency)
+    return content.strip() or None
+
+
+def _cache_enabled() -> bool:
+    # O texto de fallback (sem chave da OpenAI) não é guardado no cache.
+    return settings.recomendation_cache_enabled and bool(settings.openai_api_key)
 
 
 @router.post("/", response_model=RecomendationResult)
-async def create_recomendation(payload: RecomendationCreate, db: Session = Depends(get_db)) -> RecomendationResult:
+async def create_recomendation(
+    payload: RecomendationCreate,
+    force: bool = Query(False, description="Ignora o cache e gera novamente"),
+    db: Session = Depends(get_db),
+) -> RecomendationResult:
     """
     1) Salva observações dos pais em public.alunos.observacoes
-    2) Gera recomendações estruturadas via LLM (ou fallback)
-    3) Salva resultado em public.arrmd.recomendacoes_ia
+    2) Gera recomendações estruturadas via LLM (ou fallback), reutilizando o cache
+       quando as observações normalizadas já foram vistas
+    3) Salva resultado em public.arrmd.recomendacoes_ia e por aluno em
+       public.recomendacoes_aluno_aula
     """
     # 1) salvar observações no aluno
-    db.execute(
+    turma_id = db.execute(
         text(
             """
             UPDATE public.alunos
             SET observacoes = :observacoes
             WHERE id = :aluno_id
+            RETURNING turma_id
             """
         ),
         {"aluno_id": str(payload.aluno_id), "observacoes": payload.observacoes},
-    )
+    ).scalar()
     db.commit()
 
-    # 2) gerar recomendações via LLM/fallback
-    recomendacoes = await _generate_ai_recommendations(payload.observacoes)
+    # 2) gerar recomendações via cache/LLM/fallback
+    key = cache_key(payload.observacoes)
+    recomendacoes = None
+    if _cache_enabled():
+        if force:
+            metrics.incr("recomendation_cache.bypass")
+        else:
+            recomendacoes = get_many(db, [key]).get(key)
+    cached = recomendacoes is not None
+    with usage_context(turma_id, payload.aluno_id):
+        if cached:
+            usage_ledger.record("recommendation", cache_hit=True)
+        else:
+            if settings.openai_api_key and usage_ledger.budget_exceeded(db, turma_id):
+                raise HTTPException(status_code=429, detail="Orçamento diário de tokens da turma esgotado.")
+            recomendacoes = await _generate_ai_recommendations(payload.observacoes)
+            if recomendacoes is not None and _cache_enabled():
+                put_many(db, {key: recomendacoes})
     if recomendacoes is None:
         recomendacoes = "Sem recomendações estruturadas no momento."
 
@@ -94,6 +152,12 @@ async def create_recomendation(payload: RecomendationCreate, db: Session = Depen
         ),
         {"arrmd_id": str(payload.arrmd_id), "recomendacoes": recomendacoes},
     ).mappings().first()
+    if row:
+        _save_per_student(db, [(str(payload.aluno_id), str(payload.arrmd_id), recomendacoes)])
+        notify_change(
+            db, "recomendacao", "update", id=row["id"], turma_id=turma_id, aluno_id=payload.aluno_id,
+            aula_id=row["id"],
+        )
     db.commit()
     if not row:
         raise HTTPException(status_code=404, detail="Aula (ARRMD) não encontrada.")
@@ -103,6 +167,225 @@ async def create_recomendation(payload: RecomendationCreate, db: Session = Depen
         arrmd_id=payload.arrmd_id,
         observacoes=payload.observacoes,
         recomendacoes_ia=recomendacoes,
+        cached=cached,
+    )
+
+
+def _values_clause(prefix: str, rows: List[Tuple[Any, ...]]) -> Tuple[str, Dict[str, Any]]:
+    """Monta `(VALUES (:p0_0, :p0_1), ...)` com os parâmetros correspondentes."""
+    params: Dict[str, Any] = {}
+    tuples = []
+    for i, row in enumerate(rows):
+        names = []
+        for j, value in enumerate(row):
+            params[f"{prefix}{i}_{j}"] = value
+            names.append(f":{prefix}{i}_{j}")
+        tuples.append("(" + ", ".join(names) + ")")
+    return "(VALUES " + ", ".join(tuples) + ")", params
+
+
+def _dedupe_pairs(pairs: List[Tuple[str, str, Optional[str]]]) -> List[Tuple[str, str, Optional[str]]]:
+    """Um item por (aluno, aula), na posição da primeira ocorrência; as observações da última prevalecem."""
+    unique: Dict[Tuple[str, str], Optional[str]] = {}
+    for aluno_id, arrmd_id, obs in pairs:
+        unique[(aluno_id, arrmd_id)] = obs
+    return [(aluno_id, arrmd_id, obs) for (aluno_id, arrmd_id), obs in unique.items()]
+
+
+def _save_per_student(db: Session, rows: List[Tuple[str, str, str]]) -> None:
+    """Grava (aluno_id, arrmd_id, recomendações) em public.recomendacoes_aluno_aula; pares inexistentes são ignorados."""
+    if not rows:
+        return
+    values, params = _values_clause("s", rows)
+    db.execute(
+        text(
+            f"""
+            INSERT INTO public.recomendacoes_aluno_aula (arrmd_id, aluno_id, recomendacoes_ia, updated_at)
+            SELECT a.id, al.id, v.recomendacoes, now()
+            FROM {values} AS v(aluno_id, arrmd_id, recomendacoes)
+            JOIN public.arrmd a ON a.id = CAST(v.arrmd_id AS UUID)
+            JOIN public.alunos al ON al.id = CAST(v.aluno_id AS UUID)
+            ON CONFLICT (arrmd_id, aluno_id) DO UPDATE
+            SET recomendacoes_ia = EXCLUDED.recomendacoes_ia, updated_at = EXCLUDED.updated_at
+            """
+        ),
+        params,
+    )
+
+
+@router.post("/batch", response_model=RecomendationBatchResult)
+async def create_recomendation_batch(
+    payload: RecomendationBatchCreate,
+    force: bool = Query(False, description="Ignora o cache e gera novamente"),
+    db: Session = Depends(get_db),
+) -> RecomendationBatchResult:
+    """
+    Gera recomendações para vários alunos: todos os da turma (`turma_id` + `arrmd_id`,
+    usando as observações salvas) ou uma lista de pares aluno/aula. Observações
+    idênticas (ou já em cache) geram no máximo uma chamada à LLM; as chamadas rodam
+    com concorrência limitada e o resultado de cada aluno é gravado em
+    public.recomendacoes_aluno_aula.
+    """
+    started = time.perf_counter()
+    turmas: Dict[str, str] = {}
+    unknown: Dict[Tuple[str, str], str] = {}
+    if payload.items:
+        pairs = _dedupe_pairs([(str(i.aluno_id), str(i.arrmd_id), i.observacoes) for i in payload.items])
+        alunos = {
+            str(r[0]): r[1]
+            for r in db.execute(
+                text("SELECT id, turma_id FROM public.alunos WHERE id = ANY(CAST(:ids AS UUID[]))"),
+                {"ids": list({p[0] for p in pairs})},
+            ).all()
+        }
+        turmas = {aluno_id: str(turma_id) for aluno_id, turma_id in alunos.items() if turma_id is not None}
+        aulas = {
+            str(r[0])
+            for r in db.execute(
+                text("SELECT id FROM public.arrmd WHERE id = ANY(CAST(:ids AS UUID[]))"),
+                {"ids": list({p[1] for p in pairs})},
+            ).all()
+        }
+        # Pares inexistentes não chegam à LLM (nem ao orçamento): não haveria onde gravar.
+        for aluno_id, arrmd_id, _ in pairs:
+            if aluno_id not in alunos:
+                unknown[(aluno_id, arrmd_id)] = "Aluno não encontrado."
+            elif arrmd_id not in aulas:
+                unknown[(aluno_id, arrmd_id)] = "Aula (ARRMD) não encontrada."
+    elif payload.turma_id and payload.arrmd_id:
+        rows = db.execute(
+            text("SELECT id FROM public.alunos WHERE turma_id = :turma_id ORDER BY nome"),
+            {"turma_id": str(payload.turma_id)},
+        ).all()
+        pairs = [(str(r[0]), str(payload.arrmd_id), None) for r in rows]
+        turmas = {aluno_id: str(payload.turma_id) for aluno_id, _, _ in pairs}
+    else:
+        raise HTTPException(status_code=422, detail="Informe 'items' ou 'turma_id' e 'arrmd_id'.")
+    if len(pairs) > settings.recomendation_batch_max_items:
+        raise HTTPException(
+            status_code=422, detail=f"Máximo de {settings.recomendation_batch_max_items} alunos por lote."
+        )
+
+    missing = [aluno_id for aluno_id, _, obs in pairs if obs is None]
+    stored: Dict[str, Optional[str]] = {}
+    if missing:
+        stored = {
+            str(r[0]): r[1]
+            for r in db.execute(
+                text("SELECT id, observacoes FROM public.alunos WHERE id = ANY(CAST(:ids AS UUID[]))"),
+                {"ids": missing},
+            ).all()
+        }
+
+    statuses: List[RecomendationBatchStatus] = []
+    by_key: Dict[str, List[RecomendationBatchStatus]] = {}
+    texts: Dict[str, str] = {}
+    for aluno_id, arrmd_id, obs in pairs:
+        texto = obs if obs is not None else stored.get(aluno_id)
+        status = RecomendationBatchStatus(aluno_id=aluno_id, arrmd_id=arrmd_id, status="skipped")
+        statuses.append(status)
+        if (aluno_id, arrmd_id) in unknown:
+            status.status, status.erro = "error", unknown[(aluno_id, arrmd_id)]
+            continue
+        if not texto or not texto.strip():
+            status.erro = "Aluno sem observações."
+            continue
+        key = cache_key(texto)
+        texts.setdefault(key, texto.strip())
+        by_key.setdefault(key, []).append(status)
+
+    cached: Dict[str, str] = {}
+    if _cache_enabled():
+        if force:
+            metrics.incr("recomendation_cache.bypass")
+        else:
+            cached = get_many(db, by_key)
+    for key, result in cached.items():
+        for status in by_key.pop(key):
+            status.status, status.cached, status.recomendacoes_ia = "ok", True, result
+            with usage_context(turmas.get(str(status.aluno_id)), status.aluno_id):
+                usage_ledger.record("recommendation", cache_hit=True)
+
+    if settings.openai_api_key:
+        exhausted = {t for t in set(turmas.values()) if usage_ledger.budget_exceeded(db, t)}
+        for key in list(by_key):
+            group = []
+            for status in by_key[key]:
+                if turmas.get(str(status.aluno_id)) in exhausted:
+                    status.status, status.erro = "error", "Orçamento diário de tokens da turma esgotado."
+                else:
+                    group.append(status)
+            if group:
+                by_key[key] = group
+            else:
+                del by_key[key]
+
+    semaphore = asyncio.Semaphore(max(1, settings.recomendation_batch_concurrency))
+
+    async def _run(texto: str, group: List[RecomendationBatchStatus]) -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            with usage_context(turmas.get(str(group[0].aluno_id)), group[0].aluno_id):
+                result = await _generate_ai_recommendations(texto)
+            elapsed = round((time.perf_counter() - t0) * 1000, 1)
+        for position, status in enumerate(group):
+            status.elapsed_ms = elapsed
+            status.deduplicated = position > 0
+            if result is None:
+                status.status, status.erro = "error", "Falha ao gerar recomendações."
+            else:
+                status.status, status.recomendacoes_ia = "ok", result
+
+    await asyncio.gather(*(_run(texts[key], group) for key, group in by_key.items()))
+    if _cache_enabled():
+        put_many(db, {key: g[0].recomendacoes_ia for key, g in by_key.items() if g[0].status == "ok"})
+
+    # Observações enviadas no lote são salvas no aluno, como na rota individual.
+    provided = {aluno_id: obs for aluno_id, _, obs in pairs if obs is not None}
+    if provided:
+        values, params = _values_clause("o", list(provided.items()))
+        db.execute(
+            text(
+                f"""
+                UPDATE public.alunos a
+                SET observacoes = v.observacoes
+                FROM {values} AS v(aluno_id, observacoes)
+                WHERE a.id = CAST(v.aluno_id AS UUID)
+                """
+            ),
+            params,
+        )
+    # Cada aluno tem a sua recomendação gravada; public.arrmd guarda uma por aula
+    # (prevalece a do último aluno da aula no lote).
+    _save_per_student(
+        db, [(str(st.aluno_id), str(st.arrmd_id), st.recomendacoes_ia) for st in statuses if st.status == "ok"]
+    )
+    latest = {s.arrmd_id: s.recomendacoes_ia for s in statuses if s.status == "ok"}
+    if latest:
+        values, params = _values_clause("r", [(str(k), v) for k, v in latest.items()])
+        db.execute(
+            text(
+                f"""
+                UPDATE public.arrmd a
+                SET recomendacoes_ia = v.recomendacoes
+                FROM {values} AS v(arrmd_id, recomendacoes)
+                WHERE a.id = CAST(v.arrmd_id AS UUID)
+                """
+            ),
+            params,
+        )
+        for turma_id in {turmas[str(s.aluno_id)] for s in statuses if s.status == "ok" and str(s.aluno_id) in turmas}:
+            notify_change(db, "recomendacao", "batch", turma_id=turma_id)
+    db.commit()
+
+    return RecomendationBatchResult(
+        total=len(statuses),
+        generated=sum(1 for g in by_key.values() if g[0].status == "ok"),
+        cached=sum(1 for s in statuses if s.cached),
+        deduplicated=sum(1 for s in statuses if s.deduplicated),
+        errors=sum(1 for s in statuses if s.status == "error"),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        items=statuses,
     )
 
 
@@ -110,10 +393,11 @@ async def create_recomendation(payload: RecomendationCreate, db: Session = Depen
 def get_recomendations(
     aluno_id: Optional[str] = None,
     arrmd_id: Optional[str] = None,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[Session] = Depends(get_read_db_optional),
 ) -> Dict[str, Any]:
     """
-    Busca observações dos pais (por aluno_id) e/ou recomendações da IA (por arrmd_id).
+    Busca observações dos pais (por aluno_id) e/ou recomendações da IA (por arrmd_id);
+    com ambos, inclui também a recomendação gravada para aquele aluno na aula.
     """
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
@@ -152,6 +436,20 @@ def get_recomendations(
                 "turma_nome": ia_row.get("turma_nome"),
             }
 
+    if aluno_id and arrmd_id:
+        por_aluno = db.execute(
+            text(
+                """
+                SELECT recomendacoes_ia, updated_at
+                FROM public.recomendacoes_aluno_aula
+                WHERE aluno_id = :aluno_id AND arrmd_id = :arrmd_id
+                """
+            ),
+            {"aluno_id": aluno_id, "arrmd_id": arrmd_id},
+        ).mappings().first()
+        if por_aluno:
+            result["recomendacoes_aluno"] = dict(por_aluno)
+
     if not result:
         raise HTTPException(status_code=404, detail="Nenhum conteúdo encontrado para os parâmetros informados.")
     return result
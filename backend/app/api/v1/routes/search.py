@@ -0,0 +1,133 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db.db import get_db_optional
+from app.schemas.search import SearchHit, SearchPage
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=12, MaxFragments=2, FragmentDelimiter= … "
+
+# Ranking só sobre as colunas tsvector indexadas (GIN); ts_headline roda apenas na página retornada.
+_SEARCH_SQL = """
+WITH q AS (
+    SELECT websearch_to_tsquery('public.pt_unaccent', :q) AS query
+),
+hits AS (
+    SELECT 'aula' AS tipo, a.id, a.id AS aula_id, ts_rank_cd(a.search_tsv, q.query) AS rank
+    FROM public.arrmd a, q
+    WHERE :include_aulas AND a.search_tsv @@ q.query
+    UNION ALL
+    SELECT 'material' AS tipo, m.id, m.aula_id, ts_rank_cd(m.search_tsv, q.query) AS rank
+    FROM public.arrmd_material m, q
+    WHERE :include_materials AND m.search_tsv @@ q.query AND m.input_hash IS NULL
+),
+page AS (
+    SELECT *
+    FROM hits
+    WHERE CAST(:after_rank AS REAL) IS NULL
+       OR (rank, tipo, id) < (CAST(:after_rank AS REAL), CAST(:after_tipo AS TEXT), CAST(:after_id AS UUID))
+    ORDER BY rank DESC, tipo DESC, id DESC
+    LIMIT :limit
+)
+SELECT p.tipo,
+       p.id,
+       p.aula_id,
+       p.rank,
+       a.assunto,
+       a.data,
+       ts_headline(
+           'public.pt_unaccent',
+           CASE
+               WHEN p.tipo = 'aula' THEN concat_ws(' — ', a.assunto, a.descricao, a.recomendacoes_ia)
+               ELSE array_to_string(
+                   ARRAY(
+                       SELECT jsonb_array_elements_text(
+                           jsonb_path_query_array(m.roteiro || m.resumo, 'strict $.** ? (@.type() == "string")')
+                       )
+                   ),
+                   ' '
+               )
+           END,
+           q.query,
+           :headline_options
+       ) AS snippet
+FROM page p
+CROSS JOIN q
+JOIN public.arrmd a ON a.id = p.aula_id
+LEFT JOIN public.arrmd_material m ON p.tipo = 'material' AND m.id = p.id
+ORDER BY p.rank DESC, p.tipo DESC, p.id DESC
+"""
+
+
+def _encode_cursor(rank: float, tipo: str, item_id: Any) -> str:
+    raw = json.dumps([rank, tipo, str(item_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, tipo, item_id = json.loads(raw)
+        return float(rank), str(tipo), str(UUID(str(item_id)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+
+@router.get("", response_model=SearchPage)
+def search(
+    q: str = Query(..., min_length=2, description="Termos de busca (aceita aspas, OR e -exclusão)"),
+    tipo: Optional[List[str]] = Query(None, description="Restringe a 'aula' e/ou 'material'"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Optional[Session] = Depends(get_db_optional),
+) -> SearchPage:
+    """
+    Busca textual (português, sem acentos) em assunto/descrição/recomendações das aulas
+    e no roteiro/resumo dos materiais, ordenada por relevância, com trechos destacados
+    (<mark>) e paginação por cursor.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    tipos = set(tipo or ("aula", "material"))
+    if not tipos <= {"aula", "material"}:
+        raise HTTPException(status_code=400, detail="tipo deve ser 'aula' e/ou 'material'.")
+    after_rank, after_tipo, after_id = _decode_cursor(cursor) if cursor else (None, None, None)
+
+    rows = db.execute(
+        text(_SEARCH_SQL),
+        {
+            "q": q,
+            "include_aulas": "aula" in tipos,
+            "include_materials": "material" in tipos,
+            "after_rank": after_rank,
+            "after_tipo": after_tipo,
+            "after_id": after_id,
+            "limit": limit + 1,
+            "headline_options": _HEADLINE_OPTIONS,
+        },
+    ).mappings().all()
+
+    items = [
+        SearchHit(
+            tipo=r["tipo"],
+            id=r["id"],
+            aula_id=r["aula_id"],
+            assunto=r["assunto"],
+            data=r["data"].isoformat() if r["data"] else None,
+            rank=r["rank"],
+            snippet=r["snippet"] or "",
+        )
+        for r in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last["rank"], last["tipo"], last["id"])
+    return SearchPage(items=items, next_cursor=next_cursor)
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
 from typing import Optional, Any, Dict, List
 from uuid import UUID
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.schemas.students import Estudante, EstudanteCreate, EstudanteUpdate
+from app.schemas.students import Estudante, EstudanteCreate, EstudanteUpdate, StudentImportReport
+from app.services.student_import import import_students
 
 
-from app.db.db import get_db, get_db_optional
+from app.core.etag import conditional_response, weak_etag
+from app.db.db import get_db, get_db_optional, get_read_db_optional
+from app.repositories import students as students_repo
+from app.workers.change_events import notify_change
 
 router = APIRouter(prefix="/students", tags=["students"])
 
@@ -29,6 +33,8 @@ def create_estudante(payload: EstudanteCreate, db: Session = Depends(get_db)):
                 "turma_id": str(payload.turma_id),
             },
         ).mappings().first()
+        if row:
+            notify_change(db, "aluno", "create", id=row["id"], turma_id=row["turma_id"])
         db.commit()
     except Exception as exc:
         db.rollback()
@@ -39,34 +45,51 @@ def create_estudante(payload: EstudanteCreate, db: Session = Depends(get_db)):
     return Estudante(**row)
 
 
+@router.post("/import", response_model=StudentImportReport)
+def import_estudantes(
+    arquivo: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv ou ndjson (padrão: pela extensão do arquivo)"),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> StudentImportReport:
+    """
+    Importa alunos de um CSV (com cabeçalho) ou NDJSON. Colunas: nome, serie_escolar,
+    turma_id ou turma (nome), interesse, preferencia, dificuldade, nivel_de_suporte,
+    descricao_do_aluno e, opcionalmente, id. Alunos já existentes (mesmo id, ou mesmo
+    nome na turma) são atualizados. Linhas inválidas não impedem as demais e aparecem
+    no relatório.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    fmt = format or ("ndjson" if (arquivo.filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato deve ser 'csv' ou 'ndjson'.")
+    try:
+        report = import_students(db, arquivo.file, fmt)
+    except Exception as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Não foi possível importar os alunos") from exc
+    return StudentImportReport(**report)
+
+
 @router.get("/{aluno_id}")
-async def get_student_profile(aluno_id: str, db: Optional[Session] = Depends(get_db_optional)) -> Dict[str, Any]:
+async def get_student_profile(
+    aluno_id: str,
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_read_db_optional),
+) -> Dict[str, Any]:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
-    row = db.execute(
-        text(
-            """
-            SELECT a.id,
-                   a.nome,
-                   a.interesse,
-                   a.preferencia,
-                   a.dificuldade,
-                   a.laudo,
-                   a.observacoes,
-                   a.nivel_de_suporte,
-                   a.descricao_do_aluno,
-                   a.turma_id,
-                   t.nome AS turma_nome
-            FROM public.alunos a
-            LEFT JOIN public.turmas t ON t.id = a.turma_id
-            WHERE a.id = :aluno_id
-            """
-        ),
-        {"aluno_id": aluno_id},
-    ).mappings().first()
-    if not row:
+    version = students_repo.get_student_version(db, aluno_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Aluno não encontrado.")
+    etag = weak_etag("student", aluno_id, version["aluno_version"], version["turma_version"])
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
+    profile = students_repo.get_student_profile(db, aluno_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="Aluno não encontrado.")
-    return {"student_profile": dict(row)}
+    return {"student_profile": profile}
 
 
 @router.get("")
@@ -74,7 +97,7 @@ async def list_students(
     turma_id: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[Session] = Depends(get_read_db_optional),
 ) -> Dict[str, Any]:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
@@ -136,6 +159,8 @@ def update_estudante(estudante_id: UUID, payload: EstudanteUpdate, db: Session =
                 "turma_id": str(payload.turma_id) if payload.turma_id is not None else None,
             },
         ).mappings().first()
+        if row:
+            notify_change(db, "aluno", "update", id=row["id"], turma_id=row["turma_id"])
         db.commit()
     except Exception as exc:
         db.rollback()
@@ -152,13 +177,15 @@ def delete_estudante(estudante_id: UUID, db: Session = Depends(get_db)):
             """
             DELETE FROM public.alunos
             WHERE id = :id
+            RETURNING turma_id
             """
         ),
         {"id": str(estudante_id)},
-    )
-    db.commit()
-    if result.rowcount == 0:
+    ).first()
+    if result is None:
         raise HTTPException(status_code=404, detail="Estudante não encontrado")
+    notify_change(db, "aluno", "delete", id=estudante_id, turma_id=result[0])
+    db.commit()
     return None
 
 
@@ -1,27 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import Optional, Any, Dict, List
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from app.db.db import get_db_optional
+from app.core.etag import conditional_response, weak_etag
+from app.db.db import get_db_optional, get_read_db_optional
+from app.repositories import turmas as turmas_repo
+from app.workers.change_events import notify_change
 
 router = APIRouter(prefix="/turmas", tags=["turmas"])
 
 
 @router.get("")
-async def list_turmas(db: Optional[Session] = Depends(get_db_optional)) -> Dict[str, Any]:
+async def list_turmas(
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_read_db_optional),
+) -> Dict[str, Any]:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
-    rows = db.execute(
-        text(
-            """
-            SELECT t.id, t.nome
-            FROM public.turmas t
-            ORDER BY t.nome
-            """
-        )
-    ).mappings().all()
-    return {"items": [dict(r) for r in rows]}
+    version = turmas_repo.turmas_version(db)
+    etag = weak_etag("turmas", version["total"], version["version"])
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
+    return {"items": [dict(t) for t in turmas_repo.list_turmas(db)]}
 
 
 @router.post("")
@@ -45,14 +47,43 @@ async def create_turma(payload: Dict[str, Any], db: Optional[Session] = Depends(
         ),
         {"nome": nome},
     ).mappings().first()
+    notify_change(db, "turma", "create", id=turma["id"], turma_id=turma["id"])
     db.commit()
     return {"turma": dict(turma)}
 
 
 @router.get("/{turma_id}")
-async def get_turma(turma_id: str, db: Optional[Session] = Depends(get_db_optional)) -> Dict[str, Any]:
+async def get_turma(
+    turma_id: str,
+    request: Request,
+    response: Response,
+    db: Optional[Session] = Depends(get_db_optional),
+) -> Dict[str, Any]:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    version = db.execute(
+        text(
+            """
+            SELECT t.xmin::text AS turma_version,
+                   (
+                       SELECT count(*)::text
+                              || ':' || COALESCE(max(tp.xmin::text::bigint), 0)::text
+                              || ':' || COALESCE(max(p.xmin::text::bigint), 0)::text
+                       FROM public.turmas_professores tp
+                       JOIN public.professores p ON p.id = tp.professor_id
+                       WHERE tp.turma_id = t.id
+                   ) AS professores_version
+            FROM public.turmas t
+            WHERE t.id = :id
+            """
+        ),
+        {"id": turma_id},
+    ).mappings().first()
+    if not version:
+        raise HTTPException(status_code=404, detail="Turma não encontrada.")
+    etag = weak_etag("turma", turma_id, version["turma_version"], version["professores_version"])
+    if (not_modified := conditional_response(request, response, etag)) is not None:
+        return not_modified
     turma = db.execute(
         text(
             """
@@ -103,6 +134,7 @@ async def update_turma(turma_id: str, payload: Dict[str, Any], db: Optional[Sess
     ).mappings().first()
     if not turma:
         raise HTTPException(status_code=404, detail="Turma não encontrada.")
+    notify_change(db, "turma", "update", id=turma_id, turma_id=turma_id)
     db.commit()
     return {"turma": dict(turma)}
 
@@ -130,6 +162,7 @@ async def delete_turma(turma_id: str, db: Optional[Session] = Depends(get_db_opt
         text("DELETE FROM public.turmas_professores WHERE turma_id = :id"),
         {"id": turma_id},
     )
+    notify_change(db, "turma", "delete", id=turma_id, turma_id=turma_id)
     db.commit()
     return {"deleted": True, "id": deleted.get("id")}
 
@@ -170,6 +203,7 @@ async def set_professor(
         text("SELECT id, nome FROM public.professores WHERE id = :id"),
         {"id": professor_id},
     ).mappings().first()
+    notify_change(db, "professor", "update", id=professor_id, turma_id=turma_id)
     db.commit()
     return {"turma": dict(turma), "professor": (dict(professor) if professor else None)}
 
@@ -188,27 +222,18 @@ async def unset_professor(
         text("DELETE FROM public.turmas_professores WHERE turma_id = :id"),
         {"id": turma_id},
     )
+    notify_change(db, "professor", "delete", turma_id=turma_id)
     db.commit()
     return {"ok": True}
 
 @router.get("/{turma_id}/students")
 async def list_students_in_turma(
     turma_id: str,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[Session] = Depends(get_read_db_optional),
 ) -> Dict[str, Any]:
     if db is None:
         raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
-    rows = db.execute(
-        text(
-            """
-            SELECT a.id, a.nome
-            FROM public.alunos a
-            WHERE a.turma_id = :id
-            ORDER BY a.nome
-            """
-        ),
-        {"id": turma_id},
-    ).mappings().all()
+    rows = turmas_repo.list_turma_alunos_resumo(db, turma_id)
     return {"items": [dict(r) for r in rows]}
 
 
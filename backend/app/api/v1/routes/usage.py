@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db.db import get_db_optional
+from app.schemas.usage import TurmaBudget, TurmaBudgetUpdate, UsageBucket, UsageReport
+from app.workers.usage_ledger import usage_ledger
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+_GROUP_EXPRESSIONS = {
+    "day": "to_char(date_trunc('day', created_at), 'YYYY-MM-DD')",
+    "model": "model",
+    "endpoint": "endpoint",
+    "turma": "turma_id::text",
+    "aluno": "aluno_id::text",
+}
+
+_AGGREGATES = """
+    count(*) AS chamadas,
+    count(*) FILTER (WHERE cache_hit) AS cache_hits,
+    count(*) FILTER (WHERE NOT ok) AS erros,
+    COALESCE(sum(prompt_tokens), 0) AS prompt_tokens,
+    COALESCE(sum(completion_tokens), 0) AS completion_tokens,
+    COALESCE(sum(cached_tokens), 0) AS cached_tokens,
+    COALESCE(sum(prompt_tokens + completion_tokens), 0) AS total_tokens,
+    round(avg(latency_ms)::numeric, 1)::float AS latencia_media_ms,
+    round((percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms))::numeric, 1)::float AS latencia_p95_ms
+"""
+
+
+def _bucket(row: Dict[str, Any]) -> UsageBucket:
+    return UsageBucket(**{k: row[k] for k in UsageBucket.model_fields if k in row})
+
+
+@router.get("", response_model=UsageReport)
+def get_usage(
+    from_: Optional[date] = Query(None, alias="from", description="Início do intervalo (padrão: 30 dias atrás)"),
+    to: Optional[date] = Query(None, description="Fim do intervalo, inclusivo (padrão: hoje)"),
+    group_by: str = Query("day", description="day, model, endpoint, turma ou aluno"),
+    turma_id: Optional[UUID] = None,
+    endpoint: Optional[str] = Query(None, description="'lesson' ou 'recommendation'"),
+    db: Optional[Session] = Depends(get_db_optional),
+) -> UsageReport:
+    """
+    Uso da LLM agregado a partir de public.llm_usage (tokens, cache, erros, latência).
+    Registros dos últimos segundos podem ainda não ter sido gravados.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    if group_by not in _GROUP_EXPRESSIONS:
+        raise HTTPException(status_code=400, detail="group_by deve ser day, model, endpoint, turma ou aluno.")
+    fim = to or date.today()
+    inicio = from_ or fim - timedelta(days=30)
+    if inicio > fim:
+        raise HTTPException(status_code=400, detail="'from' deve ser anterior a 'to'.")
+    params = {
+        "inicio": inicio,
+        "fim": fim + timedelta(days=1),
+        "turma_id": str(turma_id) if turma_id else None,
+        "endpoint": endpoint,
+    }
+    where = """
+        created_at >= :inicio AND created_at < :fim
+        AND (CAST(:turma_id AS UUID) IS NULL OR turma_id = CAST(:turma_id AS UUID))
+        AND (CAST(:endpoint AS TEXT) IS NULL OR endpoint = :endpoint)
+    """
+    key = _GROUP_EXPRESSIONS[group_by]
+    rows = db.execute(
+        text(
+            f"""
+            SELECT {key} AS chave, {_AGGREGATES}
+            FROM public.llm_usage
+            WHERE {where}
+            GROUP BY 1
+            ORDER BY {"1" if group_by == "day" else "total_tokens DESC, 1"}
+            """
+        ),
+        params,
+    ).mappings().all()
+    total = db.execute(
+        text(f"SELECT {_AGGREGATES} FROM public.llm_usage WHERE {where}"), params
+    ).mappings().first()
+    return UsageReport(
+        inicio=inicio,
+        fim=fim,
+        group_by=group_by,
+        total=_bucket(total),
+        grupos=[_bucket(r) for r in rows],
+    )
+
+
+def _turma_budget(db: Session, turma_id: UUID) -> TurmaBudget:
+    limit, used = usage_ledger.budget_status(db, turma_id)
+    return TurmaBudget(
+        turma_id=turma_id,
+        daily_tokens=limit,
+        usados_hoje=used,
+        restantes=max(0, limit - used) if limit is not None else None,
+    )
+
+
+@router.get("/budgets/{turma_id}", response_model=TurmaBudget)
+def get_turma_budget(turma_id: UUID, db: Optional[Session] = Depends(get_db_optional)) -> TurmaBudget:
+    """
+    Orçamento diário de tokens da turma e quanto já foi usado hoje.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    return _turma_budget(db, turma_id)
+
+
+@router.put("/budgets/{turma_id}", response_model=TurmaBudget)
+def set_turma_budget(
+    turma_id: UUID, payload: TurmaBudgetUpdate, db: Optional[Session] = Depends(get_db_optional)
+) -> TurmaBudget:
+    """
+    Define o orçamento diário de tokens da turma; `daily_tokens: null` volta ao padrão
+    da configuração. Chamadas à LLM além do orçamento recebem 429.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado.")
+    if db.execute(text("SELECT 1 FROM public.turmas WHERE id = :id"), {"id": str(turma_id)}).first() is None:
+        raise HTTPException(status_code=404, detail="Turma não encontrada.")
+    if payload.daily_tokens is None:
+        db.execute(text("DELETE FROM public.llm_turma_budgets WHERE turma_id = :id"), {"id": str(turma_id)})
+    else:
+        db.execute(
+            text(
+                """
+                INSERT INTO public.llm_turma_budgets (turma_id, daily_tokens)
+                VALUES (:id, :daily_tokens)
+                ON CONFLICT (turma_id) DO UPDATE SET daily_tokens = EXCLUDED.daily_tokens
+                """
+            ),
+            {"id": str(turma_id), "daily_tokens": payload.daily_tokens},
+        )
+    db.commit()
+    usage_ledger.forget_budget(turma_id)
+    return _turma_budget(db, turma_id)
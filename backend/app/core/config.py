@@ -8,10 +8,99 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = None
     openai_model: str = "gpt-4o-mini"
     openai_temperature: float = 0.7
+    # Roteamento de modelos (app/llm/routing.py); desligado usa openai_model em tudo
+    llm_routing_enabled: bool = False
+    llm_fast_model: str = "gpt-4o-mini"
+    llm_capable_model: str = "gpt-4o"
+    llm_small_prompt_tokens: int = 1500
+    llm_latency_slo_seconds: float = 12.0
+    llm_max_error_rate: float = 0.2
+    llm_max_timeout_seconds: float = 30.0
+    llm_lesson_max_tokens: int = 1800
+    llm_variant_max_tokens: int = 400
+    llm_recommendation_max_tokens: int = 700
+    # Saída estruturada (JSON Schema estrito) e follow-up só para campos faltantes
+    llm_structured_outputs: bool = True
+    llm_followup_enabled: bool = True
     cors_origins: Union[str, List[str], None] = (
         ["http://localhost:3000", "http://127.0.0.1:3000"]
     )
     sqlalchemy_url: Optional[str] = None
+    # Prepared statements no servidor (psycopg): preparado após N execuções na conexão;
+    # None desliga (ex.: pgbouncer em modo transaction)
+    db_prepare_threshold: Optional[int] = 2
+    # Réplica de leitura (opcional) para as rotas de listagem/consulta
+    sqlalchemy_read_url: Optional[str] = None
+    replica_max_lag_seconds: float = 2.0
+    replica_lag_check_interval_seconds: float = 1.0
+    replica_connect_timeout_seconds: int = 2
+    read_your_writes_seconds: int = 5  # leituras do cliente vão ao primário por N s após uma escrita
+    # Compressão de respostas (gzip/brotli)
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    # Armazenamento de arquivos das aulas
+    storage_backend: str = "local"
+    storage_dir: str = "storage"
+    storage_chunk_size: int = 1024 * 1024
+    storage_max_upload_bytes: int = 25 * 1024 * 1024
+    # Extração de texto dos arquivos de apoio
+    extraction_workers: int = 2
+    extraction_chunk_chars: int = 2000
+    extraction_digest_max_chars: int = 4000
+    # Coalescência de gerações idênticas: "process" (por worker) ou "postgres" (entre workers)
+    singleflight_mode: str = "process"
+    singleflight_wait_timeout: float = 35.0
+    singleflight_poll_interval: float = 0.25
+    # Idempotency-Key
+    idempotency_ttl_seconds: int = 24 * 60 * 60
+    idempotency_pending_timeout_seconds: int = 120
+    idempotency_cleanup_interval_seconds: int = 300
+    # Pré-geração especulativa de material (opt-in)
+    prefetch_enabled: bool = False
+    prefetch_offpeak_start_hour: int = 19
+    prefetch_offpeak_end_hour: int = 6
+    prefetch_lookahead_days: int = 7
+    prefetch_scan_interval_seconds: int = 900
+    prefetch_daily_token_budget: int = 200_000
+    prefetch_completion_token_estimate: int = 1200
+    prefetch_claim_ttl_seconds: int = 600  # reserva 'running' de um worker que caiu expira após N s
+    # Geração escalonada (rascunho local imediato, LLM em segundo plano)
+    tiered_race_window_seconds: float = 2.0
+    tiered_max_wait_seconds: float = 25.0
+    tiered_upgrade_ttl_seconds: int = 600
+    # Máximo de alunos por chamada em /material/generate/variants
+    variants_max_students: int = 12
+    # Índice de similaridade de materiais aceitos (reuso antes da LLM)
+    similarity_refresh_seconds: float = 30.0
+    similarity_reuse_min_rating: float = 0.6
+    # Recomendações em lote
+    recomendation_batch_concurrency: int = 4
+    recomendation_batch_max_items: int = 500
+    # Cache de recomendações (observações normalizadas + versão do prompt + modelo)
+    recomendation_cache_enabled: bool = True
+    recomendation_cache_ttl_seconds: int = 30 * 86400
+    recomendation_cache_max_entries: int = 20000
+    recomendation_cache_eviction_interval_seconds: int = 300
+    # Registro de uso da LLM (public.llm_usage, gravado em lote) e orçamento diário por turma
+    usage_ledger_enabled: bool = True
+    usage_flush_interval_seconds: float = 5.0
+    usage_max_buffer: int = 10000
+    usage_turma_daily_token_budget: Optional[int] = None  # padrão; public.llm_turma_budgets sobrepõe
+    usage_budget_refresh_seconds: float = 30.0
+    # Notificações de mudanças (NOTIFY + GET /events via SSE)
+    events_enabled: bool = True
+    events_queue_size: int = 100
+    events_heartbeat_seconds: float = 15.0
+    # Tracing: exportador "otlp" (coletor local, OTLP/HTTP JSON) ou "json" (arquivos); None desliga
+    tracing_exporter: Optional[str] = None
+    tracing_sample_rate: float = 0.1
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_json_dir: str = "traces"
+    tracing_export_interval_seconds: float = 2.0
+    tracing_max_buffer: int = 20000
+    tracing_service_name: str = "andori-api"
 
     @field_validator("cors_origins", mode="before")
     @classmethod
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.db.db import READ_YOUR_WRITES_COOKIE
+
+_READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadYourWritesMiddleware:
+    """
+    Após uma escrita bem-sucedida, marca o cliente com um cookie curto
+    (`read_your_writes_seconds`) e o cabeçalho `X-Read-Your-Writes`; enquanto o cookie
+    existir (ou o cliente reenviar o cabeçalho), get_read_db_optional usa o primário,
+    e o cliente sempre enxerga o que acabou de gravar mesmo com réplica atrasada.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in _READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_marker(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                ttl = settings.read_your_writes_seconds
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie", f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={ttl}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers.append("x-read-your-writes", str(ttl))
+            await send(message)
+
+        await self.app(scope, receive, send_with_marker)
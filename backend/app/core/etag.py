@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+
+def weak_etag(namespace: str, *versions: Any) -> str:
+    """
+    Monta um ETag fraco (W/"...") a partir de um namespace e de versões de linha
+    (ex.: xmin do Postgres, contagem de linhas).
+    """
+    raw = "|".join([namespace, *("" if v is None else str(v) for v in versions)])
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Comparação fraca (RFC 9110) entre o cabeçalho If-None-Match e o ETag atual.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = _strip_weak(etag)
+    return any(_strip_weak(candidate) == current for candidate in if_none_match.split(","))
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    """Cabeçalhos de validação: o cliente pode guardar, mas deve revalidar sempre."""
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def conditional_response(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Retorna um 304 quando o cliente já possui a versão atual; caso contrário,
+    anota o ETag na resposta que será enviada e retorna None.
+    """
+    headers = etag_headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.db.db import get_engine
+
+# Rotas (POST) em que o cabeçalho Idempotency-Key é respeitado.
+IDEMPOTENT_PATHS = frozenset(
+    {
+        "/api/v1/aulas",
+        "/api/v1/material/accept",
+        "/api/v1/feedback/student",
+        "/api/v1/recomendation/",
+        "/api/v1/recomendation/batch",
+    }
+)
+
+# Cabeçalhos da resposta original que são reproduzidos no replay.
+_REPLAY_HEADERS = ("content-type", "location", "etag")
+
+_last_cleanup = 0.0
+
+
+def _cleanup_expired(conn) -> None:
+    global _last_cleanup
+    now = time.monotonic()
+    if now - _last_cleanup < settings.idempotency_cleanup_interval_seconds:
+        return
+    _last_cleanup = now
+    conn.execute(text("DELETE FROM public.idempotency_keys WHERE expires_at < now()"))
+
+
+def _claim(scope_path: str, key: str, request_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Tenta reservar a chave. Retorna None quando a reserva é nossa; caso contrário,
+    retorna a linha existente (pendente ou concluída).
+    """
+    with get_engine().begin() as conn:
+        _cleanup_expired(conn)
+        conn.execute(
+            text(
+                """
+                DELETE FROM public.idempotency_keys
+                WHERE scope = :scope AND key = :key
+                  AND (expires_at < now()
+                       OR (status = 'pending' AND created_at < now() - make_interval(secs => :pending_timeout)))
+                """
+            ),
+            {"scope": scope_path, "key": key, "pending_timeout": settings.idempotency_pending_timeout_seconds},
+        )
+        inserted = conn.execute(
+            text(
+                """
+                INSERT INTO public.idempotency_keys (scope, key, request_hash, status, expires_at)
+                VALUES (:scope, :key, :request_hash, 'pending', now() + make_interval(secs => :ttl))
+                ON CONFLICT (scope, key) DO NOTHING
+                RETURNING key
+                """
+            ),
+            {
+                "scope": scope_path,
+                "key": key,
+                "request_hash": request_hash,
+                "ttl": settings.idempotency_ttl_seconds,
+            },
+        ).first()
+        if inserted is not None:
+            return None
+        row = conn.execute(
+            text(
+                """
+                SELECT request_hash, status, status_code, response_headers, response_body
+                FROM public.idempotency_keys
+                WHERE scope = :scope AND key = :key
+                """
+            ),
+            {"scope": scope_path, "key": key},
+        ).mappings().first()
+        return dict(row) if row else {"status": "pending", "request_hash": request_hash}
+
+
+def _complete(scope_path: str, key: str, status_code: int, headers: Dict[str, str], body: bytes) -> None:
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE public.idempotency_keys
+                SET status = 'completed',
+                    status_code = :status_code,
+                    response_headers = CAST(:headers AS JSONB),
+                    response_body = :body
+                WHERE scope = :scope AND key = :key
+                """
+            ),
+            {
+                "scope": scope_path,
+                "key": key,
+                "status_code": status_code,
+                "headers": json.dumps(headers),
+                "body": body,
+            },
+        )
+
+
+def _release(scope_path: str, key: str) -> None:
+    with get_engine().begin() as conn:
+        conn.execute(
+            text("DELETE FROM public.idempotency_keys WHERE scope = :scope AND key = :key AND status = 'pending'"),
+            {"scope": scope_path, "key": key},
+        )
+
+
+class IdempotencyMiddleware:
+    """
+    Suporte ao cabeçalho `Idempotency-Key` nas rotas de IDEMPOTENT_PATHS.
+    A primeira requisição com a chave é executada e sua resposta guardada em
+    public.idempotency_keys; repetições recebem a mesma resposta, sem reexecutar
+    a rota (nem inserções, nem chamadas à LLM).
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in IDEMPOTENT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        key = Headers(scope=scope).get("idempotency-key")
+        if not key or get_engine() is None:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > 255:
+            await JSONResponse({"detail": "Idempotency-Key muito longa."}, status_code=400)(scope, receive, send)
+            return
+
+        body_parts: List[bytes] = []
+        while True:
+            message = await receive()
+            body_parts.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(body_parts)
+        request_hash = hashlib.sha256(scope["path"].encode("utf-8") + b"\n" + body).hexdigest()
+
+        existing = await run_in_threadpool(_claim, scope["path"], key, request_hash)
+        if existing is not None:
+            await self._respond_existing(existing, request_hash, scope, receive, send)
+            return
+
+        replayed = False
+
+        async def replay_receive() -> Message:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code = 500
+        response_headers: Dict[str, str] = {}
+        response_body: List[bytes] = []
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = Headers(raw=message["headers"])
+                response_headers = {name: headers[name] for name in _REPLAY_HEADERS if name in headers}
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await run_in_threadpool(_release, scope["path"], key)
+            raise
+        if status_code >= 500:
+            # Falhas do servidor não são memorizadas: o cliente pode tentar de novo.
+            await run_in_threadpool(_release, scope["path"], key)
+            return
+        await run_in_threadpool(
+            _complete, scope["path"], key, status_code, response_headers, b"".join(response_body)
+        )
+
+    async def _respond_existing(
+        self,
+        existing: Dict[str, Any],
+        request_hash: str,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        if existing.get("request_hash") != request_hash:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key já utilizada com outro conteúdo de requisição."},
+                status_code=422,
+            )
+        elif existing.get("status") != "completed":
+            response = JSONResponse(
+                {"detail": "Requisição com esta Idempotency-Key ainda está em processamento."},
+                status_code=409,
+                headers={"Retry-After": "1"},
+            )
+        else:
+            headers = existing.get("response_headers") or {}
+            if isinstance(headers, str):
+                headers = json.loads(headers)
+            body = existing.get("response_body") or b""
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": existing["status_code"],
+                    "headers": [
+                        *((k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()),
+                        (b"content-length", str(len(body)).encode("latin-1")),
+                        (b"idempotent-replayed", b"true"),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": bytes(body)})
+            return
+        await response(scope, receive, send)
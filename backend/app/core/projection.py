@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import List, Mapping, Optional, Sequence
+
+from fastapi import HTTPException
+
+VIEWS = ("summary", "full")
+
+
+def select_fields(
+    view: str,
+    fields: Optional[str],
+    available: Mapping[str, str],
+    summary: Sequence[str],
+) -> List[str]:
+    """
+    Resolve quais campos uma listagem deve trazer a partir de `view` (summary|full)
+    e de uma lista explícita `fields=a,b,c`. O campo `id` é sempre incluído.
+    """
+    if view not in VIEWS:
+        raise HTTPException(status_code=422, detail="Parâmetro 'view' deve ser 'summary' ou 'full'.")
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in available]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Campos desconhecidos: {', '.join(unknown)}.")
+        selected = ["id"]
+        for name in requested:
+            if name not in selected:
+                selected.append(name)
+        return selected
+    if view == "summary":
+        return list(summary)
+    return list(available)
+
+
+def select_clause(selected: Sequence[str], available: Mapping[str, str]) -> str:
+    """Monta a lista de colunas/expressões SQL para os campos selecionados."""
+    return ", ".join(available[name] for name in selected)
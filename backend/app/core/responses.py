@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:  # orjson é opcional; sem ele caímos no json da stdlib
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializa para JSON compacto (UTF-8), usando orjson quando disponível.
+    """
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Resposta JSON padrão da API. Aceita modelos Pydantic diretamente
+    (model_dump_json), evitando a ida e volta por dicionários.
+    Com `exclude_unset=True`, campos não preenchidos do modelo são omitidos.
+    """
+
+    def __init__(self, content: Any, *args: Any, exclude_unset: bool = False, **kwargs: Any) -> None:
+        self.exclude_unset = exclude_unset
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel) and self.exclude_unset:
+            return content.model_dump_json(exclude_unset=True).encode("utf-8")
+        return dumps(content)
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Tipos de span do OTLP.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    """Span de um trace amostrado; finalizado por `span()` e enviado ao exportador."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: int) -> None:
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+class _TraceContext:
+    __slots__ = ("trace_id", "sampled", "span")
+
+    def __init__(self, trace_id: str, sampled: bool, span: Optional[Span] = None) -> None:
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.span = span
+
+
+_current: contextvars.ContextVar[Optional[_TraceContext]] = contextvars.ContextVar("trace_context", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+def current_span() -> Optional[Span]:
+    ctx = _current.get()
+    return ctx.span if ctx and ctx.sampled else None
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Abre um span filho do atual. Fora de um trace amostrado não faz nada (yield None),
+    o que mantém o custo desprezível com amostragem desligada.
+    """
+    ctx = _current.get()
+    if ctx is None or not ctx.sampled:
+        yield None
+        return
+    current = Span(ctx.trace_id, ctx.span.span_id if ctx.span else None, name, kind)
+    current.set(**attributes)
+    token = _current.set(_TraceContext(ctx.trace_id, True, current))
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        exporter.add(current)
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorador que envolve a função (síncrona ou async) em um span."""
+
+    def decorator(fn: F) -> F:
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    # W3C traceparent: 00-<trace_id 32 hex>-<parent_id 16 hex>-<flags>
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """
+    Abre o span raiz de cada requisição HTTP (respeitando `traceparent` de entrada),
+    aplica a amostragem (`tracing_sample_rate`) e devolve o trace id nos cabeçalhos
+    `X-Trace-Id` e `traceparent` da resposta, mesmo quando o trace não é amostrado.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        parent = _parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            sampled = sampled or random.random() < settings.tracing_sample_rate
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < settings.tracing_sample_rate
+
+        root = Span(trace_id, parent_id, f"{scope['method']} {scope['path']}", SPAN_KIND_SERVER) if sampled else None
+        echoed_span_id = root.span_id if root else os.urandom(8).hex()
+        token = _current.set(_TraceContext(trace_id, sampled, root))
+        status_code = 500
+
+        async def send_with_trace(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["x-trace-id"] = trace_id
+                headers["traceparent"] = f"00-{trace_id}-{echoed_span_id}-{'01' if sampled else '00'}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as exc:
+            if root is not None:
+                root.error = type(exc).__name__
+            raise
+        finally:
+            _current.reset(token)
+            if root is not None:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.name = f"{scope['method']} {route}"
+                root.set(**{"http.method": scope["method"], "http.target": scope["path"], "http.route": route})
+                root.set(**{"http.status_code": status_code})
+                if status_code >= 500 and root.error is None:
+                    root.error = f"HTTP {status_code}"
+                root.end_ns = time.time_ns()
+                exporter.add(root)
+
+
+def instrument_engine(engine: Any) -> None:
+    """Spans de cliente para cada statement SQL executado no engine (só em traces amostrados)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        ctx = _current.get()
+        if ctx is None or not ctx.sampled:
+            return
+        sql_span = Span(ctx.trace_id, ctx.span.span_id if ctx.span else None, "db.query", SPAN_KIND_CLIENT)
+        sql_span.set(**{"db.system": "postgresql", "db.statement": " ".join(statement.split())[:1000]})
+        if executemany:
+            sql_span.set(**{"db.executemany": True})
+        conn.info.setdefault("_trace_spans", []).append(sql_span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        spans = conn.info.get("_trace_spans")
+        if spans:
+            sql_span = spans.pop()
+            sql_span.set(**{"db.rows": cursor.rowcount})
+            sql_span.end_ns = time.time_ns()
+            exporter.add(sql_span)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):  # noqa: ANN001
+        conn = exception_context.connection
+        spans = conn.info.get("_trace_spans") if conn is not None else None
+        if spans:
+            sql_span = spans.pop()
+            sql_span.error = type(exception_context.original_exception).__name__
+            sql_span.end_ns = time.time_ns()
+            exporter.add(sql_span)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span) -> Dict[str, Any]:
+    encoded: Dict[str, Any] = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": s.kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        encoded["parentSpanId"] = s.parent_id
+    return encoded
+
+
+def _json_span(s: Span) -> Dict[str, Any]:
+    return {
+        "trace_id": s.trace_id,
+        "span_id": s.span_id,
+        "parent_id": s.parent_id,
+        "name": s.name,
+        "start_ns": s.start_ns,
+        "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3),
+        "attributes": s.attributes,
+        "error": s.error,
+    }
+
+
+class SpanExporter:
+    """
+    Acumula spans finalizados e os exporta em lote a cada `tracing_export_interval_seconds`:
+    OTLP/HTTP (JSON) para um coletor local ou arquivos JSON Lines em `tracing_json_dir`.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buffer: List[Span] = []
+
+    def add(self, s: Span) -> None:
+        with self._lock:
+            if len(self._buffer) >= settings.tracing_max_buffer:
+                metrics.incr("tracing.dropped_spans")
+                return
+            self._buffer.append(s)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            if settings.tracing_exporter == "otlp":
+                self._export_otlp(batch)
+            elif settings.tracing_exporter == "json":
+                self._export_json(batch)
+        except Exception:
+            metrics.incr("tracing.export_errors")
+            return 0
+        metrics.incr("tracing.exported_spans", len(batch))
+        return len(batch)
+
+    @staticmethod
+    def _export_otlp(batch: List[Span]) -> None:
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [{"key": "service.name", "value": {"stringValue": settings.tracing_service_name}}]
+                    },
+                    "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [_otlp_span(s) for s in batch]}],
+                }
+            ]
+        }
+        httpx.post(settings.tracing_otlp_endpoint, json=body, timeout=5).raise_for_status()
+
+    @staticmethod
+    def _export_json(batch: List[Span]) -> None:
+        os.makedirs(settings.tracing_json_dir, exist_ok=True)
+        path = os.path.join(settings.tracing_json_dir, f"traces-{time.strftime('%Y%m%d')}-{os.getpid()}.jsonl")
+        with open(path, "a", encoding="utf-8") as fh:
+            for s in batch:
+                fh.write(json.dumps(_json_span(s), ensure_ascii=False, default=str) + "\n")
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(settings.tracing_export_interval_seconds)
+                await run_in_threadpool(self.flush)
+        finally:
+            await run_in_threadpool(self.flush)
+
+
+exporter = SpanExporter()
+
+
+def tracing_enabled() -> bool:
+    return settings.tracing_exporter in ("otlp", "json")
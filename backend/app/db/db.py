@@ -1,21 +1,71 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from typing import Generator, Optional
+import threading
+import time
+from contextlib import contextmanager
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Any, Dict, Generator, Iterator, Optional
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tracing import instrument_engine, tracing_enabled
 
 _SessionLocal: Optional[sessionmaker] = None
+_ReadSessionLocal: Optional[sessionmaker] = None
+_read_engine = None
+
+# Cookie/cabeçalho de read-your-writes (ver app/core/consistency.py).
+READ_YOUR_WRITES_COOKIE = "andori_rw"
+READ_YOUR_WRITES_HEADER = "x-read-your-writes"
+
+
+def _connect_args(url: str, **extra: Any) -> Dict[str, Any]:
+    """
+    Argumentos de conexão do driver. Com psycopg 3, `prepare_threshold` faz os
+    statements repetidos (os de app/repositories, de texto estável) serem preparados
+    no servidor e reaproveitados pela conexão do pool.
+    """
+    args: Dict[str, Any] = dict(extra)
+    if make_url(url).get_driver_name() == "psycopg":
+        args["prepare_threshold"] = settings.db_prepare_threshold
+    return args
+
 
 if settings.sqlalchemy_url:
     _engine = create_engine(
         settings.sqlalchemy_url,
         pool_pre_ping=True,
         future=True,
+        connect_args=_connect_args(settings.sqlalchemy_url),
     )
     _SessionLocal = sessionmaker(bind=_engine, autoflush=False, autocommit=False, future=True)
+    if tracing_enabled():
+        instrument_engine(_engine)
 else:
     _engine = None
 
 
+def get_engine():
+    """
+    Engine compartilhado (ou None quando o banco não está configurado).
+    """
+    return _engine
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Sessão para uso fora de rotas (workers, streaming). Exige banco configurado.
+    """
+    if _SessionLocal is None:
+        raise RuntimeError("SQLAlchemy URL not configured (settings.sqlalchemy_url is None).")
+    db = _SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def get_db() -> Generator:
     """
     Strict DB dependency. Raises if SQLAlchemy URL is not configured.
@@ -40,4 +90,101 @@ def get_db_optional() -> Generator:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+if _SessionLocal is not None and settings.sqlalchemy_read_url:
+    _read_engine = create_engine(
+        settings.sqlalchemy_read_url,
+        pool_pre_ping=True,
+        future=True,
+        connect_args=_connect_args(
+            settings.sqlalchemy_read_url,
+            options="-c default_transaction_read_only=on",
+            connect_timeout=settings.replica_connect_timeout_seconds,
+        ),
+    )
+    _ReadSessionLocal = sessionmaker(bind=_read_engine, autoflush=False, autocommit=False, future=True)
+    if tracing_enabled():
+        instrument_engine(_read_engine)
+
+# Atraso de replicação: zero quando tudo o que foi recebido já foi aplicado (réplica ociosa).
+_LAG_SQL = text(
+    """
+    SELECT CASE
+      WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+      ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+_lag_lock = threading.Lock()
+_lag_checked_at = 0.0
+_lag_seconds = 0.0
+
+
+def get_read_engine():
+    """
+    Engine da réplica de leitura (ou None quando não configurada).
+    """
+    return _read_engine
+
+
+def replica_lag() -> float:
+    """
+    Atraso da réplica em segundos, consultado no máximo a cada
+    replica_lag_check_interval_seconds; infinito quando a réplica não responde.
+    """
+    global _lag_checked_at, _lag_seconds
+    if _read_engine is None:
+        return 0.0
+    if time.monotonic() - _lag_checked_at < settings.replica_lag_check_interval_seconds:
+        return _lag_seconds
+    # Um único thread consulta a réplica; os demais seguem com o último valor em vez de
+    # esperar pelo lock se a réplica estiver lenta/travada (limitada por connect_timeout).
+    if not _lag_lock.acquire(blocking=False):
+        return _lag_seconds
+    try:
+        if time.monotonic() - _lag_checked_at < settings.replica_lag_check_interval_seconds:
+            return _lag_seconds
+        try:
+            with _read_engine.connect() as conn:
+                lag = float(conn.execute(_LAG_SQL).scalar() or 0)
+        except Exception:
+            lag = float("inf")
+            metrics.incr("db.replica.errors")
+        else:
+            metrics.set_gauge("db.replica.lag_seconds", round(lag, 3))
+        _lag_seconds, _lag_checked_at = lag, time.monotonic()
+        return lag
+    finally:
+        _lag_lock.release()
+
+
+def _read_session_factory(request: Request) -> Optional[sessionmaker]:
+    if _ReadSessionLocal is None:
+        return _SessionLocal
+    if READ_YOUR_WRITES_COOKIE in request.cookies or request.headers.get(READ_YOUR_WRITES_HEADER):
+        metrics.incr("db.read.primary_sticky")
+        return _SessionLocal
+    if replica_lag() > settings.replica_max_lag_seconds:
+        metrics.incr("db.read.primary_lag")
+        return _SessionLocal
+    metrics.incr("db.read.replica")
+    return _ReadSessionLocal
+
+
+def get_read_db_optional(request: Request) -> Generator:
+    """
+    Read-only DB dependency for listing/lookup routes. Uses the read replica when
+    configured, falling back to the primary when replication lag is too high or the
+    client wrote recently (read-your-writes). Yields None without a database.
+    """
+    factory = _read_session_factory(request) if _SessionLocal is not None else None
+    if factory is None:
+        yield None
+        return
+    db = factory()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -63,7 +63,161 @@ CREATE TABLE IF NOT EXISTS public.feedback_aluno_aula (
   feedback TEXT
 );
 
+-- Resultados compartilhados entre workers pela coalescência de gerações (singleflight_mode = 'postgres')
+CREATE TABLE IF NOT EXISTS public.llm_singleflight_results (
+  key        TEXT PRIMARY KEY,
+  response   JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Respostas memorizadas por Idempotency-Key (expiram após settings.idempotency_ttl_seconds)
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+  scope            TEXT NOT NULL,          -- rota, ex.: '/api/v1/material/accept'
+  key              TEXT NOT NULL,
+  request_hash     TEXT NOT NULL,
+  status           TEXT NOT NULL DEFAULT 'pending',  -- pending | completed
+  status_code      INTEGER,
+  response_headers JSONB,
+  response_body    BYTEA,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  expires_at       TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at_idx ON public.idempotency_keys (expires_at);
+
+-- Rascunhos pré-gerados (accepted = false) guardam o hash das entradas usadas na geração
+ALTER TABLE public.arrmd_material ADD COLUMN IF NOT EXISTS input_hash TEXT;
+CREATE INDEX IF NOT EXISTS arrmd_material_draft_idx
+  ON public.arrmd_material (aula_id, input_hash)
+  WHERE accepted = false;
+
+-- Gerações da LLM concluídas em segundo plano no modo escalonado (token pending_upgrade)
+CREATE TABLE IF NOT EXISTS public.material_upgrades (
+  token      TEXT PRIMARY KEY,
+  status     TEXT NOT NULL,               -- 'pending' | 'ready' | 'failed'
+  result     JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Índice de similaridade (TF-IDF com termos hasheados) dos materiais aceitos, usado para reuso
+CREATE TABLE IF NOT EXISTS public.material_index (
+  material_id UUID PRIMARY KEY REFERENCES public.arrmd_material(id) ON DELETE CASCADE,
+  aula_id     UUID NOT NULL REFERENCES public.arrmd(id) ON DELETE CASCADE,
+  hyperfocus  TEXT,
+  terms       JSONB NOT NULL,            -- {bucket: peso}
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Busca textual (GET /search): português com remoção de acentos, colunas tsvector geradas e índices GIN
+CREATE EXTENSION IF NOT EXISTS unaccent;
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent') THEN
+    CREATE TEXT SEARCH CONFIGURATION public.pt_unaccent (COPY = pg_catalog.portuguese);
+    ALTER TEXT SEARCH CONFIGURATION public.pt_unaccent
+      ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+  END IF;
+END $$;
+
+ALTER TABLE public.arrmd ADD COLUMN IF NOT EXISTS search_tsv tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('public.pt_unaccent', coalesce(assunto, '')), 'A') ||
+    setweight(to_tsvector('public.pt_unaccent', coalesce(descricao, '')), 'B') ||
+    setweight(to_tsvector('public.pt_unaccent', coalesce(recomendacoes_ia, '')), 'C')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS arrmd_search_tsv_idx ON public.arrmd USING GIN (search_tsv);
+
+ALTER TABLE public.arrmd_material ADD COLUMN IF NOT EXISTS search_tsv tsvector
+  GENERATED ALWAYS AS (
+    setweight(jsonb_to_tsvector('public.pt_unaccent', roteiro, '["string"]'), 'B') ||
+    setweight(jsonb_to_tsvector('public.pt_unaccent', resumo, '["string"]'), 'C')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS arrmd_material_search_tsv_idx ON public.arrmd_material USING GIN (search_tsv);
 
+-- Calendário (GET /aulas?from=&to=&turma_id=): turma_id promovido de upload_arquivo para a coluna
+-- arrmd.turma_id (mantida por trigger), com índices por data e por turma/data
+ALTER TABLE public.arrmd ADD COLUMN IF NOT EXISTS turma_id UUID;
 
+CREATE OR REPLACE FUNCTION public.arrmd_sync_turma_id() RETURNS trigger AS $$
+DECLARE
+  raw TEXT := NEW.upload_arquivo::jsonb ->> 'turma_id';
+BEGIN
+  IF NEW.upload_arquivo IS NOT NULL THEN
+    NEW.turma_id := CASE
+      WHEN raw ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$' THEN raw::uuid
+      ELSE NULL
+    END;
+  END IF;
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
 
+DROP TRIGGER IF EXISTS arrmd_sync_turma_id ON public.arrmd;
+CREATE TRIGGER arrmd_sync_turma_id
+  BEFORE INSERT OR UPDATE OF upload_arquivo ON public.arrmd
+  FOR EACH ROW EXECUTE FUNCTION public.arrmd_sync_turma_id();
 
+UPDATE public.arrmd
+SET turma_id = (upload_arquivo::jsonb ->> 'turma_id')::uuid
+WHERE turma_id IS NULL
+  AND (upload_arquivo::jsonb ->> 'turma_id') ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$';
+
+CREATE INDEX IF NOT EXISTS arrmd_data_idx ON public.arrmd (data);
+CREATE INDEX IF NOT EXISTS arrmd_turma_data_idx ON public.arrmd (turma_id, data);
+CREATE INDEX IF NOT EXISTS arrmd_material_aula_idx ON public.arrmd_material (aula_id);
+CREATE INDEX IF NOT EXISTS feedback_aluno_aula_arrmd_idx ON public.feedback_aluno_aula (id_arrmd);
+
+-- Cache de recomendações da IA por observações normalizadas (TTL + LRU em settings.recomendation_cache_*)
+CREATE TABLE IF NOT EXISTS public.recommendation_cache (
+  key            TEXT PRIMARY KEY,        -- sha256(observações normalizadas + versão do prompt + modelo)
+  recomendacoes  TEXT NOT NULL,
+  model          TEXT,
+  prompt_version TEXT,
+  hits           BIGINT NOT NULL DEFAULT 0,
+  created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_used_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS recommendation_cache_last_used_idx ON public.recommendation_cache (last_used_at);
+
+-- Registro de uso da LLM (gravado em lote por app/workers/usage_ledger.py)
+CREATE TABLE IF NOT EXISTS public.llm_usage (
+  id                BIGSERIAL PRIMARY KEY,
+  created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  endpoint          TEXT NOT NULL,        -- 'lesson' | 'recommendation'
+  model             TEXT,
+  turma_id          UUID,
+  aluno_id          UUID,
+  prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+  completion_tokens INTEGER NOT NULL DEFAULT 0,
+  cached_tokens     INTEGER NOT NULL DEFAULT 0,
+  latency_ms        DOUBLE PRECISION,
+  cache_hit         BOOLEAN NOT NULL DEFAULT false,
+  ok                BOOLEAN NOT NULL DEFAULT true
+);
+CREATE INDEX IF NOT EXISTS llm_usage_created_at_idx ON public.llm_usage (created_at);
+CREATE INDEX IF NOT EXISTS llm_usage_turma_created_at_idx ON public.llm_usage (turma_id, created_at);
+
+-- Orçamento diário de tokens por turma (sem linha: settings.usage_turma_daily_token_budget)
+CREATE TABLE IF NOT EXISTS public.llm_turma_budgets (
+  turma_id     UUID PRIMARY KEY REFERENCES public.turmas(id) ON DELETE CASCADE,
+  daily_tokens BIGINT NOT NULL CHECK (daily_tokens >= 0)
+);
+
+-- Pré-geração: reserva por aula entre workers (status 'running' expira) e estimativa de
+-- tokens reservada no orçamento diário compartilhado (settings.prefetch_daily_token_budget)
+CREATE TABLE IF NOT EXISTS public.prefetch_claims (
+  aula_id    UUID PRIMARY KEY REFERENCES public.arrmd(id) ON DELETE CASCADE,
+  status     TEXT NOT NULL,               -- 'running' | 'done' | 'failed'
+  tokens     BIGINT NOT NULL DEFAULT 0,   -- reservados no dia de claimed_at
+  claimed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS prefetch_claims_claimed_at_idx ON public.prefetch_claims (claimed_at);
+
+-- Recomendações da IA por aluno em cada aula (public.arrmd.recomendacoes_ia guarda só a última)
+CREATE TABLE IF NOT EXISTS public.recomendacoes_aluno_aula (
+  arrmd_id         UUID NOT NULL REFERENCES public.arrmd(id) ON DELETE CASCADE,
+  aluno_id         UUID NOT NULL REFERENCES public.alunos(id) ON DELETE CASCADE,
+  recomendacoes_ia TEXT NOT NULL,
+  updated_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (arrmd_id, aluno_id)
+);
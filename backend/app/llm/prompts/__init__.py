@@ -1,3 +1,3 @@
-from .lesson import chat_system_prompt, build_llm_payload, build_user_message
+from .lesson import chat_system_prompt, build_llm_payload, build_user_message, payload_fingerprint
 
 
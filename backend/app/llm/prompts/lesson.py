@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from app.schemas.lesson import GenerateMaterialRequest
 
 
@@ -40,9 +41,11 @@ def build_llm_payload(
     req: GenerateMaterialRequest,
     student_profile: Optional[Dict[str, Any]] = None,
     turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
 ) -> dict:
     """
-    Builds the JSON payload sent to the LLM, optionally enriched with student profile from DB.
+    Builds the JSON payload sent to the LLM, optionally enriched with student profile from DB
+    and with the bounded digest of the teacher's uploaded file.
     """
     payload = {
         "disciplina": req.disciplina,
@@ -53,20 +56,42 @@ def build_llm_payload(
         "feedback": req.feedback,
         "student_profile": student_profile or None,
         "turma_context": turma_context or None,
+        "material_de_apoio": arquivo_digest or None,
     }
     return payload
 
 
+def payload_fingerprint(payload: Any) -> str:
+    """
+    Stable hash of a canonical JSON rendering of the LLM inputs (sorted keys), used to
+    detect identical generation requests.
+    """
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Campos do perfil enviados por aluno no modo de variantes.
+VARIANT_STUDENT_KEYS = ("id", "interesse", "preferencia", "nivel_de_suporte", "descricao_do_aluno")
+
+
 def build_user_message(
     req: GenerateMaterialRequest,
     student_profile: Optional[Dict[str, Any]] = None,
     turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
+    variant_students: Optional[List[Dict[str, Any]]] = None,
 ) -> str:
     """
     Builds a detailed user message that instructs the LLM to use both teacher inputs
     and DB context (student_profile and turma_context) while keeping the output strict JSON.
+    With `variant_students`, asks for one shared roteiro/resumo plus per-student
+    examples keyed by student id (one completion for the whole group).
     """
-    payload = build_llm_payload(req, student_profile, turma_context)
+    payload = build_llm_payload(req, student_profile, turma_context, arquivo_digest)
+    if variant_students:
+        payload["alunos_variantes"] = [
+            {k: s.get(k) for k in VARIANT_STUDENT_KEYS} for s in variant_students
+        ]
     parts: list[str] = []
     parts.append("Tarefa: Gere um material de aula convencional e inclusivo, com um roteiro falado que o professor pode usar em sala e um resumo para estudo em casa.")
     parts.append("Integre hiperfocos de forma NATURAL (2-4 referências) como exemplos/analogias, sem transformar a aula no tema do hiperfoco.")
@@ -80,19 +105,34 @@ def build_user_message(
             "5) Não exponha dados sensíveis individuais no texto final (generalize recomendações)."
         )
     )
-    parts.append(
-        (
-            "Formato de saída (JSON VÁLIDO, sem markdown, sem comentários): "
-            "{\"roteiro\": {\"topicos\": [strings OPCIONAL], \"falas\": [strings OU string], \"exemplos\": [strings OPCIONAL]}, "
-            "\"resumo\": {\"texto\": string, \"exemplo\": string}}"
+    if variant_students:
+        parts.append(
+            (
+                "Modo variantes: gere UM roteiro e UM resumo compartilhados pela turma e, para cada aluno em "
+                "'alunos_variantes', exemplos próprios alinhados ao perfil dele (interesse/preferência/nível de suporte). "
+                "Formato de saída (JSON VÁLIDO, sem markdown, sem comentários): "
+                "{\"roteiro\": {\"topicos\": [strings OPCIONAL], \"falas\": [strings OU string], \"exemplos\": [strings OPCIONAL]}, "
+                "\"resumo\": {\"texto\": string, \"exemplo\": string}, "
+                "\"variantes\": {\"<id do aluno>\": {\"exemplos\": [strings], \"resumo_exemplo\": string}}} "
+                "com uma entrada em 'variantes' para CADA id de 'alunos_variantes'."
+            )
+        )
+    else:
+        parts.append(
+            (
+                "Formato de saída (JSON VÁLIDO, sem markdown, sem comentários): "
+                "{\"roteiro\": {\"topicos\": [strings OPCIONAL], \"falas\": [strings OU string], \"exemplos\": [strings OPCIONAL]}, "
+                "\"resumo\": {\"texto\": string, \"exemplo\": string}}"
+            )
         )
-    )
     parts.append(
         (
             "Limites: roteiro em fala coesa (ou 6-12 falas curtas); 0-4 tópicos; 3-5 exemplos. "
             "Português do Brasil; linguagem clara, acolhedora e envolvente."
         )
     )
+    if arquivo_digest:
+        parts.append("Use 'material_de_apoio' (resumo do arquivo enviado pelo professor) como referência de conteúdo e vocabulário; não copie trechos literalmente.")
     parts.append("IMPORTANTE: personalize de forma concreta ao ASSUNTO/DESCRIÇÃO; se 'student_profile.interesse' existir, inclua 2 referências alinhadas e os demais exemplos gerais/cotidianos.")
     parts.append("Entrada (JSON de referência para geração): " + json.dumps(payload, ensure_ascii=False, default=str))
     return "\n".join(parts)
@@ -0,0 +1,145 @@
+"""
+Routing policy for upstream LLM calls: picks model, max_tokens and timeout per request
+from the estimated prompt size, the endpoint and recent upstream latency/error rates,
+against the configured latency SLO.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Janela de observações por modelo usada para latência (p90) e taxa de erro.
+_WINDOW_SIZE = 50
+_WINDOW_SECONDS = 300.0
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    endpoint: str
+    model: str
+    tier: str  # 'fast' | 'capable' | 'default'
+    max_tokens: Optional[int]
+    timeout: float
+    reason: str
+    prompt_tokens: int
+
+    @property
+    def source(self) -> str:
+        """Valor de `source` das respostas: 'openai' ou, com roteamento, 'openai:<modelo>'."""
+        return f"openai:{self.model}" if self.tier != "default" else "openai"
+
+    def trace_attributes(self) -> Dict[str, Any]:
+        return {
+            "llm.endpoint": self.endpoint,
+            "llm.model": self.model,
+            "llm.tier": self.tier,
+            "llm.route_reason": self.reason,
+            "llm.max_tokens": self.max_tokens,
+            "llm.timeout": self.timeout,
+            "llm.prompt_tokens_estimate": self.prompt_tokens,
+        }
+
+
+def usage_attributes(usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Atributos de span a partir do bloco `usage` da resposta da OpenAI."""
+    usage = usage or {}
+    return {
+        "llm.prompt_tokens": usage.get("prompt_tokens"),
+        "llm.completion_tokens": usage.get("completion_tokens"),
+        "llm.cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+    }
+
+
+def model_key() -> str:
+    """Modelo(s) que podem atender uma chamada; entra nas chaves de cache para invalidá-las ao mudar o roteamento."""
+    if settings.llm_routing_enabled:
+        return f"{settings.llm_fast_model}|{settings.llm_capable_model}"
+    return settings.openai_model
+
+
+def estimate_tokens(*texts: str) -> int:
+    # Aproximação usual (~4 caracteres por token).
+    return sum(len(t) for t in texts) // 4
+
+
+class LLMRouter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[Tuple[float, float, bool]]] = {}
+
+    def record(self, decision: RouteDecision, latency: float, ok: bool) -> None:
+        """Registra o resultado de uma chamada (latência em segundos) para as próximas decisões."""
+        with self._lock:
+            samples = self._samples.setdefault(decision.model, deque(maxlen=_WINDOW_SIZE))
+            samples.append((time.monotonic(), latency, ok))
+        metrics.incr(f"llm.{decision.model}.calls")
+        if not ok:
+            metrics.incr(f"llm.{decision.model}.errors")
+        metrics.set_gauge(f"llm.{decision.model}.last_latency_ms", round(latency * 1000, 1))
+        p90, error_rate = self.health(decision.model)
+        if p90 is not None:
+            metrics.set_gauge(f"llm.{decision.model}.p90_latency_ms", round(p90 * 1000, 1))
+        metrics.set_gauge(f"llm.{decision.model}.error_rate", round(error_rate, 3))
+
+    def health(self, model: str) -> Tuple[Optional[float], float]:
+        """(latência p90 das chamadas bem-sucedidas, taxa de erro) na janela recente."""
+        cutoff = time.monotonic() - _WINDOW_SECONDS
+        with self._lock:
+            recent = [s for s in self._samples.get(model, ()) if s[0] >= cutoff]
+        if not recent:
+            return None, 0.0
+        latencies = sorted(latency for _, latency, ok in recent if ok)
+        error_rate = sum(1 for _, _, ok in recent if not ok) / len(recent)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))] if latencies else None
+        return p90, error_rate
+
+    def _healthy(self, model: str) -> bool:
+        p90, error_rate = self.health(model)
+        if error_rate > settings.llm_max_error_rate:
+            return False
+        return p90 is None or p90 <= settings.llm_latency_slo_seconds
+
+    def decide(self, endpoint: str, system: str, user_message: str, outputs: int = 1) -> RouteDecision:
+        """
+        Escolhe modelo/limites para uma chamada. `endpoint` é 'lesson' (JSON de aula) ou
+        'recommendation' (texto); `outputs` > 1 no modo de variantes.
+        """
+        prompt_tokens = estimate_tokens(system, user_message)
+        if endpoint == "recommendation":
+            base_tokens = settings.llm_recommendation_max_tokens
+        else:
+            base_tokens = settings.llm_lesson_max_tokens + settings.llm_variant_max_tokens * max(0, outputs - 1)
+
+        if not settings.llm_routing_enabled:
+            decision = RouteDecision(
+                endpoint, settings.openai_model, "default", None, settings.llm_max_timeout_seconds, "disabled",
+                prompt_tokens,
+            )
+        else:
+            large = prompt_tokens > settings.llm_small_prompt_tokens or outputs > 1
+            if endpoint == "recommendation" or not large:
+                tier, model, alternative = "fast", settings.llm_fast_model, settings.llm_capable_model
+                reason = "small-prompt" if endpoint != "recommendation" else "text-endpoint"
+            else:
+                tier, model, alternative = "capable", settings.llm_capable_model, settings.llm_fast_model
+                reason = "large-prompt"
+            if not self._healthy(model) and self._healthy(alternative):
+                tier = "fast" if tier == "capable" else "capable"
+                model, reason = alternative, f"{reason}+slo-fallback"
+            p90, _ = self.health(model)
+            timeout = max(settings.llm_latency_slo_seconds, (p90 or 0.0) * 1.5)
+            decision = RouteDecision(
+                endpoint, model, tier, base_tokens, min(timeout, settings.llm_max_timeout_seconds), reason,
+                prompt_tokens,
+            )
+        metrics.incr(f"llm.route.{endpoint}.{decision.tier}")
+        return decision
+
+
+llm_router = LLMRouter()
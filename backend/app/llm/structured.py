@@ -0,0 +1,172 @@
+"""
+Structured outputs for lesson generation: strict JSON Schema derived from Roteiro/Resumo,
+a tolerant parser that repairs truncated or trailing-garbage JSON, and helpers to detect
+and merge missing fields for a targeted follow-up.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from app.schemas.lesson import Resumo, Roteiro
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Listas que o prompt declara opcionais ("0-4 tópicos"): vazias não disparam follow-up.
+OPTIONAL_FIELDS = frozenset({"roteiro.topicos", "roteiro.exemplos"})
+
+
+def _strict(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Structured outputs (strict) exigem todas as propriedades em `required` e additionalProperties false.
+    schema = {k: v for k, v in schema.items() if k != "title"}
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["properties"] = {name: _strict(prop) for name, prop in schema["properties"].items()}
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    if isinstance(schema.get("items"), dict):
+        schema["items"] = _strict(schema["items"])
+    return schema
+
+
+def _variant_schema() -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {
+            "exemplos": {"type": "array", "items": {"type": "string"}},
+            "resumo_exemplo": {"type": "string"},
+        },
+    }
+
+
+def lesson_schema(variant_ids: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    JSON Schema estrito da saída de geração. No modo de variantes, `variantes` tem uma
+    propriedade por id de aluno (o modo estrito não aceita chaves livres).
+    """
+    properties: Dict[str, Any] = {
+        "roteiro": Roteiro.model_json_schema(),
+        "resumo": Resumo.model_json_schema(),
+    }
+    if variant_ids:
+        properties["variantes"] = {
+            "type": "object",
+            "properties": {str(aluno_id): _variant_schema() for aluno_id in variant_ids},
+        }
+    return _strict({"type": "object", "properties": properties})
+
+
+def response_format(schema: Dict[str, Any], name: str = "aula") -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def subschema(schema: Dict[str, Any], paths: Sequence[str]) -> Dict[str, Any]:
+    """Recorte do schema contendo apenas os caminhos `a.b.c` informados (para o follow-up)."""
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+
+    def _prune(node_schema: Dict[str, Any], node: Dict[str, Any]) -> Dict[str, Any]:
+        if not node:
+            return node_schema
+        props = {name: _prune(node_schema["properties"][name], child) for name, child in node.items()}
+        return {**node_schema, "properties": props, "required": list(props)}
+
+    return _prune(schema, tree)
+
+
+def missing_fields(
+    value: Any, schema: Dict[str, Any], prefix: str = "", optional: FrozenSet[str] = OPTIONAL_FIELDS
+) -> List[str]:
+    """
+    Caminhos `a.b` obrigatórios pelo schema que estão ausentes, nulos ou vazios em `value`.
+    Caminhos em `optional` só contam quando ausentes ou nulos (vazio é resposta válida).
+    """
+    missing: List[str] = []
+    for name, prop in schema.get("properties", {}).items():
+        path = f"{prefix}{name}"
+        child = value.get(name) if isinstance(value, dict) else None
+        if child is None or (path not in optional and child in ("", [], {})):
+            missing.append(path)
+        elif prop.get("type") == "object":
+            missing.extend(missing_fields(child, prop, path + ".", optional))
+    return missing
+
+
+def deep_merge(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa `base` com `extra` sem sobrescrever valores já preenchidos."""
+    merged = dict(base)
+    for key, value in extra.items():
+        current = merged.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = deep_merge(current, value)
+        elif current in (None, "", [], {}):
+            merged[key] = value
+    return merged
+
+
+def _closers(stack: Sequence[str]) -> str:
+    return "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def parse_json_lenient(content: Optional[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Lê o primeiro objeto JSON de `content` numa única varredura, tolerando cercas de
+    markdown, texto após o objeto e truncamento (string/arrays/objetos não fechados).
+    Retorna (objeto, reparado); objeto é None quando nada aproveitável foi encontrado.
+    """
+    if not content:
+        return None, False
+    start = content.find("{")
+    if start < 0:
+        return None, False
+    stack: List[str] = []
+    # Pontos de corte seguros: antes de uma vírgula ou logo após abrir um contêiner,
+    # com a pilha daquele momento; fechá-los sempre gera JSON sintaticamente válido.
+    cuts: List[Tuple[int, str]] = []
+    in_string = escaped = False
+    for i in range(start, len(content)):
+        ch = content[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            cuts.append((i + 1, _closers(stack)))
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                break
+            stack.pop()
+            if not stack:
+                try:
+                    parsed = json.loads(content[start : i + 1])
+                except ValueError:
+                    break
+                if not isinstance(parsed, dict):
+                    return None, False
+                return parsed, start > 0 or bool(content[i + 1 :].strip())
+        elif ch == ",":
+            cuts.append((i, _closers(stack)))
+
+    # Truncado (ou malformado): fecha os contêineres abertos. Uma string interrompida é
+    # descartada (valor parcial), e o campo volta como faltante para o follow-up.
+    candidates = []
+    if stack and not in_string:
+        candidates.append(content[start:].rstrip() + _closers(stack))
+    candidates.extend(content[start:pos] + closers for pos, closers in reversed(cuts))
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed, True
+    return None, False
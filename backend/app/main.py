@@ -1,18 +1,64 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import api_router
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.consistency import ReadYourWritesMiddleware
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.responses import FastJSONResponse
+from app.core.tracing import TracingMiddleware, exporter as span_exporter, tracing_enabled
+from app.db.db import get_engine
+from app.workers.change_events import change_hub
+from app.workers.prefetch import prefetch_scheduler
+from app.workers.usage_ledger import usage_ledger
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if settings.prefetch_enabled and get_engine() is not None:
+        tasks.append(asyncio.create_task(prefetch_scheduler.run()))
+    if settings.usage_ledger_enabled and get_engine() is not None:
+        tasks.append(asyncio.create_task(usage_ledger.run()))
+    if settings.events_enabled and get_engine() is not None:
+        tasks.append(asyncio.create_task(change_hub.run()))
+    if tracing_enabled():
+        tasks.append(asyncio.create_task(span_exporter.run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(title=settings.app_name, default_response_class=FastJSONResponse, lifespan=lifespan)
+    app.add_middleware(IdempotencyMiddleware)
+    if settings.sqlalchemy_read_url:
+        app.add_middleware(ReadYourWritesMiddleware)
+    if settings.compression_enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size,
+            gzip_level=settings.gzip_level,
+            brotli_quality=settings.brotli_quality,
+        )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.cors_origins,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Sem isto o navegador esconde do front-end os cabeçalhos de consistência, trace e cache.
+        expose_headers=["X-Read-Your-Writes", "X-Trace-Id", "ETag"],
     )
+    if tracing_enabled():
+        # Por último: é o middleware mais externo e o span raiz cobre toda a pilha.
+        app.add_middleware(TracingMiddleware)
     app.include_router(api_router)
     return app
 
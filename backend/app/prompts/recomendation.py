@@ -1,6 +1,9 @@
 
 from typing import Optional
 
+# Incrementar sempre que o texto do prompt mudar: invalida o cache de recomendações.
+RECOMMENDATION_PROMPT_VERSION = "1"
+
 
 def build_recommendation_prompt(observacoes_pais: str) -> str:
     """
@@ -0,0 +1,21 @@
+"""
+Persistence layer: module-level, parameter-stable SQL statements (stable text keeps
+psycopg's server-side prepared statements reusable) with explicit column lists and
+typed row mappers.
+"""
+from .students import (
+    StudentProfile,
+    get_student_profile,
+    get_student_profiles,
+    get_student_version,
+)
+from .turmas import (
+    Turma,
+    TurmaAluno,
+    find_turmas_by_name_or_year,
+    get_turma,
+    list_alunos_of_turmas,
+    list_turma_alunos_resumo,
+    list_turmas,
+    turmas_version,
+)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from typing import Any, List, Optional, TypedDict
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session
+
+
+class StudentProfile(TypedDict):
+    id: UUID
+    nome: str
+    interesse: Optional[str]
+    preferencia: Optional[str]
+    dificuldade: Optional[str]
+    laudo: Optional[str]
+    observacoes: Optional[str]
+    nivel_de_suporte: Optional[str]
+    descricao_do_aluno: Optional[str]
+    turma_id: Optional[UUID]
+    turma_nome: Optional[str]
+
+
+_PROFILE_COLUMNS = """
+    a.id,
+    a.nome,
+    a.interesse,
+    a.preferencia,
+    a.dificuldade,
+    a.laudo,
+    a.observacoes,
+    a.nivel_de_suporte,
+    a.descricao_do_aluno,
+    a.turma_id,
+    t.nome AS turma_nome
+"""
+
+STUDENT_PROFILE_SQL = text(
+    f"""
+    SELECT {_PROFILE_COLUMNS}
+    FROM public.alunos a
+    LEFT JOIN public.turmas t ON t.id = a.turma_id
+    WHERE a.id = CAST(:aluno_id AS UUID)
+    """
+)
+
+# Vários perfis numa consulta, na ordem dos ids pedidos.
+STUDENT_PROFILES_SQL = text(
+    f"""
+    SELECT {_PROFILE_COLUMNS}
+    FROM unnest(CAST(:aluno_ids AS UUID[])) WITH ORDINALITY AS ids(id, pos)
+    JOIN public.alunos a ON a.id = ids.id
+    LEFT JOIN public.turmas t ON t.id = a.turma_id
+    ORDER BY ids.pos
+    """
+)
+
+STUDENT_VERSION_SQL = text(
+    """
+    SELECT a.xmin::text AS aluno_version,
+           t.xmin::text AS turma_version
+    FROM public.alunos a
+    LEFT JOIN public.turmas t ON t.id = a.turma_id
+    WHERE a.id = CAST(:aluno_id AS UUID)
+    """
+)
+
+
+def _to_profile(row: RowMapping) -> StudentProfile:
+    return StudentProfile(
+        id=row["id"],
+        nome=row["nome"],
+        interesse=row["interesse"],
+        preferencia=row["preferencia"],
+        dificuldade=row["dificuldade"],
+        laudo=row["laudo"],
+        observacoes=row["observacoes"],
+        nivel_de_suporte=row["nivel_de_suporte"],
+        descricao_do_aluno=row["descricao_do_aluno"],
+        turma_id=row["turma_id"],
+        turma_nome=row["turma_nome"],
+    )
+
+
+def get_student_profile(db: Session, aluno_id: Any) -> Optional[StudentProfile]:
+    row = db.execute(STUDENT_PROFILE_SQL, {"aluno_id": str(aluno_id)}).mappings().first()
+    return _to_profile(row) if row else None
+
+
+def get_student_profiles(db: Session, aluno_ids: List[Any]) -> List[StudentProfile]:
+    """Perfis na ordem pedida, sem repetições; ids inexistentes são ignorados."""
+    ids = list(dict.fromkeys(str(i) for i in aluno_ids))
+    if not ids:
+        return []
+    return [_to_profile(r) for r in db.execute(STUDENT_PROFILES_SQL, {"aluno_ids": ids}).mappings()]
+
+
+def get_student_version(db: Session, aluno_id: Any) -> Optional[RowMapping]:
+    """(aluno_version, turma_version) via xmin, para ETag; None se o aluno não existe."""
+    return db.execute(STUDENT_VERSION_SQL, {"aluno_id": str(aluno_id)}).mappings().first()
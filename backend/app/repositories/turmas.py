@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from typing import Any, List, Optional, TypedDict
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session
+
+
+class Turma(TypedDict):
+    id: UUID
+    nome: str
+
+
+class TurmaAluno(TypedDict):
+    id: UUID
+    nome: str
+    interesse: Optional[str]
+    preferencia: Optional[str]
+    dificuldade: Optional[str]
+    laudo: Optional[str]
+    observacoes: Optional[str]
+    nivel_de_suporte: Optional[str]
+    descricao_do_aluno: Optional[str]
+
+
+TURMA_SQL = text(
+    """
+    SELECT t.id, t.nome
+    FROM public.turmas t
+    WHERE t.id = CAST(:turma_id AS UUID)
+    """
+)
+
+TURMAS_SQL = text(
+    """
+    SELECT t.id, t.nome
+    FROM public.turmas t
+    ORDER BY t.nome
+    """
+)
+
+TURMAS_VERSION_SQL = text(
+    """
+    SELECT count(*) AS total,
+           COALESCE(max(t.xmin::text::bigint), 0) AS version
+    FROM public.turmas t
+    """
+)
+
+# Filtros opcionais como parâmetros anuláveis: o texto do SQL é sempre o mesmo.
+TURMAS_BY_NAME_OR_YEAR_SQL = text(
+    """
+    SELECT t.id, t.nome
+    FROM public.turmas t
+    WHERE lower(t.nome) = :nome_exact
+       OR t.nome ILIKE :nome_like
+       OR (CAST(:ano_like AS TEXT) IS NOT NULL AND t.nome ILIKE CAST(:ano_like AS TEXT))
+       OR (CAST(:num AS TEXT) IS NOT NULL
+           AND regexp_replace(lower(t.nome), '[^0-9]', '', 'g') = CAST(:num AS TEXT))
+    ORDER BY t.nome
+    """
+)
+
+TURMA_ALUNOS_SQL = text(
+    """
+    SELECT a.id,
+           a.nome,
+           a.interesse,
+           a.preferencia,
+           a.dificuldade,
+           a.laudo,
+           a.observacoes,
+           a.nivel_de_suporte,
+           a.descricao_do_aluno
+    FROM public.alunos a
+    WHERE a.turma_id = ANY(CAST(:turma_ids AS UUID[]))
+    ORDER BY a.nome
+    """
+)
+
+TURMA_ALUNOS_RESUMO_SQL = text(
+    """
+    SELECT a.id, a.nome
+    FROM public.alunos a
+    WHERE a.turma_id = CAST(:turma_id AS UUID)
+    ORDER BY a.nome
+    """
+)
+
+
+def _to_turma(row: RowMapping) -> Turma:
+    return Turma(id=row["id"], nome=row["nome"])
+
+
+def _to_aluno(row: RowMapping) -> TurmaAluno:
+    return TurmaAluno(
+        id=row["id"],
+        nome=row["nome"],
+        interesse=row["interesse"],
+        preferencia=row["preferencia"],
+        dificuldade=row["dificuldade"],
+        laudo=row["laudo"],
+        observacoes=row["observacoes"],
+        nivel_de_suporte=row["nivel_de_suporte"],
+        descricao_do_aluno=row["descricao_do_aluno"],
+    )
+
+
+def get_turma(db: Session, turma_id: Any) -> Optional[Turma]:
+    row = db.execute(TURMA_SQL, {"turma_id": str(turma_id)}).mappings().first()
+    return _to_turma(row) if row else None
+
+
+def list_turmas(db: Session) -> List[Turma]:
+    return [_to_turma(r) for r in db.execute(TURMAS_SQL).mappings()]
+
+
+def turmas_version(db: Session) -> RowMapping:
+    """(total, version) das turmas via xmin, para ETag."""
+    return db.execute(TURMAS_VERSION_SQL).mappings().one()
+
+
+def find_turmas_by_name_or_year(
+    db: Session, nome: str, ano: Optional[str] = None, num: Optional[str] = None
+) -> List[Turma]:
+    """Turmas com nome igual/contendo `nome`, contendo o ano escolar `ano` ou com os mesmos dígitos `num`."""
+    rows = db.execute(
+        TURMAS_BY_NAME_OR_YEAR_SQL,
+        {
+            "nome_exact": nome.lower(),
+            "nome_like": f"%{nome}%",
+            "ano_like": f"%{ano}%" if ano else None,
+            "num": num,
+        },
+    ).mappings()
+    return [_to_turma(r) for r in rows]
+
+
+def list_alunos_of_turmas(db: Session, turma_ids: List[Any]) -> List[TurmaAluno]:
+    if not turma_ids:
+        return []
+    rows = db.execute(TURMA_ALUNOS_SQL, {"turma_ids": [str(t) for t in turma_ids]}).mappings()
+    return [_to_aluno(r) for r in rows]
+
+
+def list_turma_alunos_resumo(db: Session, turma_id: Any) -> List[RowMapping]:
+    """(id, nome) dos alunos da turma, por nome."""
+    return list(db.execute(TURMA_ALUNOS_RESUMO_SQL, {"turma_id": str(turma_id)}).mappings())
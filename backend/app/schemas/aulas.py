@@ -1,9 +1,12 @@
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 from pydantic import BaseModel
 from datetime import date
 
+from app.schemas.feedback import MaterialPerformance
+from app.schemas.material import Material
+
 
 class Aula(BaseModel):
     id: UUID
@@ -26,3 +29,60 @@ class AulaUpdate(BaseModel):
     data: Optional[date] = None
     upload_arquivo: Optional[Dict[str, Any]] = None
 
+
+class AulaResumo(BaseModel):
+    """Item enxuto de listagem: apenas os campos pedidos via view/fields."""
+    id: UUID
+    assunto: Optional[str] = None
+    descricao: Optional[str] = None
+    data: Optional[date] = None
+    turma_id: Optional[str] = None
+    turma_nome: Optional[str] = None
+    arquivo_nome: Optional[str] = None
+    upload_arquivo: Optional[Dict[str, Any]] = None
+
+
+class AulaResumoPage(BaseModel):
+    items: List[AulaResumo]
+    limit: int
+    offset: int
+
+
+class AulaCalendarioItem(BaseModel):
+    id: UUID
+    assunto: Optional[str] = None
+    turma_id: Optional[UUID] = None
+    turma_nome: Optional[str] = None
+    has_material: bool
+    has_feedback: bool
+
+
+class AulaCalendarioDia(BaseModel):
+    data: date
+    aulas: List[AulaCalendarioItem]
+
+
+class AulaCalendario(BaseModel):
+    """Aulas de um intervalo agrupadas por dia (GET /aulas?from=&to=)."""
+    inicio: date
+    fim: date
+    turma_id: Optional[UUID] = None
+    dias: List[AulaCalendarioDia]
+
+
+class AulaDashboardAluno(BaseModel):
+    id: UUID
+    nome: str
+
+
+class AulaDashboard(BaseModel):
+    """
+    Tudo que a página da aula precisa em uma chamada; seções fora de `include`
+    são omitidas.
+    """
+    aula: Aula
+    materiais: Optional[List[Material]] = None
+    desempenho: Optional[MaterialPerformance] = None
+    recomendacoes_ia: Optional[str] = None
+    feedback_material: Optional[str] = None
+    alunos: Optional[List[AulaDashboardAluno]] = None
@@ -34,6 +34,12 @@ class StudentFeedbackParsed(StudentFeedback):
     observacoes: Optional[str] = None
 
 
+class StudentFeedbackPage(BaseModel):
+    items: List[StudentFeedbackParsed]
+    limit: int
+    offset: int
+
+
 class StudentPerformanceEntry(BaseModel):
     aluno_id: UUID
     desempenho: List[str]
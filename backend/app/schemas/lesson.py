@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
+from uuid import UUID
 
 
 class GenerateMaterialRequest(BaseModel):
@@ -12,7 +13,9 @@ class GenerateMaterialRequest(BaseModel):
     hyperfocus: Optional[str] = None
     aluno_id: Optional[str] = None
     turma_id: Optional[str] = None
+    aula_id: Optional[str] = None
     arquivo_b64: Optional[str] = None
+    arquivo_sha256: Optional[str] = None  # referência a um arquivo já enviado (POST /aulas/{id}/arquivo)
 
 
 class Roteiro(BaseModel):
@@ -40,5 +43,27 @@ class GenerateMaterialResponse(BaseModel):
     roteiro: Roteiro
     resumo: Resumo
     source: str
+    pending_upgrade: Optional[str] = None
+    reused_from: Optional[UUID] = None
 
 
+class MaterialUpgrade(BaseModel):
+    """
+    Estado de uma geração escalonada: 'pending', 'ready' (com material) ou 'failed'
+    (o rascunho local já entregue permanece como resultado).
+    """
+    status: str
+    material: Optional[GenerateMaterialResponse] = None
+
+
+class GenerateVariantsRequest(GenerateMaterialRequest):
+    """Geração para vários alunos da turma em uma única chamada à LLM."""
+    aluno_ids: List[str]
+
+
+class MaterialVariant(GenerateMaterialResponse):
+    aluno_id: str
+
+
+class GenerateVariantsResponse(BaseModel):
+    variants: List[MaterialVariant]
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, RootModel
 
 from app.schemas.lesson import Roteiro, Resumo
 
@@ -18,6 +18,7 @@ class MaterialCreate(BaseModel):
     recomendacoes_ia: Optional[str] = None
     material_util: Optional[str] = None
     observacoes: Optional[str] = None
+    hyperfocus: Optional[str] = None
 
 
 class Material(MaterialCreate):
@@ -25,4 +26,33 @@ class Material(MaterialCreate):
     created_at: datetime
 
 
+class MaterialResumo(BaseModel):
+    """Versão enxuta de Material para listagens (view=summary ou fields=...)."""
+    id: UUID
+    aula_id: Optional[UUID] = None
+    source: Optional[str] = None
+    accepted: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    titulo: Optional[str] = None
+    resumo_texto: Optional[str] = None
+    material_util: Optional[str] = None
+    observacoes: Optional[str] = None
+    recomendacoes_ia: Optional[str] = None
+    roteiro: Optional[Roteiro] = None
+    resumo: Optional[Resumo] = None
+
 
+class MaterialResumoList(RootModel[List[MaterialResumo]]):
+    pass
+
+
+class SimilarMaterial(BaseModel):
+    """Material aceito parecido com o assunto informado (GET /material/similar)."""
+    material_id: UUID
+    aula_id: UUID
+    assunto: Optional[str] = None
+    hyperfocus: Optional[str] = None
+    material_util: Optional[str] = None
+    score: float
+    roteiro: Roteiro
+    resumo: Resumo
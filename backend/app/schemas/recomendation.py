@@ -1,6 +1,6 @@
 
 from uuid import UUID
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -15,4 +15,39 @@ class RecomendationResult(BaseModel):
     arrmd_id: UUID
     observacoes: str
     recomendacoes_ia: str
+    cached: bool = False
 
+
+
+class RecomendationBatchItem(BaseModel):
+    aluno_id: UUID
+    arrmd_id: UUID
+    observacoes: Optional[str] = None  # sem valor: usa as observações já salvas do aluno
+
+
+class RecomendationBatchCreate(BaseModel):
+    """Informe `turma_id` + `arrmd_id` (todos os alunos da turma) ou `items`."""
+    turma_id: Optional[UUID] = None
+    arrmd_id: Optional[UUID] = None
+    items: Optional[List[RecomendationBatchItem]] = None
+
+
+class RecomendationBatchStatus(BaseModel):
+    aluno_id: UUID
+    arrmd_id: UUID
+    status: str  # 'ok' | 'skipped' | 'error'
+    deduplicated: bool = False
+    cached: bool = False
+    elapsed_ms: float = 0.0
+    recomendacoes_ia: Optional[str] = None
+    erro: Optional[str] = None
+
+
+class RecomendationBatchResult(BaseModel):
+    total: int
+    generated: int
+    cached: int
+    deduplicated: int
+    errors: int
+    elapsed_ms: float
+    items: List[RecomendationBatchStatus]
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    tipo: str  # 'aula' | 'material'
+    id: UUID
+    aula_id: UUID
+    assunto: Optional[str] = None
+    data: Optional[str] = None
+    rank: float
+    snippet: str
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None
@@ -1,5 +1,5 @@
 from uuid import UUID
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 class Estudante(BaseModel):
@@ -19,3 +19,18 @@ class EstudanteUpdate(BaseModel):
     nome: Optional[str] = None
     serie_escolar: Optional[str] = None
     turma_id: Optional[UUID] = None
+
+
+class StudentImportRow(BaseModel):
+    linha: int
+    status: str  # 'inserted' | 'updated' | 'error'
+    aluno_id: Optional[UUID] = None
+    erro: Optional[str] = None
+
+
+class StudentImportReport(BaseModel):
+    total: int
+    inserted: int
+    updated: int
+    errors: int
+    rows: List[StudentImportRow]
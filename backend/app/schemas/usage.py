@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class UsageBucket(BaseModel):
+    chave: Optional[str] = None  # valor do agrupamento (dia, modelo, endpoint, turma ou aluno)
+    chamadas: int
+    cache_hits: int
+    erros: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    total_tokens: int
+    latencia_media_ms: Optional[float] = None
+    latencia_p95_ms: Optional[float] = None
+
+
+class UsageReport(BaseModel):
+    inicio: date
+    fim: date
+    group_by: str
+    total: UsageBucket
+    grupos: List[UsageBucket]
+
+
+class TurmaBudgetUpdate(BaseModel):
+    daily_tokens: Optional[int] = Field(None, ge=0)  # None remove o limite próprio da turma
+
+
+class TurmaBudget(BaseModel):
+    turma_id: UUID
+    daily_tokens: Optional[int] = None
+    usados_hoje: int
+    restantes: Optional[int] = None
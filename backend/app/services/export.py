@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import text
+
+from app.db.db import session_scope
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# Linhas buscadas por ida ao cursor do servidor e bytes acumulados antes de enviar um bloco.
+_YIELD_PER = 500
+_FLUSH_BYTES = 64 * 1024
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=_json_default)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_query_rows(sql: str, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Percorre o resultado com cursor do lado do servidor (yield_per), em sessão própria:
+    a sessão da requisição já foi fechada quando o corpo da resposta é enviado.
+    """
+    with session_scope() as db:
+        result = db.execute(text(sql), params, execution_options={"yield_per": _YIELD_PER})
+        for row in result.mappings():
+            yield dict(row)
+
+
+def _encode_rows(rows: Iterable[Dict[str, Any]], columns: Sequence[str], fmt: str) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")  # BOM: Excel reconhece UTF-8
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_csv_value(row.get(c)) for c in columns])
+            if buffer.tell() >= _FLUSH_BYTES:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for row in rows:
+            buffer.write(json.dumps({c: row.get(c) for c in columns}, ensure_ascii=False, default=_json_default))
+            buffer.write("\n")
+            if buffer.tell() >= _FLUSH_BYTES:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(
+    sql: str,
+    params: Dict[str, Any],
+    columns: Sequence[str],
+    fmt: str,
+    gzip: bool = False,
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Iterator[bytes]:
+    """
+    Gera o arquivo de exportação (CSV ou NDJSON, opcionalmente gzip) em blocos,
+    sem materializar o resultado em memória.
+    """
+    rows: Iterable[Dict[str, Any]] = iter_query_rows(sql, params)
+    if transform is not None:
+        rows = map(transform, rows)
+    chunks = _encode_rows(rows, columns, fmt)
+    return _gzip(chunks) if gzip else chunks
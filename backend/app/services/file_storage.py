@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class LocalFileStorage:
+    """
+    Armazenamento de arquivos em disco, endereçado pelo SHA-256 do conteúdo.
+    Conteúdos idênticos são gravados uma única vez (deduplicação).
+    Escritas são feitas em blocos e leituras via mmap, sem carregar o arquivo inteiro.
+    """
+
+    def __init__(self, root: str, chunk_size: int = 1024 * 1024, max_size: Optional[int] = None) -> None:
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError("Hash de arquivo inválido.")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        try:
+            return self.path_for(digest).is_file()
+        except ValueError:
+            return False
+
+    def size(self, digest: str) -> int:
+        return self.path_for(digest).stat().st_size
+
+    def _commit(self, tmp_path: str, digest: str) -> None:
+        final = self.path_for(digest)
+        if final.exists():
+            os.unlink(tmp_path)
+            return
+        final.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, final)
+
+    async def save_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """
+        Grava um fluxo de bytes em blocos e retorna (sha256, tamanho).
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if self.max_size is not None and size > self.max_size:
+                        raise FileTooLargeError()
+                    hasher.update(chunk)
+                    await run_in_threadpool(fh.write, chunk)
+            digest = hasher.hexdigest()
+            await run_in_threadpool(self._commit, tmp_path, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest, size
+
+    def save_bytes(self, data: bytes) -> Tuple[str, int]:
+        if self.max_size is not None and len(data) > self.max_size:
+            raise FileTooLargeError()
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            return digest, len(data)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                view = memoryview(data)
+                for start in range(0, len(data), self.chunk_size):
+                    fh.write(view[start:start + self.chunk_size])
+            self._commit(tmp_path, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest, len(data)
+
+    def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Itera o intervalo [start, end] (inclusivo) do arquivo em blocos de `chunk_size`.
+        """
+        path = self.path_for(digest)
+        with open(path, "rb") as fh:
+            total = os.fstat(fh.fileno()).st_size
+            if total == 0:
+                return
+            last = total - 1 if end is None else min(end, total - 1)
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                position = start
+                while position <= last:
+                    stop = min(position + self.chunk_size, last + 1)
+                    yield mm[position:stop]
+                    position = stop
+
+    def read_bytes(self, digest: str) -> bytes:
+        return b"".join(self.iter_range(digest))
+
+
+_storage: Optional[LocalFileStorage] = None
+
+
+def get_storage() -> LocalFileStorage:
+    global _storage
+    if _storage is None:
+        if settings.storage_backend != "local":
+            raise RuntimeError(f"Backend de armazenamento não suportado: {settings.storage_backend}")
+        _storage = LocalFileStorage(
+            settings.storage_dir,
+            chunk_size=settings.storage_chunk_size,
+            max_size=settings.storage_max_upload_bytes,
+        )
+    return _storage
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta um cabeçalho `Range: bytes=...` (um único intervalo).
+    Retorna None quando ausente e levanta ValueError quando não satisfazível.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Intervalo não suportado.")
+    first, _, last = spec.strip().partition("-")
+    if first == "":
+        if not last.isdigit() or int(last) == 0:
+            raise ValueError("Intervalo inválido.")
+        length = min(int(last), size)
+        return size - length, size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        raise ValueError("Intervalo inválido.")
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Intervalo não satisfazível.")
+    return start, min(end, size - 1)
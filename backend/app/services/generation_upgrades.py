@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import secrets
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.db import get_engine
+
+_PENDING = "pending"
+_READY = "ready"
+_FAILED = "failed"
+
+
+class GenerationUpgrades:
+    """
+    Acompanha gerações da LLM que continuam em segundo plano depois que a rota já
+    respondeu com o rascunho local (modo escalonado). Cada geração recebe um token
+    `pending_upgrade`; o resultado fica em memória e, com banco configurado, em
+    public.material_upgrades, para ser lido por qualquer worker.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    def track(self, task: "asyncio.Task[Optional[Dict[str, Any]]]") -> str:
+        """Registra uma task cujo resultado é um dict serializável em JSON (ou None)."""
+        token = secrets.token_urlsafe(16)
+        self._tasks[token] = task
+        metrics.incr("material_upgrade.started")
+        loop = asyncio.get_running_loop()
+        if get_engine() is not None:
+            loop.run_in_executor(None, self._store, token, _PENDING, None)
+
+        def _done(t: "asyncio.Task[Any]") -> None:
+            result = None if t.cancelled() or t.exception() is not None else t.result()
+            status = _READY if result is not None else _FAILED
+            metrics.incr(f"material_upgrade.{status}")
+            if get_engine() is not None:
+                loop.run_in_executor(None, self._store, token, status, result)
+            loop.call_later(settings.tiered_upgrade_ttl_seconds, self._tasks.pop, token, None)
+
+        task.add_done_callback(_done)
+        return token
+
+    async def get(self, token: str, wait: float = 0.0) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Retorna (status, resultado) ou None para token desconhecido.
+        Com `wait`, aguarda até esse tempo pela conclusão de uma geração local.
+        """
+        task = self._tasks.get(token)
+        if task is not None:
+            if not task.done() and wait > 0:
+                await asyncio.wait({task}, timeout=wait)
+            if not task.done():
+                return _PENDING, None
+            result = None if task.cancelled() or task.exception() is not None else task.result()
+            return (_READY, result) if result is not None else (_FAILED, None)
+        if get_engine() is None:
+            return None
+        row = await run_in_threadpool(self._load, token)
+        if row is None:
+            return None
+        return row["status"], row["result"]
+
+    @staticmethod
+    def _store(token: str, status: str, result: Optional[Dict[str, Any]]) -> None:
+        with get_engine().begin() as conn:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO public.material_upgrades (token, status, result, created_at)
+                    VALUES (:token, :status, CAST(:result AS JSONB), now())
+                    ON CONFLICT (token) DO UPDATE
+                    SET status = EXCLUDED.status, result = EXCLUDED.result
+                    WHERE public.material_upgrades.status = 'pending'
+                    """
+                ),
+                {"token": token, "status": status, "result": json.dumps(result) if result is not None else None},
+            )
+            conn.execute(
+                text("DELETE FROM public.material_upgrades WHERE created_at < now() - make_interval(secs => :ttl)"),
+                {"ttl": settings.tiered_upgrade_ttl_seconds},
+            )
+
+    @staticmethod
+    def _load(token: str) -> Optional[Dict[str, Any]]:
+        with get_engine().connect() as conn:
+            row = conn.execute(
+                text(
+                    """
+                    SELECT status, result
+                    FROM public.material_upgrades
+                    WHERE token = :token
+                      AND created_at >= now() - make_interval(secs => :ttl)
+                    """
+                ),
+                {"token": token, "ttl": settings.tiered_upgrade_ttl_seconds},
+            ).mappings().first()
+        return dict(row) if row else None
+
+
+async def race(
+    upstream: Awaitable[Optional[Dict[str, Any]]], window: float
+) -> Tuple[Optional[Dict[str, Any]], Optional["asyncio.Task[Optional[Dict[str, Any]]]"]]:
+    """
+    Dá à LLM até `window` segundos. Retorna (resultado, None) quando termina a tempo;
+    caso contrário (None, task), com a task ainda em execução.
+    """
+    task = asyncio.ensure_future(upstream)
+    done, _ = await asyncio.wait({task}, timeout=max(window, 0.0))
+    if task in done:
+        return (None if task.exception() is not None else task.result()), None
+    return None, task
+
+
+generation_upgrades = GenerationUpgrades()
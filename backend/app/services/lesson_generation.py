@@ -1,17 +1,36 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import re
+import time
 
 import httpx
 from sqlalchemy import text
-from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tracing import SPAN_KIND_CLIENT, span, traced
+from app.repositories import students as students_repo, turmas as turmas_repo
 from app.schemas.lesson import GenerateMaterialRequest, Roteiro, Resumo
-from app.llm.prompts import chat_system_prompt, build_user_message
+from app.llm.prompts import chat_system_prompt, build_llm_payload, build_user_message, payload_fingerprint
+from app.llm.routing import RouteDecision, llm_router, model_key, usage_attributes
+from app.llm.structured import (
+    deep_merge,
+    lesson_schema,
+    missing_fields,
+    parse_json_lenient,
+    response_format as structured_response_format,
+    subschema,
+)
+from app.services.generation_upgrades import generation_upgrades, race
+from app.services.similarity import similarity_index
+from app.services.singleflight import SingleFlight
+from app.workers.usage_ledger import usage_ledger
+
+_generation_flight = SingleFlight("material_generate")
 
 
 def _select_hyperfocus(student_profile: Optional[Dict[str, Any]], explicit_hyperfocus: Optional[str]) -> Optional[str]:
@@ -42,99 +61,34 @@ def _supports_from_level(nivel_de_suporte: Optional[str]) -> list[str]:
     return base
 
 
+@traced()
 def fetch_student_profile(db: Optional[Session], aluno_id: Optional[str]) -> Optional[Dict[str, Any]]:
     if db is None or not aluno_id:
         return None
-    row: Optional[Row] = db.execute(
-        text(
-            """
-            SELECT a.id,
-                   a.nome,
-                   a.interesse,
-                   a.preferencia,
-                   a.dificuldade,
-                   a.laudo,
-                   a.observacoes,
-                   a.nivel_de_suporte,
-                   a.descricao_do_aluno,
-                   a.turma_id,
-                   t.nome AS turma_nome
-            FROM public.alunos a
-            LEFT JOIN public.turmas t ON t.id = a.turma_id
-            WHERE a.id = :aluno_id
-            """
-        ),
-        {"aluno_id": aluno_id},
-    ).mappings().first()
-    if not row:
-        return None
-    return {
-        "id": row.get("id"),
-        "nome": row.get("nome"),
-        "interesse": row.get("interesse"),
-        "preferencia": row.get("preferencia"),
-        "dificuldade": row.get("dificuldade"),
-        "laudo": row.get("laudo"),
-        "observacoes": row.get("observacoes"),
-        "nivel_de_suporte": row.get("nivel_de_suporte"),
-        "descricao_do_aluno": row.get("descricao_do_aluno"),
-        "turma_id": row.get("turma_id"),
-        "turma_nome": row.get("turma_nome"),
-    }
+    profile = students_repo.get_student_profile(db, aluno_id)
+    return dict(profile) if profile else None
+
 
+@traced()
+def fetch_student_profiles(db: Optional[Session], aluno_ids: List[str]) -> List[Dict[str, Any]]:
+    """Perfis de vários alunos, na ordem pedida (ids inexistentes são ignorados)."""
+    if db is None:
+        return []
+    return [dict(p) for p in students_repo.get_student_profiles(db, aluno_ids)]
 
+
+@traced()
 def fetch_turma_context(db: Optional[Session], turma_id: Optional[str]) -> Optional[Dict[str, Any]]:
     """
     Retorna contexto da turma e perfis básicos dos alunos desta turma.
     """
     if db is None or not turma_id:
         return None
-    turma_row: Optional[Row] = db.execute(
-        text(
-            """
-            SELECT t.id, t.nome
-            FROM public.turmas t
-            WHERE t.id = :id
-            """
-        ),
-        {"id": turma_id},
-    ).mappings().first()
-    if not turma_row:
+    turma = turmas_repo.get_turma(db, turma_id)
+    if not turma:
         return None
-    alunos_rows = db.execute(
-        text(
-            """
-            SELECT a.id,
-                   a.nome,
-                   a.interesse,
-                   a.preferencia,
-                   a.dificuldade,
-                   a.laudo,
-                   a.observacoes,
-                   a.nivel_de_suporte,
-                   a.descricao_do_aluno
-            FROM public.alunos a
-            WHERE a.turma_id = :turma_id
-            ORDER BY a.nome
-            """
-        ),
-        {"turma_id": turma_id},
-    ).mappings().all()
-    alunos: List[Dict[str, Any]] = [
-        {
-            "id": r.get("id"),
-            "nome": r.get("nome"),
-            "interesse": r.get("interesse"),
-            "preferencia": r.get("preferencia"),
-            "dificuldade": r.get("dificuldade"),
-            "laudo": r.get("laudo"),
-            "observacoes": r.get("observacoes"),
-            "nivel_de_suporte": r.get("nivel_de_suporte"),
-            "descricao_do_aluno": r.get("descricao_do_aluno"),
-        }
-        for r in alunos_rows
-    ]
-    return {"turma_id": turma_row.get("id"), "turma_nome": turma_row.get("nome"), "alunos": alunos}
+    alunos = [dict(a) for a in turmas_repo.list_alunos_of_turmas(db, [turma["id"]])]
+    return {"turma_id": turma["id"], "turma_nome": turma["nome"], "alunos": alunos}
 
 
 def _extract_ano_from_text(turma_text: str) -> Optional[str]:
@@ -153,6 +107,7 @@ def _extract_ano_from_text(turma_text: str) -> Optional[str]:
     return None
 
 
+@traced()
 def fetch_turma_context_by_name_or_year(db: Optional[Session], turma_text: Optional[str]) -> Optional[Dict[str, Any]]:
     """
     Busca contexto de turma usando o nome livre informado ou o ano escolar extraído do texto.
@@ -163,67 +118,129 @@ def fetch_turma_context_by_name_or_year(db: Optional[Session], turma_text: Optio
     ano = _extract_ano_from_text(turma_text)
     num_match = re.search(r"\d+", turma_text)
     num = num_match.group(0) if num_match else None
-    turmas_rows = db.execute(
+    turmas = turmas_repo.find_turmas_by_name_or_year(db, turma_text, ano=ano, num=num)
+    if not turmas:
+        return None
+    alunos = [dict(a) for a in turmas_repo.list_alunos_of_turmas(db, [t["id"] for t in turmas])]
+    nomes = [t["nome"] for t in turmas if t["nome"]]
+    return {"turma_id": None, "turma_nome": ", ".join(nomes), "alunos": alunos}
+
+@traced()
+def resolve_generation_context(
+    db: Optional[Session], req: GenerateMaterialRequest
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Carrega (turma_context, student_profile) para uma geração. Sem aluno explícito,
+    usa o primeiro aluno da turma com interesse/preferência informados.
+    """
+    turma_ctx = fetch_turma_context(db, req.turma_id) or fetch_turma_context_by_name_or_year(db, req.turma)
+    student = fetch_student_profile(db, req.aluno_id)
+    if student is None and turma_ctx and (alunos := turma_ctx.get("alunos")):
+        for a in alunos:
+            if (a.get("interesse") or a.get("preferencia")):
+                student = {
+                    "id": a.get("id"),
+                    "nome": a.get("nome"),
+                    "interesse": a.get("interesse"),
+                    "preferencia": a.get("preferencia"),
+                    "nivel_de_suporte": a.get("nivel_de_suporte"),
+                    "descricao_do_aluno": a.get("descricao_do_aluno"),
+                    "turma_id": req.turma_id,
+                    "turma_nome": turma_ctx.get("turma_nome"),
+                }
+                break
+    return turma_ctx, student
+
+
+# Campos de texto livre que não mudam o conteúdo gerado de forma relevante
+# (a turma já está em turma_context); ignorados ao casar rascunhos pré-gerados.
+_VOLATILE_PAYLOAD_KEYS = ("data", "turma")
+
+
+def generation_fingerprint(
+    req: GenerateMaterialRequest,
+    student_profile: Optional[Dict[str, Any]] = None,
+    turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
+    stable: bool = False,
+) -> str:
+    """
+    Hash das entradas da geração (payload canônico + modelo). Com `stable=True`,
+    campos voláteis são ignorados, para casar rascunhos pré-gerados.
+    """
+    payload = build_llm_payload(req, student_profile, turma_context, arquivo_digest)
+    if stable:
+        payload = {k: v for k, v in payload.items() if k not in _VOLATILE_PAYLOAD_KEYS}
+    return payload_fingerprint({"model": model_key(), "temperature": settings.openai_temperature, "payload": payload})
+
+
+@traced()
+def find_prefetched_draft(db: Optional[Session], aula_id: Optional[str], input_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Rascunho pré-gerado (accepted = false) desta aula cujas entradas ainda coincidem.
+    """
+    if db is None or not aula_id:
+        return None
+    row = db.execute(
         text(
             """
-            SELECT t.id, t.nome
-            FROM public.turmas t
-            WHERE lower(t.nome) = :nome_exact
-               OR t.nome ILIKE :nome_like
-               {ano_filter}
-               {num_filter}
-            ORDER BY t.nome
-            """.format(
-                ano_filter="OR t.nome ILIKE :ano_like" if ano else "",
-                num_filter="OR regexp_replace(lower(t.nome), '[^0-9]', '', 'g') = :num" if num else "",
-            )
+            SELECT roteiro, resumo
+            FROM public.arrmd_material
+            WHERE aula_id = :aula_id
+              AND accepted = false
+              AND input_hash = :input_hash
+            ORDER BY created_at DESC
+            LIMIT 1
+            """
         ),
-        {
-            "nome_exact": turma_text.lower(),
-            "nome_like": f"%{turma_text}%",
-            **({"ano_like": f"%{ano}%"} if ano else {}),
-            **({"num": num} if num else {}),
-        },
-    ).mappings().all()
-    if not turmas_rows:
+        {"aula_id": aula_id, "input_hash": input_hash},
+    ).mappings().first()
+    if not row:
         return None
-    turma_ids = [r.get("id") for r in turmas_rows if r.get("id")]
-    alunos_rows = db.execute(
+    return _decode_generation({"roteiro": row["roteiro"], "resumo": row["resumo"]})
+
+
+@traced()
+def save_prefetched_draft(db: Session, aula_id: str, result: Dict[str, Any], input_hash: str) -> None:
+    db.execute(
         text(
             """
-            SELECT a.id,
-                   a.nome,
-                   a.interesse,
-                   a.preferencia,
-                   a.dificuldade,
-                   a.laudo,
-                   a.observacoes,
-                   a.nivel_de_suporte,
-                   a.descricao_do_aluno
-            FROM public.alunos a
-            WHERE a.turma_id = ANY(:ids)
-            ORDER BY a.nome
+            INSERT INTO public.arrmd_material (aula_id, roteiro, resumo, source, accepted, input_hash)
+            VALUES (:aula_id, :roteiro, :resumo, 'prefetch', false, :input_hash)
             """
         ),
-        {"ids": turma_ids},
-    ).mappings().all()
-    alunos: List[Dict[str, Any]] = [
         {
-            "id": r.get("id"),
-            "nome": r.get("nome"),
-            "interesse": r.get("interesse"),
-            "preferencia": r.get("preferencia"),
-            "dificuldade": r.get("dificuldade"),
-            "laudo": r.get("laudo"),
-            "observacoes": r.get("observacoes"),
-            "nivel_de_suporte": r.get("nivel_de_suporte"),
-            "descricao_do_aluno": r.get("descricao_do_aluno"),
-        }
-        for r in alunos_rows
-    ]
-    nomes = [r.get("nome") for r in turmas_rows if r.get("nome")]
-    return {"turma_id": None, "turma_nome": ", ".join(nomes), "alunos": alunos}
+            "aula_id": aula_id,
+            "roteiro": json.dumps(result["roteiro"].model_dump()),
+            "resumo": json.dumps(result["resumo"].model_dump()),
+            "input_hash": input_hash,
+        },
+    )
+    db.commit()
 
+
+@traced()
+def find_reusable_material(
+    db: Optional[Session],
+    req: GenerateMaterialRequest,
+    student_profile: Optional[Dict[str, Any]],
+    threshold: float,
+) -> Optional[Dict[str, Any]]:
+    """
+    Material aceito e bem avaliado cujo assunto/descrição/hiperfoco tem similaridade
+    >= threshold com o pedido; evita uma chamada à LLM em conteúdos recorrentes.
+    """
+    if db is None:
+        return None
+    hyperfocus = _select_hyperfocus(student_profile, req.hyperfocus)
+    for match in similarity_index.find_similar(db, req.assunto, req.descricao, hyperfocus, limit=3, min_score=threshold):
+        if match["rating"] >= settings.similarity_reuse_min_rating:
+            decoded = _decode_generation({"roteiro": match["roteiro"] or {}, "resumo": match["resumo"] or {}})
+            return {**decoded, "reused_from": match["id"]}
+    return None
+
+
+@traced()
 def local_generate(req: GenerateMaterialRequest, student_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Geração local mais imersiva e personalizada quando a LLM estiver indisponível.
@@ -290,65 +307,243 @@ def local_generate(req: GenerateMaterialRequest, student_profile: Optional[Dict[
     return {"roteiro": roteiro, "resumo": resumo}
 
 
+async def _completion(
+    decision: RouteDecision, messages: List[Dict[str, str]], response_format: Dict[str, Any]
+) -> Optional[str]:
+    """Uma chamada a chat/completions; retorna o conteúdo (possivelmente truncado) ou None."""
+    body: Dict[str, Any] = {
+        "model": decision.model,
+        "temperature": settings.openai_temperature,
+        "response_format": response_format,
+        "messages": messages,
+    }
+    if decision.max_tokens:
+        body["max_tokens"] = decision.max_tokens
+    started = time.perf_counter()
+    with span("llm.chat_completions", SPAN_KIND_CLIENT, **decision.trace_attributes()) as llm_span:
+        try:
+            async with httpx.AsyncClient(timeout=decision.timeout) as client:
+                r = await client.post(
+                    "https://api.openai.com/v1/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {settings.openai_api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    json=body,
+                )
+            r.raise_for_status()
+            data = r.json()
+            choice = data.get("choices", [{}])[0]
+        except Exception as exc:
+            if llm_span is not None:
+                llm_span.error = type(exc).__name__
+            llm_router.record(decision, time.perf_counter() - started, ok=False)
+            usage_ledger.record(decision.endpoint, decision.model, latency=time.perf_counter() - started, ok=False)
+            return None
+        if llm_span is not None:
+            llm_span.set(**usage_attributes(data.get("usage")), **{"llm.finish_reason": choice.get("finish_reason")})
+    latency = time.perf_counter() - started
+    llm_router.record(decision, latency, ok=True)
+    usage_ledger.record(decision.endpoint, decision.model, data.get("usage"), latency)
+    if choice.get("finish_reason") == "length":
+        metrics.incr("llm.lesson.truncated")
+    return choice.get("message", {}).get("content") or None
+
+
+def _lesson_response_format(schema: Dict[str, Any]) -> Dict[str, Any]:
+    if settings.llm_structured_outputs:
+        return structured_response_format(schema)
+    return {"type": "json_object"}
+
+
+@traced()
+async def _chat_json(
+    user_message: str, variant_ids: Optional[List[str]] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[RouteDecision]]:
+    """
+    Uma completion JSON com o prompt de sistema das aulas, modelo/limites escolhidos por
+    llm_router e o schema estrito de Roteiro/Resumo. A resposta é lida de forma tolerante
+    (JSON truncado ou com lixo ao final); se faltarem campos, uma segunda chamada pede
+    apenas esses campos. Retorna (json, decisão); json é None se nada for aproveitável.
+    """
+    if not settings.openai_api_key:
+        return None, None
+    system = chat_system_prompt()
+    decision = llm_router.decide("lesson", system, user_message, max(1, len(variant_ids or ())))
+    schema = lesson_schema(variant_ids)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user_message},
+    ]
+    content = await _completion(decision, messages, _lesson_response_format(schema))
+    with span("llm.parse_json"):
+        parsed, repaired = parse_json_lenient(content)
+    if repaired:
+        metrics.incr("llm.lesson.repaired")
+    if content is not None and parsed is None:
+        metrics.incr("llm.lesson.unparseable")
+
+    missing = missing_fields(parsed or {}, schema)
+    if content is not None and missing and settings.llm_followup_enabled:
+        metrics.incr("llm.lesson.followups")
+        followup = [
+            *messages,
+            {"role": "assistant", "content": content},
+            {
+                "role": "user",
+                "content": (
+                    "A resposta anterior ficou incompleta. Retorne APENAS um JSON com os campos faltantes "
+                    f"({', '.join(missing)}), mantendo o mesmo formato e o restante do conteúdo já gerado."
+                ),
+            },
+        ]
+        extra, _ = parse_json_lenient(
+            await _completion(decision, followup, _lesson_response_format(subschema(schema, missing)))
+        )
+        if extra:
+            parsed = deep_merge(parsed or {}, extra)
+            if not missing_fields(parsed, schema):
+                metrics.incr("llm.lesson.followups_completed")
+    return parsed, decision
+
+
+def _ensure_list(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+@traced("lesson_generation.validate")
+def _parse_generation(parsed: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not parsed or not all(k in parsed for k in ("roteiro", "resumo")):
+        return None
+    roteiro_obj = parsed["roteiro"] if isinstance(parsed["roteiro"], dict) else {}
+    resumo_obj = parsed["resumo"] if isinstance(parsed["resumo"], dict) else {}
+    roteiro = Roteiro(
+        topicos=_ensure_list(roteiro_obj.get("topicos")),
+        falas=_ensure_list(roteiro_obj.get("falas")),
+        exemplos=_ensure_list(roteiro_obj.get("exemplos")),
+    )
+    resumo = Resumo(
+        texto=str(resumo_obj.get("texto") or ""),
+        exemplo=str(resumo_obj.get("exemplo") or ""),
+    )
+    return {"roteiro": roteiro, "resumo": resumo}
+
+
+@traced()
 async def openai_generate(
     req: GenerateMaterialRequest,
     student_profile: Optional[Dict[str, Any]] = None,
     turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
 ) -> Optional[Dict[str, Any]]:
-    if not settings.openai_api_key:
+    with span("prompt.build"):
+        user_message = build_user_message(req, student_profile, turma_context, arquivo_digest)
+    parsed, decision = await _chat_json(user_message)
+    result = _parse_generation(parsed)
+    if decision is not None and result is None:
+        metrics.incr("llm.lesson.discarded")
+    return {**result, "source": decision.source} if result is not None else None
+
+
+@traced()
+async def openai_generate_variants(
+    req: GenerateMaterialRequest,
+    students: List[Dict[str, Any]],
+    turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Uma única completion para vários alunos: roteiro/resumo compartilhados e exemplos
+    por aluno. Retorna {aluno_id: {"roteiro", "resumo"}}; alunos sem variante recebem
+    a versão compartilhada.
+    """
+    with span("prompt.build"):
+        user_message = build_user_message(req, None, turma_context, arquivo_digest, variant_students=students)
+    parsed, decision = await _chat_json(
+        user_message,
+        variant_ids=[str(student["id"]) for student in students],
+    )
+    shared = _parse_generation(parsed)
+    if shared is None:
         return None
+    variantes = parsed.get("variantes") if isinstance(parsed.get("variantes"), dict) else {}
+    results: Dict[str, Dict[str, Any]] = {}
+    for student in students:
+        aluno_id = str(student["id"])
+        variant = variantes.get(aluno_id) if isinstance(variantes.get(aluno_id), dict) else {}
+        exemplos = _ensure_list(variant.get("exemplos")) or shared["roteiro"].exemplos
+        results[aluno_id] = {
+            "roteiro": shared["roteiro"].model_copy(update={"exemplos": exemplos}),
+            "resumo": shared["resumo"].model_copy(
+                update={"exemplo": str(variant.get("resumo_exemplo") or shared["resumo"].exemplo)}
+            ),
+            "source": decision.source,
+        }
+    return results
 
-    system = chat_system_prompt()
 
-    user_message = build_user_message(req, student_profile, turma_context)
-
-    try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.openai_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": settings.openai_model,
-                    "temperature": settings.openai_temperature,
-                    "response_format": {"type": "json_object"},
-                    "messages": [
-                        {"role": "system", "content": system},
-                        {"role": "user", "content": user_message},
-                    ],
-                },
-            )
-        r.raise_for_status()
-        data = r.json()
-        content = (
-            data.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "{}")
-        )
-        parsed = json.loads(content)  
-        if not all(k in parsed for k in ("roteiro", "resumo")):
-            return None
-        roteiro_obj = parsed["roteiro"] or {}
-        resumo_obj = parsed["resumo"] or {}
-        def _ensure_list(value) -> list[str]:
-            if value is None:
-                return []
-            if isinstance(value, list):
-                return [str(v) for v in value]
-            return [str(value)]
-        roteiro = Roteiro(
-            topicos=_ensure_list(roteiro_obj.get("topicos")),
-            falas=_ensure_list(roteiro_obj.get("falas")),
-            exemplos=_ensure_list(roteiro_obj.get("exemplos")),
-        )
-        resumo = Resumo(
-            texto=resumo_obj.get("texto", ""),
-            exemplo=resumo_obj.get("exemplo", ""),
-        )
-        return {"roteiro": roteiro, "resumo": resumo}
-    except Exception:
+def _encode_generation(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if result is None:
         return None
+    encoded = {"roteiro": result["roteiro"].model_dump(), "resumo": result["resumo"].model_dump()}
+    if "source" in result:
+        encoded["source"] = result["source"]
+    return encoded
+
+
+def _decode_generation(value: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if value is None:
+        return None
+    decoded = {"roteiro": Roteiro(**value["roteiro"]), "resumo": Resumo(**value["resumo"])}
+    if "source" in value:
+        decoded["source"] = value["source"]
+    return decoded
+
+
+@traced()
+async def coalesced_openai_generate(
+    req: GenerateMaterialRequest,
+    student_profile: Optional[Dict[str, Any]] = None,
+    turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    openai_generate com coalescência: requisições concorrentes com o mesmo payload
+    canônico (e mesmo modelo) compartilham uma única chamada à LLM.
+    """
+    key = generation_fingerprint(req, student_profile, turma_context, arquivo_digest)
+    return await _generation_flight.do(
+        key,
+        lambda: openai_generate(req, student_profile, turma_context, arquivo_digest),
+        encode=_encode_generation,
+        decode=_decode_generation,
+    )
+
+
+@traced()
+async def tiered_generate(
+    req: GenerateMaterialRequest,
+    student_profile: Optional[Dict[str, Any]] = None,
+    turma_context: Optional[Dict[str, Any]] = None,
+    arquivo_digest: Optional[str] = None,
+    window: Optional[float] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Modo escalonado: espera a LLM por até `window` segundos. Retorna (resultado, None)
+    quando ela termina a tempo; senão (None, token) e a geração segue em segundo
+    plano, consultável por GET /material/generate/upgrades/{token}.
+    """
+    upstream = coalesced_openai_generate(req, student_profile, turma_context, arquivo_digest)
+    result, pending = await race(upstream, settings.tiered_race_window_seconds if window is None else window)
+    if pending is None:
+        return result, None
 
+    async def _encoded() -> Optional[Dict[str, Any]]:
+        encoded = _encode_generation(await pending)
+        return {"source": "openai", **encoded} if encoded is not None else None
 
+    return None, generation_upgrades.track(asyncio.ensure_future(_encoded()))
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import unicodedata
+from typing import Dict, Iterable, Mapping
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.llm.routing import model_key
+from app.prompts.recomendation import RECOMMENDATION_PROMPT_VERSION
+
+_last_eviction = 0.0
+
+
+def normalize_observacoes(observacoes: str) -> str:
+    """Forma canônica das observações: Unicode NFC, minúsculas e espaços colapsados."""
+    return " ".join(unicodedata.normalize("NFC", observacoes).casefold().split())
+
+
+def cache_key(observacoes: str) -> str:
+    """Hash das observações normalizadas + versão do prompt + modelo(s) roteado(s)/temperatura."""
+    raw = json.dumps(
+        {
+            "observacoes": normalize_observacoes(observacoes),
+            "prompt_version": RECOMMENDATION_PROMPT_VERSION,
+            "model": model_key(),
+            "temperature": settings.openai_temperature,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_many(db: Session, keys: Iterable[str]) -> Dict[str, str]:
+    """
+    Busca as chaves em public.recommendation_cache, marcando uso (LRU) na mesma
+    instrução. Entradas vencidas (TTL) são ignoradas.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    rows = db.execute(
+        text(
+            """
+            UPDATE public.recommendation_cache
+            SET last_used_at = now(), hits = hits + 1
+            WHERE key = ANY(:keys)
+              AND created_at >= now() - make_interval(secs => :ttl)
+            RETURNING key, recomendacoes
+            """
+        ),
+        {"keys": keys, "ttl": settings.recomendation_cache_ttl_seconds},
+    ).all()
+    db.commit()
+    found = {r[0]: r[1] for r in rows}
+    metrics.incr("recomendation_cache.hits", len(found))
+    metrics.incr("recomendation_cache.misses", len(keys) - len(found))
+    return found
+
+
+def put_many(db: Session, entries: Mapping[str, str]) -> None:
+    """Grava (ou renova) entradas; o commit fica a cargo do chamador."""
+    for key, recomendacoes in entries.items():
+        db.execute(
+            text(
+                """
+                INSERT INTO public.recommendation_cache (key, recomendacoes, model, prompt_version)
+                VALUES (:key, :recomendacoes, :model, :prompt_version)
+                ON CONFLICT (key) DO UPDATE
+                SET recomendacoes = EXCLUDED.recomendacoes,
+                    created_at = now(),
+                    last_used_at = now()
+                """
+            ),
+            {
+                "key": key,
+                "recomendacoes": recomendacoes,
+                "model": model_key(),
+                "prompt_version": RECOMMENDATION_PROMPT_VERSION,
+            },
+        )
+    if entries:
+        _evict(db)
+
+
+def _evict(db: Session) -> None:
+    """Remove entradas vencidas e, acima do limite, as menos usadas recentemente."""
+    global _last_eviction
+    now = time.monotonic()
+    if now - _last_eviction < settings.recomendation_cache_eviction_interval_seconds:
+        return
+    _last_eviction = now
+    evicted = db.execute(
+        text(
+            """
+            DELETE FROM public.recommendation_cache
+            WHERE created_at < now() - make_interval(secs => :ttl)
+               OR key IN (
+                   SELECT key
+                   FROM public.recommendation_cache
+                   ORDER BY last_used_at DESC
+                   OFFSET :max_entries
+               )
+            """
+        ),
+        {"ttl": settings.recomendation_cache_ttl_seconds, "max_entries": settings.recomendation_cache_max_entries},
+    ).rowcount
+    if evicted:
+        metrics.incr("recomendation_cache.evicted", evicted)
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Espaço de hashing dos termos (feature hashing): vetores esparsos de tamanho limitado.
+_HASH_BUCKETS = 1 << 20
+
+_STOPWORDS = frozenset(
+    """
+    a ao aos as com como da das de do dos e em entre na nas no nos o os ou para pela pelas pelo pelos
+    por que se sem sob sobre um uma umas uns sua suas seu seus ser sao esta este isso aula aulas
+    """.split()
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Peso relativo de cada campo no vetor do documento.
+_FIELD_WEIGHTS = {"assunto": 2.0, "descricao": 1.0, "hyperfocus": 1.0}
+# Materiais indexados por lote (e por commit) no backfill.
+_BACKFILL_BATCH = 500
+
+# Nota usada na ordenação a partir de arrmd_material.material_util (None = ainda sem avaliação).
+MATERIAL_UTIL_SCORES = {"muito_util": 1.0, "util": 0.6, None: 0.5, "pouco_util": 0.0}
+
+
+def _strip_accents(value: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c))
+
+
+def _stem(word: str) -> str:
+    # Redução mínima de plurais do português ("frações" -> "fracao", "ciclos" -> "ciclo").
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-3] + "ao"
+    if len(word) > 4 and word.endswith("aes"):
+        return word[:-3] + "ao"
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    words = _WORD_RE.findall(_strip_accents(value.lower()))
+    return [_stem(w) for w in words if len(w) > 2 and w not in _STOPWORDS]
+
+
+def _bucket(field: str, term: str) -> int:
+    digest = hashlib.blake2b(f"{field}:{term}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % _HASH_BUCKETS
+
+
+def hashed_terms(assunto: Optional[str], descricao: Optional[str], hyperfocus: Optional[str]) -> Dict[int, float]:
+    """
+    Frequências de termos (log-escaladas e ponderadas por campo) em buckets de hashing.
+    O hiperfoco usa um espaço de termos próprio, para não se confundir com o assunto.
+    """
+    counts: Counter = Counter()
+    for field, value in (("assunto", assunto), ("descricao", descricao), ("hyperfocus", hyperfocus)):
+        for term in tokenize(value):
+            counts[(field if field == "hyperfocus" else "t", term, field)] += 1
+    terms: Dict[int, float] = {}
+    for (space, term, field), n in counts.items():
+        bucket = _bucket(space, term)
+        terms[bucket] = terms.get(bucket, 0.0) + _FIELD_WEIGHTS[field] * (1.0 + math.log(n))
+    return terms
+
+
+class SimilarityIndex:
+    """
+    Índice TF-IDF com vetores de termos hasheados sobre materiais aceitos.
+    Os vetores ficam em public.material_index (atualizado em accept_material) e são
+    carregados em memória com um índice invertido; a releitura só acontece quando a
+    versão da tabela (contagem + última atualização) muda.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict[int, float]] = {}
+        self._postings: Dict[int, Set[str]] = {}
+        self._version: Optional[Tuple[Any, ...]] = None
+        self._checked_at = 0.0
+
+    # --- persistência -------------------------------------------------------
+
+    def add(
+        self,
+        db: Session,
+        material_id: str,
+        aula_id: str,
+        assunto: Optional[str],
+        descricao: Optional[str],
+        hyperfocus: Optional[str] = None,
+    ) -> bool:
+        """
+        Indexa (ou reindexa) um material aceito; o commit fica a cargo do chamador.
+        Retorna False quando o texto não tem termos indexáveis.
+        """
+        terms = hashed_terms(assunto, descricao, hyperfocus)
+        if not terms:
+            return False
+        db.execute(
+            text(
+                """
+                INSERT INTO public.material_index (material_id, aula_id, hyperfocus, terms, updated_at)
+                VALUES (:material_id, :aula_id, :hyperfocus, CAST(:terms AS JSONB), now())
+                ON CONFLICT (material_id) DO UPDATE
+                SET hyperfocus = EXCLUDED.hyperfocus, terms = EXCLUDED.terms, updated_at = EXCLUDED.updated_at
+                """
+            ),
+            {
+                "material_id": material_id,
+                "aula_id": aula_id,
+                "hyperfocus": hyperfocus,
+                "terms": json.dumps({str(k): v for k, v in terms.items()}),
+            },
+        )
+        with self._lock:
+            self._put(material_id, terms)
+        return True
+
+    def _backfill(self, db: Session) -> int:
+        """
+        Indexa, em lotes de `_BACKFILL_BATCH` (um commit por lote), os materiais aceitos
+        que ainda não estão em public.material_index. Percorre por id, então materiais
+        sem termos indexáveis não prendem o laço.
+        """
+        indexed = 0
+        after = None
+        while True:
+            rows = db.execute(
+                text(
+                    """
+                    SELECT m.id, m.aula_id, a.assunto, a.descricao
+                    FROM public.arrmd_material m
+                    JOIN public.arrmd a ON a.id = m.aula_id
+                    LEFT JOIN public.material_index i ON i.material_id = m.id
+                    WHERE m.accepted = true
+                      AND m.input_hash IS NULL
+                      AND i.material_id IS NULL
+                      AND (CAST(:after AS UUID) IS NULL OR m.id > CAST(:after AS UUID))
+                    ORDER BY m.id
+                    LIMIT :batch
+                    """
+                ),
+                {"after": after, "batch": _BACKFILL_BATCH},
+            ).mappings().all()
+            for r in rows:
+                indexed += self.add(db, str(r["id"]), str(r["aula_id"]), r["assunto"], r["descricao"])
+            db.commit()
+            if len(rows) < _BACKFILL_BATCH:
+                break
+            after = str(rows[-1]["id"])
+        if indexed:
+            metrics.incr("material_similarity.backfilled", indexed)
+        return indexed
+
+    def _refresh(self, db: Session) -> None:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < settings.similarity_refresh_seconds:
+            return
+        self._checked_at = now
+        # A cada checagem (não só na primeira): materiais aceitos por outros caminhos
+        # ou por outros processos também entram no índice.
+        self._backfill(db)
+        version = tuple(
+            db.execute(text("SELECT count(*), max(updated_at) FROM public.material_index")).one()
+        )
+        if version == self._version:
+            return
+        rows = db.execute(text("SELECT material_id, terms FROM public.material_index")).all()
+        docs: Dict[str, Dict[int, float]] = {}
+        for material_id, terms in rows:
+            if isinstance(terms, str):
+                terms = json.loads(terms)
+            docs[str(material_id)] = {int(k): float(v) for k, v in (terms or {}).items()}
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            for material_id, terms in docs.items():
+                self._put(material_id, terms)
+            self._version = version
+        metrics.set_gauge("material_similarity.documents", len(docs))
+
+    def _put(self, material_id: str, terms: Dict[int, float]) -> None:
+        previous = self._docs.get(material_id)
+        if previous:
+            for bucket in previous:
+                self._postings.get(bucket, set()).discard(material_id)
+        self._docs[material_id] = terms
+        for bucket in terms:
+            self._postings.setdefault(bucket, set()).add(material_id)
+
+    # --- consulta -----------------------------------------------------------
+
+    def _idf(self, bucket: int, total: int) -> float:
+        return math.log((total + 1) / (len(self._postings.get(bucket, ())) + 1)) + 1.0
+
+    def search(
+        self,
+        db: Session,
+        assunto: Optional[str],
+        descricao: Optional[str] = None,
+        hyperfocus: Optional[str] = None,
+        limit: int = 5,
+    ) -> List[Tuple[str, float]]:
+        """
+        Materiais mais parecidos (material_id, similaridade do cosseno TF-IDF), em
+        ordem decrescente.
+        """
+        self._refresh(db)
+        query = hashed_terms(assunto, descricao, hyperfocus)
+        metrics.incr("material_similarity.searches")
+        with self._lock:
+            total = len(self._docs)
+            if not query or not total:
+                return []
+            idf = {b: self._idf(b, total) for b in query}
+            qvec = {b: w * idf[b] for b, w in query.items()}
+            qnorm = math.sqrt(sum(v * v for v in qvec.values()))
+            candidates: Set[str] = set()
+            for bucket in query:
+                candidates |= self._postings.get(bucket, set())
+            scored: List[Tuple[str, float]] = []
+            for material_id in candidates:
+                doc = self._docs[material_id]
+                dot = sum(qvec[b] * doc[b] * idf[b] for b in qvec if b in doc)
+                dnorm = math.sqrt(sum((w * self._idf(b, total)) ** 2 for b, w in doc.items()))
+                if dot and dnorm:
+                    scored.append((material_id, dot / (qnorm * dnorm)))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def find_similar(
+        self,
+        db: Session,
+        assunto: Optional[str],
+        descricao: Optional[str] = None,
+        hyperfocus: Optional[str] = None,
+        limit: int = 5,
+        min_score: float = 0.0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca + dados dos materiais, ordenados por similaridade ponderada pela
+        avaliação do professor (material_util); materiais 'pouco_util' são descartados.
+        """
+        hits = [h for h in self.search(db, assunto, descricao, hyperfocus, limit * 4) if h[1] >= min_score]
+        if not hits:
+            return []
+        rows = db.execute(
+            text(
+                """
+                SELECT m.id, m.aula_id, a.assunto, i.hyperfocus, m.material_util, m.roteiro, m.resumo, m.created_at
+                FROM public.arrmd_material m
+                JOIN public.arrmd a ON a.id = m.aula_id
+                LEFT JOIN public.material_index i ON i.material_id = m.id
+                WHERE m.id = ANY(CAST(:ids AS UUID[]))
+                  AND m.accepted = true
+                """
+            ),
+            {"ids": [material_id for material_id, _ in hits]},
+        ).mappings().all()
+        by_id = {str(r["id"]): dict(r) for r in rows}
+        results: List[Dict[str, Any]] = []
+        for material_id, score in hits:
+            row = by_id.get(material_id)
+            if row is None:
+                continue
+            rating = MATERIAL_UTIL_SCORES.get(row.get("material_util"), MATERIAL_UTIL_SCORES[None])
+            if rating <= 0:
+                continue
+            results.append({**row, "score": round(score, 4), "rating": rating})
+        results.sort(key=lambda r: (r["score"] * (0.5 + 0.5 * r["rating"]), r["created_at"]), reverse=True)
+        return results[:limit]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.db import get_engine
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+_POLL_SQL = text(
+    """
+    SELECT (
+             SELECT response
+             FROM public.llm_singleflight_results
+             WHERE key = :key AND created_at >= :started_at
+           ) AS response,
+           EXISTS (
+             SELECT 1
+             FROM pg_locks
+             WHERE locktype = 'advisory'
+               AND classid::text::bigint = :hi
+               AND objid::text::bigint = :lo
+               AND objsubid = 1
+               AND granted
+           ) AS leader_running
+    """
+)
+
+_lock_engine_instance = None
+
+
+def _lock_engine():
+    global _lock_engine_instance
+    if _lock_engine_instance is None:
+        _lock_engine_instance = create_engine(
+            get_engine().url, poolclass=NullPool, isolation_level="AUTOCOMMIT", future=True
+        )
+    return _lock_engine_instance
+
+
+def _advisory_lock_id(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+class SingleFlight:
+    """
+    Coalesce chamadas concorrentes com a mesma chave: a primeira executa `fn`,
+    as demais aguardam e recebem o mesmo resultado.
+
+    Com `settings.singleflight_mode == "postgres"`, a coordenação também vale entre
+    workers: o líder segura um advisory lock e publica o resultado em
+    public.llm_singleflight_results, onde os seguidores de outros processos o leem.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Optional[Callable[[T], Any]] = None,
+        decode: Optional[Callable[[Any], T]] = None,
+    ) -> T:
+        metrics.incr(f"{self.name}.calls")
+        future = self._calls.get(key)
+        if future is not None:
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+            metrics.incr(f"{self.name}.deduplicated")
+            metrics.max_gauge(f"{self.name}.max_waiters", self._waiters[key])
+            return await asyncio.shield(future)
+
+        if settings.singleflight_mode == "postgres" and encode and decode and get_engine() is not None:
+            runner = self._postgres_flight(key, fn, encode, decode)
+        else:
+            runner = fn()
+        future = asyncio.ensure_future(runner)
+        self._calls[key] = future
+        self._waiters[key] = 0
+        metrics.incr(f"{self.name}.upstream_calls")
+        metrics.set_gauge(f"{self.name}.inflight", len(self._calls))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                self._waiters.pop(key, None)
+            metrics.set_gauge(f"{self.name}.inflight", len(self._calls))
+
+    async def _postgres_flight(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Callable[[T], Any],
+        decode: Callable[[Any], T],
+    ) -> T:
+        lock_id = _advisory_lock_id(key)
+        started_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        # O lock de sessão do líder fica numa conexão dedicada (fora do pool, autocommit):
+        # durante a chamada à LLM ela não ocupa o pool nem fica "idle in transaction".
+        lock_conn = await run_in_threadpool(_lock_engine().connect)
+        try:
+            acquired = await run_in_threadpool(
+                lambda: lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}).scalar()
+            )
+            if acquired:
+                try:
+                    result = await fn()
+                    await run_in_threadpool(self._publish, key, encode(result))
+                    return result
+                finally:
+                    await run_in_threadpool(
+                        lambda: lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                    )
+        finally:
+            await run_in_threadpool(lock_conn.close)
+
+        # Seguidores consultam com conexões curtas do pool, devolvidas entre as tentativas.
+        metrics.incr(f"{self.name}.cross_worker_waits")
+        deadline = time.monotonic() + settings.singleflight_wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.singleflight_poll_interval)
+            shared, leader_running = await run_in_threadpool(self._poll, key, lock_id, started_at)
+            if shared is _MISSING and not leader_running:
+                # O líder pode ter publicado entre a leitura e a checagem do lock.
+                shared, _ = await run_in_threadpool(self._poll, key, lock_id, started_at)
+            if shared is not _MISSING:
+                metrics.incr(f"{self.name}.deduplicated")
+                return decode(shared)
+            if not leader_running:
+                break
+        # Líder de outro worker falhou ou demorou demais: executa localmente.
+        return await fn()
+
+    @staticmethod
+    def _publish(key: str, value: Any) -> None:
+        with get_engine().begin() as conn:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO public.llm_singleflight_results (key, response, created_at)
+                    VALUES (:key, CAST(:response AS JSONB), now())
+                    ON CONFLICT (key) DO UPDATE
+                    SET response = EXCLUDED.response, created_at = EXCLUDED.created_at
+                    """
+                ),
+                {"key": key, "response": json.dumps(value, default=str)},
+            )
+            conn.execute(
+                text("DELETE FROM public.llm_singleflight_results WHERE created_at < now() - interval '10 minutes'")
+            )
+
+    @staticmethod
+    def _poll(key: str, lock_id: int, started_at: datetime) -> Tuple[Any, bool]:
+        """(resultado publicado ou _MISSING, se o lock do líder ainda está ativo)."""
+        # Advisory lock de 64 bits aparece em pg_locks como classid (32 bits altos) + objid (baixos).
+        unsigned = lock_id & 0xFFFFFFFFFFFFFFFF
+        with get_engine().connect() as conn:
+            row = conn.execute(
+                _POLL_SQL,
+                {"key": key, "started_at": started_at, "hi": unsigned >> 32, "lo": unsigned & 0xFFFFFFFF},
+            ).one()
+        value = row[0]
+        if value is None:
+            return _MISSING, bool(row[1])
+        return (json.loads(value) if isinstance(value, str) else value), bool(row[1])
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.workers.change_events import notify_change
+
+# Colunas aceitas no arquivo (CSV com cabeçalho ou NDJSON), na ordem da tabela de staging.
+IMPORT_COLUMNS = (
+    "id",
+    "nome",
+    "serie_escolar",
+    "turma_id",
+    "turma",
+    "interesse",
+    "preferencia",
+    "dificuldade",
+    "nivel_de_suporte",
+    "descricao_do_aluno",
+)
+
+# Colunas de public.alunos atualizadas pelo upsert (valores vazios não apagam o que já existe).
+_UPSERT_COLUMNS = (
+    "serie_escolar",
+    "interesse",
+    "preferencia",
+    "dificuldade",
+    "nivel_de_suporte",
+    "descricao_do_aluno",
+)
+
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _validate(raw: Dict[str, Any]) -> Tuple[Optional[Dict[str, Optional[str]]], Optional[str]]:
+    row = {c: _clean(raw.get(c)) for c in IMPORT_COLUMNS}
+    if "turma_nome" in raw and not row["turma"]:
+        row["turma"] = _clean(raw.get("turma_nome"))
+    if not row["nome"]:
+        return None, "Campo 'nome' é obrigatório."
+    for key in ("id", "turma_id"):
+        if row[key]:
+            try:
+                row[key] = str(UUID(row[key]))
+            except ValueError:
+                return None, f"Campo '{key}' não é um UUID válido."
+    if not row["id"] and not row["turma_id"] and not row["turma"]:
+        return None, "Informe 'turma_id' ou 'turma'."
+    return row, None
+
+
+def parse_rows(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Optional[str]]], Optional[str]]]:
+    """
+    Lê o arquivo em fluxo, sem carregá-lo inteiro: produz (linha, registro, erro).
+    """
+    reader = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            rows = csv.DictReader(reader)
+            for raw in rows:
+                if None in raw:
+                    yield rows.line_num, None, "Linha com mais colunas que o cabeçalho."
+                    continue
+                yield (rows.line_num, *_validate(raw))
+        else:
+            for line_num, line in enumerate(reader, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_num, None, "JSON inválido."
+                    continue
+                if not isinstance(raw, dict):
+                    yield line_num, None, "Cada linha deve ser um objeto JSON."
+                    continue
+                yield (line_num, *_validate(raw))
+    except UnicodeDecodeError:
+        yield -1, None, "Arquivo não está em UTF-8."
+    finally:
+        reader.detach()
+
+
+def import_students(db: Session, stream: IO[bytes], fmt: str) -> Dict[str, Any]:
+    """
+    Importa alunos em lote: COPY para uma tabela temporária, resolução dos nomes de
+    turma e deduplicação em SQL, e um único INSERT ... ON CONFLICT em public.alunos.
+    Retorna o relatório por linha (inserted / updated / error).
+    """
+    report: Dict[int, Dict[str, Any]] = {}
+    db.execute(
+        text(
+            """
+            CREATE TEMP TABLE alunos_import (
+                linha      INTEGER PRIMARY KEY,
+                {columns},
+                target_id  UUID,
+                erro       TEXT
+            ) ON COMMIT DROP
+            """.format(columns=", ".join(f"{c} TEXT" for c in IMPORT_COLUMNS))
+        )
+    )
+    raw_conn = db.connection().connection.driver_connection
+    with raw_conn.cursor() as cur:
+        with cur.copy(f"COPY alunos_import (linha, {', '.join(IMPORT_COLUMNS)}) FROM STDIN") as copy:
+            for linha, row, erro in parse_rows(stream, fmt):
+                if row is None:
+                    report[linha] = {"linha": linha, "status": "error", "erro": erro}
+                    continue
+                copy.write_row((linha, *(row[c] for c in IMPORT_COLUMNS)))
+
+    # Turma pelo nome (sem diferenciar maiúsculas nem espaços nas pontas), em uma passada.
+    db.execute(
+        text(
+            """
+            WITH nomes AS (
+                SELECT lower(btrim(nome)) AS chave, min(id::text)::uuid AS id, count(*) AS n
+                FROM public.turmas
+                GROUP BY lower(btrim(nome))
+            )
+            UPDATE alunos_import i
+            SET turma_id = CASE WHEN n.n = 1 THEN n.id::text END,
+                erro = CASE WHEN n.n > 1 THEN 'Nome de turma ambíguo: ' || i.turma END
+            FROM nomes n
+            WHERE i.turma_id IS NULL
+              AND i.turma IS NOT NULL
+              AND n.chave = lower(btrim(i.turma))
+            """
+        )
+    )
+    db.execute(
+        text(
+            """
+            UPDATE alunos_import i
+            SET erro = COALESCE(i.erro, 'Turma não encontrada.')
+            WHERE (i.turma_id IS NULL AND (i.id IS NULL OR i.turma IS NOT NULL))
+               OR (i.turma_id IS NOT NULL
+                   AND NOT EXISTS (SELECT 1 FROM public.turmas t WHERE t.id = i.turma_id::uuid))
+            """
+        )
+    )
+    # Alvo de cada linha: id informado, aluno com mesmo nome na turma ou um id novo.
+    db.execute(
+        text(
+            """
+            UPDATE alunos_import i
+            SET target_id = COALESCE(
+                    i.id::uuid,
+                    (SELECT a.id FROM public.alunos a
+                     WHERE a.turma_id = i.turma_id::uuid AND lower(a.nome) = lower(i.nome)
+                     ORDER BY a.id LIMIT 1)
+                ),
+                erro = CASE
+                    WHEN i.id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM public.alunos a WHERE a.id = i.id::uuid)
+                    THEN 'Aluno não encontrado para o id informado.'
+                END
+            WHERE i.erro IS NULL
+            """
+        )
+    )
+    # Linhas repetidas para o mesmo aluno: vale a última.
+    db.execute(
+        text(
+            """
+            UPDATE alunos_import i
+            SET erro = 'Aluno repetido no arquivo (linha ' || d.ultima || ' prevalece).'
+            FROM (
+                SELECT linha,
+                       max(linha) OVER (
+                           PARTITION BY COALESCE(target_id::text, turma_id || ':' || lower(nome))
+                       ) AS ultima
+                FROM alunos_import
+                WHERE erro IS NULL
+            ) d
+            WHERE i.linha = d.linha AND d.linha <> d.ultima
+            """
+        )
+    )
+    db.execute(text("UPDATE alunos_import SET target_id = gen_random_uuid() WHERE erro IS NULL AND target_id IS NULL"))
+
+    updates = ", ".join(f"{c} = COALESCE(EXCLUDED.{c}, a.{c})" for c in _UPSERT_COLUMNS)
+    upserted = db.execute(
+        text(
+            """
+            INSERT INTO public.alunos AS a (id, nome, turma_id, {columns})
+            SELECT i.target_id, i.nome, COALESCE(i.turma_id::uuid, cur.turma_id), {source_columns}
+            FROM alunos_import i
+            LEFT JOIN public.alunos cur ON cur.id = i.target_id
+            WHERE i.erro IS NULL
+            ON CONFLICT (id) DO UPDATE
+            SET nome = EXCLUDED.nome, turma_id = EXCLUDED.turma_id, {updates}
+            RETURNING a.id, (xmax = 0) AS inserted, a.turma_id
+            """.format(
+                columns=", ".join(_UPSERT_COLUMNS),
+                source_columns=", ".join(f"i.{c}" for c in _UPSERT_COLUMNS),
+                updates=updates,
+            )
+        )
+    ).all()
+    inserted_ids = {str(r[0]): bool(r[1]) for r in upserted}
+    for turma_id in {r[2] for r in upserted}:
+        notify_change(db, "aluno", "import", turma_id=turma_id)
+
+    for r in db.execute(text("SELECT linha, target_id, erro FROM alunos_import")).mappings():
+        if r["erro"]:
+            report[r["linha"]] = {"linha": r["linha"], "status": "error", "erro": r["erro"]}
+        else:
+            aluno_id = str(r["target_id"])
+            report[r["linha"]] = {
+                "linha": r["linha"],
+                "status": "inserted" if inserted_ids.get(aluno_id) else "updated",
+                "aluno_id": aluno_id,
+            }
+    db.commit()
+
+    rows: List[Dict[str, Any]] = [report[k] for k in sorted(report)]
+    return {
+        "total": len(rows),
+        "inserted": sum(1 for r in rows if r["status"] == "inserted"),
+        "updated": sum(1 for r in rows if r["status"] == "updated"),
+        "errors": sum(1 for r in rows if r["status"] == "error"),
+        "rows": rows,
+    }
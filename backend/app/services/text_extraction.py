@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import codecs
+import json
+import logging
+import mmap
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from xml.etree import ElementTree
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.lesson import GenerateMaterialRequest
+from app.services.file_storage import FileTooLargeError, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando o algoritmo de extração/resumo mudar, invalidando o cache.
+EXTRACTION_VERSION = 2
+
+_READ_BLOCK = 64 * 1024
+_MAX_PDF_STREAM = 8 * 1024 * 1024
+_CHUNK_SUMMARY_CHARS = 320
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Proporção máxima de caracteres inválidos (U+FFFD) no primeiro bloco de um arquivo de texto.
+_MAX_REPLACEMENT_RATIO = 0.1
+
+
+# --- Extratores (executados no pool de processos) ---
+def _iter_plain_text(path: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    with open(path, "rb") as fh:
+        while block := fh.read(_READ_BLOCK):
+            yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def _iter_docx_text(path: str) -> Iterator[str]:
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as fh:
+        for _, elem in ElementTree.iterparse(fh, events=("end",)):
+            if elem.tag == f"{_WORD_NS}p":
+                paragraph = "".join(node.text or "" for node in elem.iter(f"{_WORD_NS}t"))
+                if paragraph:
+                    yield paragraph + "\n"
+                elem.clear()
+
+
+def _read_pdf_literal(data: bytes, i: int) -> tuple[str, int]:
+    """Lê uma string literal PDF iniciada em data[i] == '('."""
+    out = bytearray()
+    depth = 1
+    i += 1
+    n = len(data)
+    escapes = {ord("n"): 10, ord("r"): 13, ord("t"): 9, ord("b"): 8, ord("f"): 12}
+    while i < n and depth:
+        c = data[i]
+        if c == 0x5C and i + 1 < n:  # barra invertida
+            nxt = data[i + 1]
+            if nxt in escapes:
+                out.append(escapes[nxt])
+                i += 2
+            elif 0x30 <= nxt <= 0x37:
+                j = i + 1
+                while j < min(i + 4, n) and 0x30 <= data[j] <= 0x37:
+                    j += 1
+                out.append(int(data[i + 1:j], 8) & 0xFF)
+                i = j
+            elif nxt in (0x0A, 0x0D):
+                i += 2
+            else:
+                out.append(nxt)
+                i += 2
+            continue
+        if c == 0x28:
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                i += 1
+                break
+        out.append(c)
+        i += 1
+    return out.decode("latin-1"), i
+
+
+def _pdf_content_text(content: bytes) -> str:
+    """Extrai o texto dos operadores Tj/TJ/'/\" de um content stream."""
+    parts: List[str] = []
+    pending: List[str] = []
+    i = 0
+    n = len(content)
+    while i < n:
+        c = content[i]
+        if c == 0x28:  # (
+            literal, i = _read_pdf_literal(content, i)
+            pending.append(literal)
+            continue
+        if c == 0x25:  # comentário
+            while i < n and content[i] not in (0x0A, 0x0D):
+                i += 1
+            continue
+        if c in (0x27, 0x22):  # ' e "
+            parts.append("\n" + "".join(pending))
+            pending = []
+            i += 1
+            continue
+        if c == 0x2D or 0x30 <= c <= 0x39 or c == 0x2E:  # número (espaçamento em arrays TJ)
+            j = i + 1
+            while j < n and (0x30 <= content[j] <= 0x39 or content[j] == 0x2E):
+                j += 1
+            if pending:
+                try:
+                    if float(content[i:j]) <= -200:
+                        pending.append(" ")
+                except ValueError:
+                    pass
+            i = j
+            continue
+        if 0x41 <= c <= 0x5A or 0x61 <= c <= 0x7A or c == 0x2A:
+            j = i + 1
+            while j < n and (0x41 <= content[j] <= 0x5A or 0x61 <= content[j] <= 0x7A or content[j] == 0x2A):
+                j += 1
+            op = content[i:j]
+            if op in (b"Tj", b"TJ"):
+                parts.append("".join(pending))
+            elif op in (b"T*", b"Td", b"TD", b"ET"):
+                parts.append("\n")
+            elif op == b"Tm":
+                parts.append(" ")
+            pending = []
+            i = j
+            continue
+        if c == 0x3C and content[i + 1:i + 2] != b"<":  # string hexadecimal (fontes CID): ignorada
+            end = content.find(b">", i)
+            i = n if end < 0 else end + 1
+            continue
+        i += 1
+    return "".join(parts)
+
+
+def _iter_pdf_streams(mm: mmap.mmap) -> Iterator[bytes]:
+    position = 0
+    while True:
+        start = mm.find(b"stream", position)
+        if start < 0:
+            return
+        position = start + 6
+        if mm[max(0, start - 3):start] == b"end":
+            continue
+        obj_start = mm.rfind(b" obj", max(0, start - 4096), start)
+        header = mm[obj_start if obj_start >= 0 else max(0, start - 512):start]
+        data_start = position
+        if mm[data_start:data_start + 2] == b"\r\n":
+            data_start += 2
+        elif mm[data_start:data_start + 1] in (b"\n", b"\r"):
+            data_start += 1
+        end = mm.find(b"endstream", data_start)
+        if end < 0:
+            return
+        position = end + 9
+        # Apenas content streams: ignora imagens, fontes, metadados e streams de objetos.
+        if any(marker in header for marker in (b"/Subtype", b"/Length1", b"/ObjStm", b"/XRef", b"/Metadata")):
+            continue
+        raw = mm[data_start:end]
+        if b"/FlateDecode" in header:
+            decompressor = zlib.decompressobj()
+            try:
+                data = decompressor.decompress(raw, _MAX_PDF_STREAM)
+            except zlib.error:
+                continue
+        elif b"/Filter" in header:
+            continue
+        else:
+            data = raw[:_MAX_PDF_STREAM]
+        yield data
+
+
+def _iter_pdf_text(path: str) -> Iterator[str]:
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for stream in _iter_pdf_streams(mm):
+                extracted = _pdf_content_text(stream)
+                if extracted.strip():
+                    yield extracted + "\n"
+
+
+def _looks_binary(block: bytes) -> bool:
+    """Imagens, .doc e outros binários: bytes NUL ou muitos trechos que não são UTF-8."""
+    if b"\x00" in block:
+        return True
+    decoded = codecs.getincrementaldecoder("utf-8-sig")(errors="replace").decode(block)
+    return bool(decoded) and decoded.count("\ufffd") / len(decoded) > _MAX_REPLACEMENT_RATIO
+
+
+def _detect_kind(path: str) -> str:
+    with open(path, "rb") as fh:
+        head = fh.read(_READ_BLOCK)
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                if "word/document.xml" in zf.namelist():
+                    return "docx"
+        except zipfile.BadZipFile:
+            pass
+        return "unsupported"
+    if _looks_binary(head):
+        return "unsupported"
+    return "text"
+
+
+def _summarize_chunk(chunk: str) -> str:
+    cleaned = " ".join(chunk.split())
+    if len(cleaned) <= _CHUNK_SUMMARY_CHARS:
+        return cleaned
+    summary = ""
+    for sentence in _SENTENCE_END.split(cleaned):
+        if summary and len(summary) + len(sentence) + 1 > _CHUNK_SUMMARY_CHARS:
+            break
+        summary = f"{summary} {sentence}".strip()
+    return summary[:_CHUNK_SUMMARY_CHARS]
+
+
+def build_digest(pieces: Iterable[str], chunk_chars: int, max_chars: int) -> Dict[str, Any]:
+    """
+    Divide o texto em blocos de ~`chunk_chars` e guarda um resumo extrativo de cada bloco.
+    Quando os resumos ultrapassam `max_chars`, metade é descartada e o passo dobra,
+    mantendo a cobertura uniforme do documento com memória limitada.
+    """
+    summaries: List[str] = []
+    summaries_chars = 0
+    stride = 1
+    index = 0
+    total_chars = 0
+    buffer = ""
+
+    def _accept(chunk: str) -> None:
+        nonlocal index, stride, summaries, summaries_chars
+        if not chunk.strip():
+            return
+        if index % stride == 0:
+            summary = _summarize_chunk(chunk)
+            summaries.append(summary)
+            summaries_chars += len(summary) + 3
+            if summaries_chars > max_chars:
+                summaries = summaries[::2]
+                summaries_chars = sum(len(s) + 3 for s in summaries)
+                stride *= 2
+        index += 1
+
+    for piece in pieces:
+        total_chars += len(piece)
+        buffer += piece
+        # Avança um deslocamento e recorta o resto uma vez por pedaço (evita cópias quadráticas).
+        pos = 0
+        while len(buffer) - pos >= chunk_chars:
+            cut = buffer.rfind(" ", pos + chunk_chars // 2, pos + chunk_chars)
+            cut = pos + chunk_chars if cut < 0 else cut
+            _accept(buffer[pos:cut])
+            pos = cut
+        buffer = buffer[pos:]
+    _accept(buffer)
+
+    digest = "\n".join(f"- {s}" for s in summaries)
+    return {"chars": total_chars, "chunks": index, "digest": digest[:max_chars]}
+
+
+def extract_file(path: str, chunk_chars: int, max_chars: int) -> Dict[str, Any]:
+    """Extrai e resume o arquivo em `path` (função de topo para o pool de processos)."""
+    kind = _detect_kind(path)
+    if kind == "pdf":
+        pieces: Iterable[str] = _iter_pdf_text(path)
+    elif kind == "docx":
+        pieces = _iter_docx_text(path)
+    elif kind == "text":
+        pieces = _iter_plain_text(path)
+    else:
+        return {"kind": kind, "chars": 0, "chunks": 0, "digest": ""}
+    return {"kind": kind, **build_digest(pieces, chunk_chars, max_chars)}
+
+
+# --- Orquestração assíncrona e cache por hash ---
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.extraction_workers)
+    return _pool
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(settings.storage_dir, "extracted", f"{digest}.json")
+
+
+def _load_cached(digest: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_cache_path(digest), "r", encoding="utf-8") as fh:
+            cached = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if cached.get("version") != EXTRACTION_VERSION or cached.get("max_chars") != settings.extraction_digest_max_chars:
+        return None
+    return cached
+
+
+def _store_cached(digest: str, result: Dict[str, Any]) -> None:
+    path = _cache_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def _extract(digest: str) -> Dict[str, Any]:
+    cached = await run_in_threadpool(_load_cached, digest)
+    if cached is not None:
+        return cached
+    path = str(get_storage().path_for(digest))
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        _get_pool(),
+        partial(
+            extract_file,
+            path,
+            settings.extraction_chunk_chars,
+            settings.extraction_digest_max_chars,
+        ),
+    )
+    result.update(
+        {"version": EXTRACTION_VERSION, "sha256": digest, "max_chars": settings.extraction_digest_max_chars}
+    )
+    await run_in_threadpool(_store_cached, digest, result)
+    return result
+
+
+async def get_file_digest(digest: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna o resumo do arquivo armazenado com este hash, extraindo-o uma única vez
+    mesmo sob chamadas concorrentes.
+    """
+    if not get_storage().exists(digest):
+        return None
+    future = _inflight.get(digest)
+    if future is None:
+        future = asyncio.ensure_future(_extract(digest))
+        _inflight[digest] = future
+        future.add_done_callback(lambda _: _inflight.pop(digest, None))
+    return await asyncio.shield(future)
+
+
+def _aula_arquivo_sha256(db: Optional[Session], aula_id: Optional[str]) -> Optional[str]:
+    if db is None or not aula_id:
+        return None
+    return db.execute(
+        text("SELECT upload_arquivo::jsonb #>> '{arquivo,sha256}' FROM public.arrmd WHERE id = :id"),
+        {"id": aula_id},
+    ).scalar()
+
+
+async def resolve_arquivo_digest(db: Optional[Session], req: GenerateMaterialRequest) -> Optional[str]:
+    """
+    Localiza o arquivo de apoio da geração (hash informado, base64 no corpo ou arquivo
+    já anexado à aula) e devolve o resumo em texto para o prompt, ou None.
+    """
+    sha256 = req.arquivo_sha256
+    if not sha256 and req.arquivo_b64:
+        encoded = req.arquivo_b64
+        if encoded.startswith("data:") and "," in encoded:
+            encoded = encoded.split(",", 1)[1]
+        try:
+            content = base64.b64decode(encoded, validate=True)
+            sha256, _ = await run_in_threadpool(get_storage().save_bytes, content)
+        except (binascii.Error, ValueError, FileTooLargeError):
+            return None
+    if not sha256:
+        sha256 = _aula_arquivo_sha256(db, req.aula_id)
+    if not sha256:
+        return None
+    try:
+        result = await get_file_digest(sha256)
+    except Exception:
+        logger.exception("Falha ao extrair o resumo do arquivo %s", sha256)
+        metrics.incr("extraction.errors")
+        return None
+    if not result or not result.get("digest"):
+        return None
+    return result["digest"]
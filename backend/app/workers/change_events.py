@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "andori_changes"
+
+# O turma_id do evento vem do parâmetro ou, se ausente, do aluno/aula afetados.
+_NOTIFY_SQL = text(
+    """
+    SELECT pg_notify(:channel, json_build_object(
+      'tipo', CAST(:tipo AS TEXT),
+      'acao', CAST(:acao AS TEXT),
+      'id', CAST(:id AS TEXT),
+      'aluno_id', CAST(:aluno_id AS TEXT),
+      'aula_id', CAST(:aula_id AS TEXT),
+      'turma_id', COALESCE(
+        CAST(:turma_id AS TEXT),
+        (SELECT turma_id::text FROM public.alunos WHERE id = CAST(:aluno_id AS UUID)),
+        (SELECT turma_id::text FROM public.arrmd WHERE id = CAST(:aula_id AS UUID))
+      )
+    )::text)
+    """
+)
+
+
+def notify_change(
+    db: Session,
+    tipo: str,
+    acao: str,
+    id: Any = None,
+    turma_id: Any = None,
+    aluno_id: Any = None,
+    aula_id: Any = None,
+) -> None:
+    """
+    Emite NOTIFY na transação atual da sessão: o evento só é entregue no commit
+    (e descartado no rollback). Chamar antes do commit da escrita.
+    """
+    if not settings.events_enabled:
+        return
+    db.execute(
+        _NOTIFY_SQL,
+        {
+            "channel": CHANNEL,
+            "tipo": tipo,
+            "acao": acao,
+            "id": str(id) if id is not None else None,
+            "turma_id": str(turma_id) if turma_id is not None else None,
+            "aluno_id": str(aluno_id) if aluno_id is not None else None,
+            "aula_id": str(aula_id) if aula_id is not None else None,
+        },
+    )
+
+
+_Subscription = Tuple["asyncio.Queue[Dict[str, Any]]", Optional[Set[str]]]
+
+
+class ChangeHub:
+    """
+    Um LISTEN por worker, repassado aos clientes de GET /events inscritos nas
+    turmas do evento (ou em todas, sem filtro). Clientes lentos cujo buffer enche
+    recebem um evento 'reset' e devem recarregar os dados.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: Dict[int, _Subscription] = {}
+        self._next_id = 0
+        self.listening = False
+
+    @contextmanager
+    def subscribe(self, turma_ids: Optional[Set[str]] = None) -> Iterator["asyncio.Queue[Dict[str, Any]]"]:
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=settings.events_queue_size)
+        self._next_id += 1
+        sub_id = self._next_id
+        self._subscribers[sub_id] = (queue, turma_ids or None)
+        metrics.set_gauge("events.subscribers", len(self._subscribers))
+        try:
+            yield queue
+        finally:
+            self._subscribers.pop(sub_id, None)
+            metrics.set_gauge("events.subscribers", len(self._subscribers))
+
+    @staticmethod
+    def _offer(queue: "asyncio.Queue[Dict[str, Any]]", event: Dict[str, Any]) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"tipo": "reset", "acao": "overflow"})
+            metrics.incr("events.overflows")
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        turma_id = event.get("turma_id")
+        for queue, turmas in list(self._subscribers.values()):
+            if turmas is None or turma_id in turmas:
+                self._offer(queue, event)
+        metrics.incr("events.received")
+
+    def _reset_all(self) -> None:
+        for queue, _ in list(self._subscribers.values()):
+            self._offer(queue, {"tipo": "reset", "acao": "reconnect"})
+
+    async def run(self) -> None:
+        conninfo = make_url(settings.sqlalchemy_url).set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        backoff = 1.0
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    if backoff > 1.0:
+                        # Eventos podem ter se perdido enquanto a conexão estava fora.
+                        self._reset_all()
+                    self.listening, backoff = True, 1.0
+                    async for notification in conn.notifies():
+                        try:
+                            self.publish(json.loads(notification.payload))
+                        except ValueError:
+                            logger.warning("Evento inválido em %s: %r", CHANNEL, notification.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Listener de eventos desconectado; nova tentativa em %.0fs", backoff)
+            finally:
+                self.listening = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+change_hub = ChangeHub()
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.db import session_scope
+from app.llm.prompts import build_user_message, chat_system_prompt
+from app.schemas.lesson import GenerateMaterialRequest
+from app.services.lesson_generation import (
+    coalesced_openai_generate,
+    find_prefetched_draft,
+    generation_fingerprint,
+    resolve_generation_context,
+    save_prefetched_draft,
+)
+from app.services.text_extraction import resolve_arquivo_digest
+from app.workers.usage_ledger import usage_context, usage_ledger
+
+logger = logging.getLogger(__name__)
+
+# Serializa a checagem de orçamento + reserva entre workers (pg_advisory_xact_lock).
+_CLAIM_LOCK_ID = 0x7072656665746368  # "prefetch"
+
+_DRAFT_EXISTS_SQL = text(
+    """
+    SELECT 1
+    FROM public.arrmd_material
+    WHERE aula_id = CAST(:aula_id AS UUID) AND accepted = false AND input_hash = :input_hash
+    LIMIT 1
+    """
+)
+
+_SPENT_TODAY_SQL = text(
+    """
+    SELECT COALESCE(SUM(tokens), 0)
+    FROM public.prefetch_claims
+    WHERE claimed_at >= date_trunc('day', now())
+    """
+)
+
+# Só reserva se nenhum outro worker estiver com a aula em andamento (ou se a reserva expirou).
+_CLAIM_SQL = text(
+    """
+    INSERT INTO public.prefetch_claims (aula_id, status, tokens, claimed_at)
+    VALUES (CAST(:aula_id AS UUID), 'running', :tokens, now())
+    ON CONFLICT (aula_id) DO UPDATE
+    SET status = 'running',
+        tokens = CASE WHEN prefetch_claims.claimed_at >= date_trunc('day', now())
+                      THEN prefetch_claims.tokens + EXCLUDED.tokens
+                      ELSE EXCLUDED.tokens END,
+        claimed_at = now()
+    WHERE prefetch_claims.status <> 'running'
+       OR prefetch_claims.claimed_at < now() - make_interval(secs => :ttl)
+    RETURNING aula_id
+    """
+)
+
+
+def _estimate_tokens(*texts: str) -> int:
+    # Aproximação usual (~4 caracteres por token) para controle de orçamento.
+    return sum(len(t) for t in texts) // 4
+
+
+class PrefetchScheduler:
+    """
+    Pré-gera material (rascunhos com accepted = false) para aulas recém-criadas e
+    próximas (por arrmd.data), apenas na janela fora de pico e dentro de um
+    orçamento diário de tokens. /material/generate devolve o rascunho na hora
+    quando as entradas ainda coincidem.
+    """
+
+    def __init__(self) -> None:
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def enqueue(self, aula_id: str) -> None:
+        """Agenda uma aula; seguro para chamar de rotas síncronas (threadpool)."""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._put, str(aula_id))
+
+    def _put(self, aula_id: str) -> None:
+        if aula_id not in self._queued:
+            self._queued.add(aula_id)
+            self._queue.put_nowait(aula_id)
+
+    @staticmethod
+    def in_offpeak_window(now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now()).hour
+        start, end = settings.prefetch_offpeak_start_hour, settings.prefetch_offpeak_end_hour
+        if start == end:
+            return True
+        if start < end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    @staticmethod
+    def _claim(aula_id: str, input_hash: str, tokens: int) -> str:
+        """
+        Reserva a aula para este worker e `tokens` no orçamento diário, numa transação
+        serializada entre workers. Retorna 'claimed', 'draft' (rascunho já existe),
+        'busy' (outro worker em andamento) ou 'budget' (orçamento esgotado).
+        """
+        with session_scope() as db:
+            db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _CLAIM_LOCK_ID})
+            if db.execute(_DRAFT_EXISTS_SQL, {"aula_id": aula_id, "input_hash": input_hash}).first():
+                return "draft"
+            spent = db.execute(_SPENT_TODAY_SQL).scalar()
+            if spent + tokens > settings.prefetch_daily_token_budget:
+                return "budget"
+            claimed = db.execute(
+                _CLAIM_SQL,
+                {"aula_id": aula_id, "tokens": tokens, "ttl": settings.prefetch_claim_ttl_seconds},
+            ).first()
+            db.commit()
+        return "claimed" if claimed else "busy"
+
+    @staticmethod
+    def _finish_claim(aula_id: str, status: str) -> None:
+        with session_scope() as db:
+            db.execute(
+                text("UPDATE public.prefetch_claims SET status = :status WHERE aula_id = CAST(:aula_id AS UUID)"),
+                {"aula_id": aula_id, "status": status},
+            )
+            db.commit()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        scanner = asyncio.create_task(self._scan_loop())
+        try:
+            while True:
+                aula_id = await self._queue.get()
+                while not self.in_offpeak_window():
+                    await asyncio.sleep(60)
+                try:
+                    await self._prefetch(aula_id)
+                except Exception:
+                    logger.exception("Falha ao pré-gerar material da aula %s", aula_id)
+                finally:
+                    self._queued.discard(aula_id)
+        finally:
+            scanner.cancel()
+
+    async def _scan_loop(self) -> None:
+        while True:
+            try:
+                for aula_id in await run_in_threadpool(self._upcoming_without_material):
+                    self._put(aula_id)
+            except Exception:
+                logger.exception("Falha ao buscar aulas próximas para pré-geração")
+            await asyncio.sleep(settings.prefetch_scan_interval_seconds)
+
+    @staticmethod
+    def _upcoming_without_material() -> List[str]:
+        with session_scope() as db:
+            rows = db.execute(
+                text(
+                    """
+                    SELECT a.id
+                    FROM public.arrmd a
+                    WHERE a.data BETWEEN current_date AND current_date + :days
+                      AND NOT EXISTS (
+                          SELECT 1 FROM public.arrmd_material m WHERE m.aula_id = a.id
+                      )
+                    ORDER BY a.data
+                    LIMIT 100
+                    """
+                ),
+                {"days": settings.prefetch_lookahead_days},
+            ).all()
+        return [str(r[0]) for r in rows]
+
+    @staticmethod
+    def _load_aula(aula_id: str) -> Optional[Dict[str, Any]]:
+        with session_scope() as db:
+            row = db.execute(
+                text(
+                    """
+                    SELECT id,
+                           assunto,
+                           descricao,
+                           data,
+                           upload_arquivo::jsonb ->> 'turma_id' AS turma_id,
+                           upload_arquivo::jsonb ->> 'turma_nome' AS turma_nome,
+                           upload_arquivo::jsonb #>> '{arquivo,sha256}' AS arquivo_sha256
+                    FROM public.arrmd
+                    WHERE id = :id
+                    """
+                ),
+                {"id": aula_id},
+            ).mappings().first()
+        return dict(row) if row else None
+
+    async def _prefetch(self, aula_id: str) -> None:
+        aula = await run_in_threadpool(self._load_aula, aula_id)
+        if not aula or not aula.get("assunto"):
+            return
+        req = GenerateMaterialRequest(
+            assunto=aula["assunto"],
+            descricao=aula.get("descricao") or "",
+            turma=aula.get("turma_nome") or "",
+            turma_id=aula.get("turma_id"),
+            data=aula["data"].isoformat() if aula.get("data") else "",
+            aula_id=str(aula["id"]),
+            arquivo_sha256=aula.get("arquivo_sha256"),
+        )
+        # O resumo do arquivo pode esperar a extração: resolvido sem sessão aberta.
+        arquivo_digest = await resolve_arquivo_digest(None, req)
+        # Sessão só para as leituras: não fica presa (idle in transaction) durante a chamada à LLM.
+        with session_scope() as db:
+            turma_ctx, student = await run_in_threadpool(resolve_generation_context, db, req)
+            input_hash = generation_fingerprint(req, student, turma_ctx, arquivo_digest, stable=True)
+            if await run_in_threadpool(find_prefetched_draft, db, req.aula_id, input_hash) is not None:
+                return
+            if await run_in_threadpool(usage_ledger.budget_exceeded, db, req.turma_id):
+                logger.info("Orçamento diário de tokens da turma esgotado; aula %s ignorada", aula_id)
+                return
+        prompt_tokens = _estimate_tokens(
+            chat_system_prompt(), build_user_message(req, student, turma_ctx, arquivo_digest)
+        )
+        outcome = await run_in_threadpool(
+            self._claim, req.aula_id, input_hash, prompt_tokens + settings.prefetch_completion_token_estimate
+        )
+        if outcome == "budget":
+            logger.info("Orçamento diário de pré-geração esgotado; aula %s ignorada", aula_id)
+        if outcome != "claimed":
+            return
+        status = "failed"
+        try:
+            with usage_context(req.turma_id, (student or {}).get("id")):
+                result = await coalesced_openai_generate(req, student, turma_ctx, arquivo_digest)
+            if result is None:
+                return
+            with session_scope() as db:
+                await run_in_threadpool(save_prefetched_draft, db, req.aula_id, result, input_hash)
+            status = "done"
+        finally:
+            await run_in_threadpool(self._finish_claim, req.aula_id, status)
+
+
+prefetch_scheduler = PrefetchScheduler()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.db import get_engine, session_scope
+
+logger = logging.getLogger(__name__)
+
+# Turma/aluno da requisição atual, anexados aos registros de uso sem passar ids por toda a pilha.
+_usage_context: contextvars.ContextVar[Tuple[Optional[str], Optional[str]]] = contextvars.ContextVar(
+    "usage_context", default=(None, None)
+)
+
+
+@contextmanager
+def usage_context(turma_id: Any = None, aluno_id: Any = None) -> Iterator[None]:
+    token = _usage_context.set((str(turma_id) if turma_id else None, str(aluno_id) if aluno_id else None))
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+_INSERT_SQL = text(
+    """
+    INSERT INTO public.llm_usage
+      (created_at, endpoint, model, turma_id, aluno_id, prompt_tokens, completion_tokens,
+       cached_tokens, latency_ms, cache_hit, ok)
+    VALUES
+      (to_timestamp(:created_at), :endpoint, :model, CAST(:turma_id AS UUID), CAST(:aluno_id AS UUID),
+       :prompt_tokens, :completion_tokens, :cached_tokens, :latency_ms, :cache_hit, :ok)
+    """
+)
+
+
+class UsageLedger:
+    """
+    Registro de uso da LLM (tokens do bloco `usage`, latência, modelo, endpoint,
+    turma/aluno, acertos de cache). `record` só acumula em memória; `run` grava em
+    lote em public.llm_usage a cada `usage_flush_interval_seconds`, fora do caminho
+    das requisições. Também controla o orçamento diário de tokens por turma.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        # turma -> tokens registrados e ainda não gravados
+        self._pending_tokens: Dict[str, int] = {}
+        # turma -> (dia, consultado_em, tokens gravados hoje, limite diário)
+        self._budgets: Dict[str, Tuple[date, float, int, Optional[int]]] = {}
+
+    def record(
+        self,
+        endpoint: str,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        latency: Optional[float] = None,
+        cache_hit: bool = False,
+        ok: bool = True,
+    ) -> None:
+        """Acumula um registro (não bloqueia); `usage` é o bloco homônimo da resposta da OpenAI."""
+        if not settings.usage_ledger_enabled or get_engine() is None:
+            return
+        usage = usage or {}
+        turma_id, aluno_id = _usage_context.get()
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        entry = {
+            "created_at": time.time(),
+            "endpoint": endpoint,
+            "model": model,
+            "turma_id": turma_id,
+            "aluno_id": aluno_id,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0),
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "cache_hit": cache_hit,
+            "ok": ok,
+        }
+        with self._lock:
+            if len(self._buffer) >= settings.usage_max_buffer:
+                metrics.incr("usage_ledger.dropped")
+                return
+            self._buffer.append(entry)
+            if turma_id and (prompt_tokens or completion_tokens):
+                self._pending_tokens[turma_id] = (
+                    self._pending_tokens.get(turma_id, 0) + prompt_tokens + completion_tokens
+                )
+        metrics.incr("usage_ledger.recorded")
+        metrics.incr(f"llm.tokens.{endpoint}", prompt_tokens + completion_tokens)
+
+    def _flush(self) -> int:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            with session_scope() as db:
+                db.execute(_INSERT_SQL, batch)
+                db.commit()
+        except Exception:
+            logger.exception("usage ledger: falha ao gravar %s registros", len(batch))
+            with self._lock:
+                # Devolve o lote para a próxima tentativa, respeitando o limite do buffer.
+                self._buffer = (batch + self._buffer)[-settings.usage_max_buffer :]
+            return 0
+        flushed: Dict[str, int] = {}
+        for entry in batch:
+            if entry["turma_id"]:
+                flushed[entry["turma_id"]] = (
+                    flushed.get(entry["turma_id"], 0) + entry["prompt_tokens"] + entry["completion_tokens"]
+                )
+        with self._lock:
+            for turma_id, tokens in flushed.items():
+                remaining = self._pending_tokens.get(turma_id, 0) - tokens
+                if remaining > 0:
+                    self._pending_tokens[turma_id] = remaining
+                else:
+                    self._pending_tokens.pop(turma_id, None)
+                cached = self._budgets.get(turma_id)
+                if cached is not None and cached[0] == date.today():
+                    self._budgets[turma_id] = (cached[0], cached[1], cached[2] + tokens, cached[3])
+        metrics.incr("usage_ledger.flushed", len(batch))
+        return len(batch)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(settings.usage_flush_interval_seconds)
+                await run_in_threadpool(self._flush)
+        finally:
+            await run_in_threadpool(self._flush)
+
+    def _load_budget(self, db, turma_id: str) -> Tuple[date, float, int, Optional[int]]:
+        row = db.execute(
+            text(
+                """
+                SELECT
+                  (SELECT daily_tokens FROM public.llm_turma_budgets WHERE turma_id = CAST(:turma_id AS UUID)) AS limite,
+                  (SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+                   FROM public.llm_usage
+                   WHERE turma_id = CAST(:turma_id AS UUID) AND created_at >= date_trunc('day', now())) AS usados
+                """
+            ),
+            {"turma_id": turma_id},
+        ).mappings().first()
+        limit = row["limite"] if row["limite"] is not None else settings.usage_turma_daily_token_budget
+        return date.today(), time.monotonic(), int(row["usados"]), limit
+
+    def budget_status(self, db, turma_id: Any) -> Tuple[Optional[int], int]:
+        """(limite diário de tokens da turma ou None, tokens usados hoje), com cache curto."""
+        turma_id = str(turma_id)
+        cached = self._budgets.get(turma_id)
+        if (
+            cached is None
+            or cached[0] != date.today()
+            or time.monotonic() - cached[1] > settings.usage_budget_refresh_seconds
+        ):
+            # Aproximado: outros workers e gravações concorrentes aparecem na próxima consulta.
+            cached = self._budgets[turma_id] = self._load_budget(db, turma_id)
+        with self._lock:
+            pending = self._pending_tokens.get(turma_id, 0)
+        return cached[3], cached[2] + pending
+
+    def budget_exceeded(self, db, turma_id: Any) -> bool:
+        """True quando a turma já gastou o orçamento diário (checado antes de chamar a LLM)."""
+        if db is None or not turma_id or get_engine() is None:
+            return False
+        limit, used = self.budget_status(db, turma_id)
+        if limit is not None and used >= limit:
+            metrics.incr("usage_ledger.budget_rejections")
+            return True
+        return False
+
+    def forget_budget(self, turma_id: Any) -> None:
+        self._budgets.pop(str(turma_id), None)
+
+
+usage_ledger = UsageLedger()
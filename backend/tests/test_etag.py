@@ -0,0 +1,22 @@
+from app.core.etag import etag_matches, weak_etag
+
+
+def test_weak_etag_is_stable_and_versioned():
+    assert weak_etag("turmas", 3, 100) == weak_etag("turmas", 3, 100)
+    assert weak_etag("turmas", 3, 100) != weak_etag("turmas", 3, 101)
+    assert weak_etag("turmas", None) == weak_etag("turmas", "")
+    assert weak_etag("a", 1).startswith('W/"')
+
+
+def test_etag_matches_uses_weak_comparison():
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+
+
+def test_etag_matches_lists_and_wildcard():
+    assert etag_matches('"x", W/"abc" , "y"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches("", '"abc"')
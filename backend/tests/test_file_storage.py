@@ -0,0 +1,32 @@
+import pytest
+
+from app.services.file_storage import parse_range
+
+
+def test_parse_range_absent():
+    assert parse_range(None, 100) is None
+    assert parse_range("", 100) is None
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=10-", (10, 99)),
+        ("bytes=90-500", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-500", (0, 99)),
+        ("BYTES = 5-5", (5, 5)),
+    ],
+)
+def test_parse_range_valid(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["items=0-9", "bytes=0-1,5-6", "bytes=-0", "bytes=a-5", "bytes=5-b", "bytes=100-", "bytes=9-3"],
+)
+def test_parse_range_invalid(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
@@ -0,0 +1,20 @@
+from app.api.v1.routes.recomendation import _dedupe_pairs
+
+
+def test_duplicate_pairs_keep_first_position_and_last_observation():
+    pairs = [
+        ("a1", "r1", "primeira"),
+        ("a2", "r1", None),
+        ("a1", "r1", "segunda"),
+        ("a1", "r2", "outra aula"),
+    ]
+    assert _dedupe_pairs(pairs) == [
+        ("a1", "r1", "segunda"),
+        ("a2", "r1", None),
+        ("a1", "r2", "outra aula"),
+    ]
+
+
+def test_no_duplicates_is_unchanged():
+    pairs = [("a1", "r1", None), ("a2", "r1", "obs")]
+    assert _dedupe_pairs(pairs) == pairs
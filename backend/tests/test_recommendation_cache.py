@@ -0,0 +1,18 @@
+from app.core.config import settings
+from app.services.recommendation_cache import cache_key, normalize_observacoes
+
+
+def test_normalization_ignores_case_spacing_and_unicode_form():
+    assert normalize_observacoes("  Não gosta\tde  BARULHO ") == "não gosta de barulho"
+    assert cache_key("Na\u0303o gosta") == cache_key("não  GOSTA")
+    assert cache_key("não gosta") != cache_key("gosta")
+
+
+def test_key_follows_routed_models(monkeypatch):
+    monkeypatch.setattr(settings, "llm_routing_enabled", False)
+    default = cache_key("obs")
+    monkeypatch.setattr(settings, "llm_routing_enabled", True)
+    routed = cache_key("obs")
+    assert routed != default
+    monkeypatch.setattr(settings, "llm_fast_model", "outro-modelo")
+    assert cache_key("obs") != routed
@@ -0,0 +1,68 @@
+import pytest
+
+from app.core.config import settings
+from app.llm.routing import LLMRouter, model_key
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    monkeypatch.setattr(settings, "llm_routing_enabled", True)
+    monkeypatch.setattr(settings, "llm_fast_model", "fast-model")
+    monkeypatch.setattr(settings, "llm_capable_model", "capable-model")
+    monkeypatch.setattr(settings, "llm_small_prompt_tokens", 100)
+    monkeypatch.setattr(settings, "llm_latency_slo_seconds", 10.0)
+    monkeypatch.setattr(settings, "llm_max_timeout_seconds", 30.0)
+    monkeypatch.setattr(settings, "llm_max_error_rate", 0.2)
+    return LLMRouter()
+
+
+def test_disabled_routing_uses_default_model(monkeypatch):
+    monkeypatch.setattr(settings, "llm_routing_enabled", False)
+    decision = LLMRouter().decide("lesson", "sys", "x" * 10_000)
+    assert decision.model == settings.openai_model
+    assert (decision.tier, decision.reason, decision.max_tokens) == ("default", "disabled", None)
+    assert decision.source == "openai"
+    assert model_key() == settings.openai_model
+
+
+def test_routes_by_prompt_size_and_endpoint(routing):
+    small = routing.decide("lesson", "sys", "curto")
+    large = routing.decide("lesson", "sys", "x" * 1000)
+    variants = routing.decide("lesson", "sys", "curto", outputs=3)
+    text = routing.decide("recommendation", "sys", "x" * 1000)
+    assert (small.model, small.reason) == ("fast-model", "small-prompt")
+    assert (large.model, large.reason) == ("capable-model", "large-prompt")
+    assert variants.model == "capable-model"
+    assert variants.max_tokens == settings.llm_lesson_max_tokens + 2 * settings.llm_variant_max_tokens
+    assert (text.model, text.reason) == ("fast-model", "text-endpoint")
+    assert text.max_tokens == settings.llm_recommendation_max_tokens
+    assert large.source == "openai:capable-model"
+    assert model_key() == "fast-model|capable-model"
+
+
+def test_falls_back_when_model_breaks_slo(routing):
+    decision = routing.decide("lesson", "sys", "x" * 1000)
+    for _ in range(10):
+        routing.record(decision, 25.0, ok=True)
+    slow = routing.decide("lesson", "sys", "x" * 1000)
+    assert (slow.model, slow.reason) == ("fast-model", "large-prompt+slo-fallback")
+
+
+def test_falls_back_on_error_rate_and_stays_when_both_unhealthy(routing):
+    fast = routing.decide("lesson", "sys", "curto")
+    for _ in range(5):
+        routing.record(fast, 1.0, ok=False)
+    assert routing.decide("lesson", "sys", "curto").model == "capable-model"
+    capable = routing.decide("lesson", "sys", "x" * 1000)
+    for _ in range(5):
+        routing.record(capable, 1.0, ok=False)
+    assert routing.decide("lesson", "sys", "curto").model == "fast-model"
+
+
+def test_timeout_tracks_p90_within_cap(routing):
+    decision = routing.decide("lesson", "sys", "curto")
+    assert decision.timeout == 10.0
+    for latency in [8.0] * 9 + [9.0]:
+        routing.record(decision, latency, ok=True)
+    assert routing.health("fast-model") == (9.0, 0.0)
+    assert routing.decide("lesson", "sys", "curto").timeout == pytest.approx(13.5)
@@ -0,0 +1,34 @@
+import base64
+import json
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.routes.search import _decode_cursor, _encode_cursor
+
+
+def _raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    item_id = uuid.uuid4()
+    assert _decode_cursor(_encode_cursor(0.25, "material", item_id)) == (0.25, "material", str(item_id))
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "não-é-base64",
+        _raw_cursor({"rank": 1}),
+        _raw_cursor([1, "aula"]),
+        _raw_cursor(["x", "aula", str(uuid.uuid4())]),
+        _raw_cursor([1, "aula", "'; DROP TABLE arrmd; --"]),
+        _raw_cursor([1, "aula", 42]),
+    ],
+)
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor)
+    assert exc.value.status_code == 400
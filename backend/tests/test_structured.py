@@ -0,0 +1,90 @@
+import json
+
+from app.llm.structured import deep_merge, lesson_schema, missing_fields, parse_json_lenient, subschema
+
+COMPLETE = {
+    "roteiro": {"topicos": ["a"], "falas": ["b"], "exemplos": ["c"]},
+    "resumo": {"texto": "t", "exemplo": "e"},
+}
+
+
+def _assert_strict(schema):
+    if schema.get("type") == "object" and "properties" in schema:
+        assert schema["additionalProperties"] is False
+        assert schema["required"] == list(schema["properties"])
+        assert "title" not in schema
+        for prop in schema["properties"].values():
+            _assert_strict(prop)
+
+
+def test_lesson_schema_is_strict_with_variants():
+    schema = lesson_schema(["a1", "a2"])
+    _assert_strict(schema)
+    assert list(schema["properties"]) == ["roteiro", "resumo", "variantes"]
+    assert list(schema["properties"]["variantes"]["properties"]) == ["a1", "a2"]
+    assert "variantes" not in lesson_schema()["properties"]
+
+
+def test_missing_fields_and_subschema():
+    schema = lesson_schema(["a1"])
+    value = {
+        "roteiro": {"topicos": ["a"], "falas": [], "exemplos": ["c"]},
+        "resumo": {"texto": "t"},
+        "variantes": {"a1": {"exemplos": ["x"], "resumo_exemplo": ""}},
+    }
+    missing = missing_fields(value, schema)
+    assert missing == ["roteiro.falas", "resumo.exemplo", "variantes.a1.resumo_exemplo"]
+    assert missing_fields(COMPLETE, lesson_schema()) == []
+
+    partial = subschema(schema, missing)
+    _assert_strict(partial)
+    assert list(partial["properties"]) == ["roteiro", "resumo", "variantes"]
+    assert list(partial["properties"]["roteiro"]["properties"]) == ["falas"]
+    assert list(partial["properties"]["variantes"]["properties"]["a1"]["properties"]) == ["resumo_exemplo"]
+
+
+def test_empty_optional_lists_are_not_missing():
+    value = {
+        "roteiro": {"topicos": [], "falas": ["b"], "exemplos": []},
+        "resumo": {"texto": "t", "exemplo": "e"},
+    }
+    assert missing_fields(value, lesson_schema()) == []
+    value["roteiro"].pop("topicos")
+    value["roteiro"]["exemplos"] = None
+    assert missing_fields(value, lesson_schema()) == ["roteiro.topicos", "roteiro.exemplos"]
+
+
+def test_deep_merge_fills_only_empty_values():
+    base = {"roteiro": {"topicos": ["a"], "falas": []}, "resumo": {"texto": ""}}
+    extra = {"roteiro": {"topicos": ["z"], "falas": ["b"]}, "resumo": {"texto": "t", "exemplo": "e"}}
+    assert deep_merge(base, extra) == {
+        "roteiro": {"topicos": ["a"], "falas": ["b"]},
+        "resumo": {"texto": "t", "exemplo": "e"},
+    }
+    assert base["roteiro"]["falas"] == []
+
+
+def test_parse_json_lenient_clean_and_wrapped():
+    raw = json.dumps(COMPLETE, ensure_ascii=False)
+    assert parse_json_lenient(raw) == (COMPLETE, False)
+    assert parse_json_lenient(f"```json\n{raw}\n```") == (COMPLETE, True)
+    assert parse_json_lenient(raw + " obrigado!") == (COMPLETE, True)
+    assert parse_json_lenient('{"a": "chave } dentro", "b": "\\"x\\""}') == ({"a": "chave } dentro", "b": '"x"'}, False)
+
+
+def test_parse_json_lenient_repairs_truncation():
+    parsed, repaired = parse_json_lenient('{"roteiro": {"topicos": ["a", "b"], "falas": ["c"')
+    assert repaired and parsed == {"roteiro": {"topicos": ["a", "b"], "falas": ["c"]}}
+
+    # String interrompida é descartada: o campo fica faltante para o follow-up.
+    parsed, repaired = parse_json_lenient('{"resumo": {"texto": "completo", "exemplo": "corta')
+    assert repaired and parsed == {"resumo": {"texto": "completo"}}
+    assert missing_fields(parsed, lesson_schema()) == ["roteiro", "resumo.exemplo"]
+
+
+def test_parse_json_lenient_rejects_garbage():
+    assert parse_json_lenient(None) == (None, False)
+    assert parse_json_lenient("sem json aqui") == (None, False)
+    assert parse_json_lenient("[1, 2]") == (None, False)
+    # Malformado logo no início: sobra um objeto vazio, e tudo vira faltante.
+    assert parse_json_lenient('{"a": ]') == ({}, True)
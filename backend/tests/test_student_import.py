@@ -0,0 +1,54 @@
+import io
+import json
+import uuid
+
+from app.services.student_import import parse_rows
+
+
+def _parse(content: str, fmt: str):
+    return list(parse_rows(io.BytesIO(content.encode("utf-8")), fmt))
+
+
+def test_csv_rows_are_cleaned_and_validated():
+    turma_id = str(uuid.uuid4())
+    content = (
+        "﻿nome,turma_id,turma,serie_escolar\n"
+        f"  Ana  ,{turma_id},,4\n"
+        ",,6A,4\n"
+        "Bia,não-uuid,,4\n"
+        "Caio,,,4\n"
+        "Duda,,6A,4,extra\n"
+    )
+    rows = _parse(content, "csv")
+    line, record, error = rows[0]
+    assert (line, error) == (2, None)
+    assert record["nome"] == "Ana" and record["turma_id"] == turma_id and record["turma"] is None
+    assert [r[2] for r in rows[1:]] == [
+        "Campo 'nome' é obrigatório.",
+        "Campo 'turma_id' não é um UUID válido.",
+        "Informe 'turma_id' ou 'turma'.",
+        "Linha com mais colunas que o cabeçalho.",
+    ]
+
+
+def test_ndjson_rows():
+    aluno_id = str(uuid.uuid4())
+    content = "\n".join(
+        [
+            json.dumps({"nome": "Ana", "turma_nome": "6A"}),
+            "",
+            "{quebrado",
+            json.dumps(["lista"]),
+            json.dumps({"id": aluno_id.upper(), "nome": "Bia"}),
+        ]
+    )
+    rows = _parse(content, "ndjson")
+    assert rows[0][0] == 1 and rows[0][1]["turma"] == "6A"
+    assert rows[1][0] == 3 and rows[1][2] == "JSON inválido."
+    assert rows[2][2] == "Cada linha deve ser um objeto JSON."
+    assert rows[3][1]["id"] == aluno_id
+
+
+def test_non_utf8_file():
+    rows = list(parse_rows(io.BytesIO("nome,turma\nJoão,6A\n".encode("latin-1")), "csv"))
+    assert rows[-1] == (-1, None, "Arquivo não está em UTF-8.")
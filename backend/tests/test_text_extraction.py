@@ -0,0 +1,54 @@
+import io
+import os
+import zipfile
+
+from app.services.text_extraction import _detect_kind, build_digest, extract_file
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_detect_kind_by_content(tmp_path):
+    assert _detect_kind(_write(tmp_path, "a.pdf", b"%PDF-1.4\n...")) == "pdf"
+    assert _detect_kind(_write(tmp_path, "a.txt", "Frações e ação.\n".encode() * 50)) == "text"
+    assert _detect_kind(_write(tmp_path, "vazio.txt", b"")) == "text"
+
+
+def test_detect_kind_docx_and_other_zips(tmp_path):
+    docx = io.BytesIO()
+    with zipfile.ZipFile(docx, "w") as zf:
+        zf.writestr("word/document.xml", "<w:document/>")
+    assert _detect_kind(_write(tmp_path, "a.docx", docx.getvalue())) == "docx"
+    other = io.BytesIO()
+    with zipfile.ZipFile(other, "w") as zf:
+        zf.writestr("x.txt", "x")
+    assert _detect_kind(_write(tmp_path, "a.zip", other.getvalue())) == "unsupported"
+
+
+def test_detect_kind_rejects_binaries(tmp_path):
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(4096)
+    doc = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + os.urandom(4096)
+    assert _detect_kind(_write(tmp_path, "a.png", png)) == "unsupported"
+    assert _detect_kind(_write(tmp_path, "a.doc", doc)) == "unsupported"
+    result = extract_file(_write(tmp_path, "b.png", png), 500, 2000)
+    assert result == {"kind": "unsupported", "chars": 0, "chunks": 0, "digest": ""}
+
+
+def test_build_digest_stays_within_budget():
+    text = " ".join(f"Frase número {i}." for i in range(5000))
+    result = build_digest([text[i : i + 700] for i in range(0, len(text), 700)], chunk_chars=400, max_chars=1500)
+    assert result["chars"] == len(text)
+    assert result["chunks"] > 0
+    assert len(result["digest"]) <= 1500
+    assert "Frase número 0." in result["digest"]
+
+
+def test_build_digest_chunks_independent_of_piece_size():
+    text = " ".join(f"Frase número {i}." for i in range(2000))
+    whole = build_digest([text], chunk_chars=400, max_chars=100_000)
+    pieces = build_digest([text[i : i + 37] for i in range(0, len(text), 37)], chunk_chars=400, max_chars=100_000)
+    assert whole == pieces
+    assert whole["chunks"] >= len(text) // 400